@@ -12,19 +12,70 @@
 
 
 # import libraries
-print("Importing Libraries")
+import argparse
+import asyncio
+import atexit
+import bisect
+import contextlib
+import email.utils
+import gzip
+import functools
+import hashlib
+import importlib
+import io
+import json
+import logging
 import math
+import mmap
 import os
+import queue
+import random
 import re
+import shutil
+import signal
+import sqlite3
 import string
-import urllib
+import threading
+import time
+import uuid
+import zlib
+import urllib.parse
 import collections
+import concurrent.futures
+import concurrent.futures.process
+import datetime
 
-import pandas as pd
-import requests
-import xlsxwriter
-from bs4 import BeautifulSoup
-import numpy as np
+
+class LazyModule:
+    # Stands in for a module and imports it the first time one of its attributes is used, submodules such as
+    # lxml.etree are imported the same way
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+
+        try:
+            return getattr(self._module, attribute)
+        except AttributeError:
+            return importlib.import_module(self._name + "." + attribute)
+
+
+# The heavy libraries take a few seconds to import together, they are only imported once a stage needs them so
+# commands such as status start straight away
+aiohttp = LazyModule("aiohttp")
+bs4 = LazyModule("bs4")
+lxml = LazyModule("lxml")
+np = LazyModule("numpy")
+pa = LazyModule("pyarrow")
+pd = LazyModule("pandas")
+pq = LazyModule("pyarrow.parquet")
+scipy = LazyModule("scipy")
+
+# Modules the filing workers use, imported before the pool starts so forked workers don't each import them again
+worker_modules = ("bs4", "lxml.etree", "scipy.sparse")
 
 ##########
 
@@ -34,50 +85,128 @@ import numpy as np
 doc_check = []
 
 # Directory into which data will be saved and manipulated
-data_directory = os.getcwd() + "\\" + "Data Directory"
+data_directory = os.path.join(os.getcwd(), "Data Directory")
 
+# SEC asks automated tools to declare who they are in the User-Agent header, requests without one get throttled
+user_agent = os.environ.get(
+    "SEC_USER_AGENT", "Scraping-Code research admin@example.com"
+)
 
-# Functions initiaised for use in the main function
-print("Initialising functions")
+# The SEC fair access policy allows at most 10 requests per second, the run is kept a little below that
+requests_per_second = 8
+max_in_flight = 8
 
+# Shared fetcher, created the first time a request is made
+fetcher = None
 
-def main():
-    print("Main Program Initialised")
+# Failed requests are retried with exponential backoff and jitter, throttled requests wait at least as long as the
+# Retry-After header asks. Only throttling, server errors, timeouts and dropped connections are retried
+retry_attempts = 5
+retry_base_delay = 0.5
+retry_max_delay = 60
+retry_statuses = {429, 500, 502, 503, 504}
 
-    # This is the base of the URL that will be used to look through the quarters
-    base_url = r"https://www.sec.gov/Archives/edgar/daily-index"
-    # Year being searched for filings
-    year = "2020"
+# Requests in flight adapt between 1 and max_in_flight: one more after every window of quick successful responses,
+# halved when the SEC throttles or a response takes longer than latency_target seconds
+latency_target = 5.0
 
-    # See if data is already gathered, else gather data
-    try:
-        com_files = pd.read_csv(
-            f"com_files_{year}.csv",
-            converters={
-                "10Ks": lambda x: eval(x),
-                "KDates": lambda x: eval(x),
-                "10Qs": lambda x: eval(x),
-                "QDates": lambda x: eval(x),
-                "SIC": lambda x: eval(x),
-            },
-        )
+# A filing is given up on (and tried again on the next run) once more of its requests than this have failed
+filing_failure_budget = 2
 
-    except:
-        # The SEC daily index files are requested through the SEC master data navigator
-        year_links = get_year_links(year, base_url)
+# Requests for www.sec.gov can be sent to another server with the same paths instead, such as a local stand-in
+# for load tests, e.g. SEC_ORIGIN=http://127.0.0.1:8080
+sec_origin = os.environ.get("SEC_ORIGIN") or None
+
+# Every response from the SEC is kept compressed on disk, laid out like the EDGAR Archives paths
+# Least recently used files are removed once the cache grows past the size limit
+cache_directory = os.path.join(os.getcwd(), "EDGAR Cache")
+cache_size_limit = 20 * 1024 ** 3
+
+# In offline mode nothing is requested from the SEC and only cached responses are served
+offline_mode = os.environ.get("SEC_OFFLINE", "") == "1"
+
+# Filings are listed from the quarterly full index ("full-index") or from the daily index of a single year ("daily-index")
+index_source = "full-index"
+
+# SIC code of every company looked up so far, shared by every year and every run
+sic_database = os.path.join(os.getcwd(), "sic_codes.sqlite")
+
+# Matched statements are saved as a parquet dataset partitioned by year, form and statement ("parquet"),
+# or as one CSV file per statement in the data directory ("csv")
+output_format = "parquet"
+output_directory = os.path.join(os.getcwd(), "Statement Data")
+
+# Filings waiting for the statement writer, a full queue holds up the write stage rather than growing without bound
+writer_queue_size = 256
+
+# Outcome of every filing scraped so far, a restarted run skips everything already in it
+journal_path = os.path.join(os.getcwd(), "scrape_journal.jsonl")
+# Set for a shard run to the main journal, filings already merged from any shard are skipped as well
+merged_journal_path = None
+
+# Set by SIGINT/SIGTERM, the filing in progress is finished and the run stops
+stop_requested = threading.Event()
+
+
+# How a report is picked for a header from the scores of its row labels:
+# "first" takes the first report over the threshold as best_fit_url always has, "best" takes the highest scoring report
+assignment_mode = "first"
+
+# Where statements come from: "xbrl" rebuilds them from the filing's XBRL instance and linkbases, falling back to
+# R pages for filings and reports those don't cover, "r-pages" always requests the R pages
+statement_source = "xbrl"
+
+# Parser used for every R page
+@functools.lru_cache(maxsize=None)
+def report_parser():
+    return lxml.etree.HTMLParser(encoding="utf-8")
+
+
+# Every event of a run is logged as one JSON object per line, the metrics file is rewritten every metrics_interval
+# seconds while filings are being scraped
+log_path = os.path.join(os.getcwd(), "secscrape.log")
+log_level = "INFO"
+metrics_path = os.path.join(os.getcwd(), "secscrape_metrics.txt")
+metrics_interval = 15
+
+logger = logging.getLogger("secscrape")
+# Progress lines are also shown on the console
+progress_logger = logging.getLogger("secscrape.progress")
 
-        # Find 'master' files for each year. SEC provides three types of .idx files, sorted by 'Company', 'form types' and 'CIK number'.
-        # The 'master file for each year sorts by CIK number and is the only file which has any sort of delimiter, allowing us to parse it.
-        # A single variable of master_dictionary is created, which is a dictionary of every filing for each company for a year
-        master_dictionary = get_master_files(year_links, year)
 
-        # Retrieves the 10-K and 10-Q URLs along with the associated company names and CIK codes
-        # The data is stored as a dataframe with the 10K and 10Qs, along with their respective filing dates, stored as lists
-        com_files = retrieve_filings(master_dictionary, year)
+def main(
+    first_year=2020,
+    last_year=2020,
+    forms=("10-K",),
+    shard=None,
+    weighted=False,
+    workers=None,
+    fetch_workers=8,
+    refresh=False,
+):
+    # Scrapes every filing of the form types filed from first_year to last_year
+    # Keeping the filing index up to date is left to the index command, a scrape only indexes the years that have no
+    # index yet, or brings the whole range up to date when refresh is set
+
+    # A shard run keeps everything it writes in its own directory, set before anything is opened
+    if shard is not None:
+        shard_directory = use_shard_paths(shard)
+    configure_logging()
+
+    if refresh or index_missing(first_year, last_year):
+        refresh_index(first_year, last_year)
+    filings = load_filings(first_year, last_year, forms)
+
+    # Only the companies of this shard are scraped
+    if shard is not None:
+        filings = shard_filings(filings, shard, weighted)
+        progress_logger.info(
+            f"Shard {shard[0]} of {shard[1]}: {len(pd.unique(filings.cik))} companies"
+        )
 
     base_url = r"https://www.sec.gov"
 
-    input_filing_path = os.getcwd() + "\\" + "Filing Names"
+    input_filing_path = os.path.join(os.getcwd(), "Filing Names")
 
     # Retrieves the filing names and headers found in the files titled 'Default Filing Terms', 'Filing Document Names', 'Scraped Filing Document Names'
     # stores them in a variable titled 'Lists'
@@ -89,30 +218,100 @@ def main():
     headers = Lists[2]
     default_terms = Lists[3]
 
-    scraped_list = parse_filings(
-        "10Ks",
-        terms_list,
-        com_files,
-        "KDates",
-        base_url,
+    for form in forms:
+        scraped_list = parse_filings(
+            form,
+            terms_list,
+            filings,
+            base_url,
+            scraped_list,
+            default_terms,
+            headers,
+            workers,
+            fetch_workers,
+        )
+
+    # A shard's scraped names are added to the main list by merge_shards
+    names_directory = shard_directory if shard is not None else input_filing_path
+    write_scraped_names(
+        os.path.join(names_directory, "Scraped Filing Document Names.xlsx"),
         scraped_list,
-        default_terms,
         headers,
     )
-    # scraped_list = parse_filings(
-    #     "10Qs",
-    #     terms_list,
-    #     com_files,
-    #     "QDates",
-    #     base_url,
-    #     scraped_list,
-    #     default_terms,
-    #     headers,
-    # )
 
-    df = pd.DataFrame(scraped_list).transpose()
-    df.columns = headers
-    df.to_excel(input_filing_path + r"\Scraped Filing Document Names.xlsx")
+
+def index_directories(first_year, last_year):
+    # Directories of the filing index covering the years, the full index is a single directory
+    if index_source == "full-index":
+        return [full_index_directory]
+    return [filing_index_path(str(year)) for year in range(first_year, last_year + 1)]
+
+
+def index_missing(first_year, last_year):
+    # True if a year, or a quarter of the full index, from first_year to last_year has never been indexed
+    if index_source == "full-index":
+        manifest = load_manifest(full_index_directory)
+        return any(
+            f"{year}Q{quarter}" not in manifest
+            for year, quarter in index_quarters(first_year, last_year)
+        )
+    return not all(
+        filing_index_complete(directory)
+        for directory in index_directories(first_year, last_year)
+    )
+
+
+def refresh_index(first_year, last_year, resolve_sic=True):
+    if index_source == "full-index":
+        # Every run brings the index up to date for new quarters
+        ingest_full_index(first_year, last_year, resolve_sic=resolve_sic)
+        return
+
+    # This is the base of the URL that will be used to look through the quarters
+    base_url = r"https://www.sec.gov/Archives/edgar/daily-index"
+
+    for year in range(first_year, last_year + 1):
+        year = str(year)
+
+        # See if data is already gathered, else gather data
+        if filing_index_complete(filing_index_path(year)):
+            continue
+
+        # The SEC daily index files are requested through the SEC master data navigator
+        year_links = get_year_links(year, base_url)
+
+        # Find 'master' files for each year. SEC provides three types of .idx files, sorted by 'Company', 'form types' and 'CIK number'.
+        # The 'master file for each year sorts by CIK number and is the only file which has any sort of delimiter, allowing us to parse it.
+        # master_dictionary streams a record for every 10-K and 10-Q filed during the year
+        master_dictionary = get_master_files(year_links, year)
+
+        # Retrieves the 10-K and 10-Q URLs along with the associated company names and CIK codes, and writes them to
+        # the filing index
+        retrieve_filings(master_dictionary, year, resolve_sic)
+
+
+def load_filings(first_year, last_year, forms=None):
+    # The filings of the form types from first_year to last_year, as a FilingIndex
+    directories = [
+        directory
+        for directory in index_directories(first_year, last_year)
+        if os.path.exists(directory)
+    ]
+    return load_filing_index(*directories).select(forms, first_year, last_year)
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    # Hands out a temporary path to write to, which replaces 'path' once the block is done
+    # Written under a temporary name first, so a crash never leaves a partial file behind
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield temp_path
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
 
 
 # Function creating SEC URL from base URL defined
@@ -127,698 +326,3459 @@ def make_url(base_url, comp):
 
 ######
 
-# The SEC daily index files are requested through the SEC master data navigator
+# Metrics and logging
+# Counters and latency histograms for every stage are kept in one Metrics object. Events are logged as JSON lines with
+# their fields, only warnings and the progress lines reach the console. A reporter thread rewrites the metrics file
+# and logs the throughput and ETA of the run while filings are being scraped
 
 ######
-def get_year_links(year, base_url):
-    # This line sets up a link to https://www.sec.gov/Archives/edgar/daily-index/###YEAR VARIABLE###/
-    # This is the ###YEAR VARIABLE### page of all the quarterly filing indexes
-    year_url = make_url(base_url, [year, "index.json"])
 
-    # Requesting the content for ###YEAR VARIABLE###
-    content = requests.get(year_url)
-    decoded_content = content.json()
+# Upper bounds of the histogram buckets, in seconds, and in pages for the R pages parsed per filing
+time_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+count_buckets = (1, 2, 4, 8, 16, 32, 64, 128)
 
-    year_links = []
-    # Iterating through a list of quarters
-    for item in decoded_content["directory"]["item"]:
 
-        # The daily-index filings are searched
-        qtr_url = make_url(base_url, [year, item["name"], "index.json"])
+class JsonFormatter(logging.Formatter):
+    # Fields handed to log_event are written next to the message
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def log_event(level, message, **fields):
+    # The check comes first so events below the log level cost nothing in the hot loops
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": fields})
+
+
+def configure_logging():
+    logger.setLevel(min(logging.getLevelName(log_level), logging.INFO))
+
+    file_handler = logging.FileHandler(log_path, encoding="utf-8")
+    file_handler.setLevel(log_level)
+    file_handler.setFormatter(JsonFormatter())
+    logger.addHandler(file_handler)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)
+    console_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    logger.addHandler(console_handler)
+
+    progress_handler = logging.StreamHandler()
+    progress_handler.setFormatter(logging.Formatter("%(message)s"))
+    progress_logger.addHandler(progress_handler)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket the quantile falls in, the last bucket has no bound
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+class Metrics:
+    def __init__(self, window=300):
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.monotonic()
+
+        # Filings planned and finished, with recent (time, finished) samples for the rolling throughput
+        self.total = 0
+        self.finished = 0
+        self.window = window
+        self.samples = collections.deque()
+
+    def count(self, name, value=1, label=""):
+        with self.lock:
+            self.counters[name, label] += value
+
+    def gauge(self, name, value, label=""):
+        with self.lock:
+            self.gauges[name, label] = value
+
+    def observe(self, name, value, label="", buckets=time_buckets):
+        with self.lock:
+            histogram = self.histograms.get((name, label))
+            if histogram is None:
+                histogram = self.histograms[name, label] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, label=""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, label)
+
+    def plan(self, total):
+        with self.lock:
+            self.total += total
+            self.samples.append((time.monotonic(), self.finished))
+
+    def advance(self, finished=1):
+        with self.lock:
+            self.finished += finished
+            now = time.monotonic()
+            self.samples.append((now, self.finished))
+            while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+                self.samples.popleft()
+
+    def throughput(self):
+        # Filings per second over the last few minutes
+        with self.lock:
+            if len(self.samples) < 2:
+                return 0.0
+            (start, start_count), (end, end_count) = self.samples[0], self.samples[-1]
+            return (end_count - start_count) / (end - start) if end > start else 0.0
+
+    def eta(self):
+        rate = self.throughput()
+        remaining = self.total - self.finished
+        return remaining / rate if rate > 0 else math.inf
+
+    def progress(self):
+        eta = self.eta()
+        eta_text = (
+            "unknown" if math.isinf(eta) else str(datetime.timedelta(seconds=int(eta)))
+        )
+        return (
+            f"Filings {self.finished}/{self.total}, "
+            f"{self.throughput() * 60:.1f} per minute, ETA {eta_text}"
+        )
 
-        # New URL requested as json structure
-        file_content = requests.get(qtr_url)
-        decoded_content = file_content.json()
+    def render(self):
+        # Plain text, one metric per line, name{label="..."} value
+        lines = [
+            f"# secscrape metrics at {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"uptime_seconds {time.monotonic() - self.started:.1f}",
+            f"filings_planned {self.total}",
+            f"filings_finished {self.finished}",
+            f"filings_per_minute {self.throughput() * 60:.2f}",
+            f"eta_seconds {self.eta():.0f}",
+        ]
 
-        # For each file retrieved, the type and URL is stored
-        for file in decoded_content["directory"]["item"]:
+        with self.lock:
+            for (name, label), value in sorted(self.counters.items()):
+                lines.append(f"{metric_name(name, label)} {value}")
 
-            file_url = make_url(base_url, [year, item["name"], file["name"]])
-            year_links.append(file_url)
-    return year_links
+            for (name, label), value in sorted(self.gauges.items()):
+                lines.append(f"{metric_name(name, label)} {value}")
 
+            for (name, label), histogram in sorted(self.histograms.items()):
+                lines.append(f"{metric_name(name + '_count', label)} {histogram.count}")
+                lines.append(f"{metric_name(name + '_sum', label)} {histogram.sum:.4f}")
+                for q in (0.5, 0.9, 0.99):
+                    quantile_name = metric_name(name + f"_p{int(q * 100)}", label)
+                    lines.append(f"{quantile_name} {histogram.quantile(q)}")
 
-######
+        return "\n".join(lines) + "\n"
 
-# Find 'master' files for each year
-# A single variable of master_dictionary is created, which is a dictionary of every filing for each company for a year
+    def write(self, path):
+        with atomic_write(path) as temp_path, open(temp_path, "w") as f:
+            f.write(self.render())
 
-######
 
+def metric_name(name, label):
+    return f'{name}{{label="{label}"}}' if label else name
 
-def get_master_files(year_links, year):
 
-    # Creates a directory to hold the master files
+class MetricsReporter:
+    # Rewrites the metrics file and logs the progress of the run every 'interval' seconds until stopped
+    def __init__(self, metrics, path, interval):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
 
-    master_file_path = "master_files" + "_" + year
+    def report(self):
+        try:
+            self.metrics.write(self.path)
+        except OSError as error:
+            log_event(
+                logging.WARNING, "Metrics file could not be written", error=str(error)
+            )
+        progress_logger.info(self.metrics.progress())
 
-    if not os.path.exists(master_file_path):
-        os.makedirs(master_file_path)
+    def work(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
 
-    # Links to master files found for each year
-    matching = [link for link in year_links if "master" in link]
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.report()
 
-    # Master dictionary for each year initialised
-    master_dictionary = []
 
-    for master in matching:
+def endpoint_type(url):
+    # The kind of EDGAR page a URL points to, requests are counted and timed by it
+    path = urllib.parse.urlsplit(url).path
+    name = path.rsplit("/", 1)[-1]
 
-        print("This is the master file: " + str(master))
+    if name == "FilingSummary.xml":
+        return "filing_summary"
+    if re.fullmatch(r"R\d+\.htm", name):
+        return "r_page"
+    if name.endswith("-index-headers.html"):
+        return "index_headers"
+    if name.endswith(".xml"):
+        return "xbrl"
+    if "-index/" in path:
+        return "index_listing" if name == "index.json" else "master_index"
+    if name == "index.json":
+        return "filing_index"
+    return "other"
 
-        file_url = master
-        content = requests.get(file_url).content
 
-        # Master file name created for each master file
-        result = re.search("master.(.*).idx", file_url)
-        file_name = result.group(1)
+# Shared by every stage of the run
+metrics = Metrics()
 
-        ###########################
-        # This section saves a copy of the master file in a more accesible format and in a document
-        ###########################
 
-        # Data saved to reduce RAM requirements and increase code speed
+######
 
-        with open(f"{master_file_path}\\{file_name}", "wb") as f:
-            f.write(content)
+# Shared fetch engine
+# Every request to the SEC goes through one fetcher. It keeps a pool of keep-alive connections, caps the number of
+# requests in flight and spaces the requests out so that the whole run stays under the SEC fair access limit.
+# The event loop runs in a background thread so the rest of the code can keep calling it like requests.get
 
-        with open(f"{master_file_path}\\{file_name}", "rb") as f:
-            byte_data = f.read()
+######
 
-        # Byte steam decoded, split by '--' which is the header and the rest of the data (the useful data)
-        data = byte_data.decode("utf-8", "ignore").split("--")
 
-        data_format = data[-1]
+class FetchError(Exception):
+    def __init__(self, url, status, retry_after=None):
+        super().__init__(f"{url} returned HTTP {status}")
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
 
-        #############################
-        # This section cleans the master file
-        #############################
 
-        master_data = []
+class CacheMiss(Exception):
+    def __init__(self, url):
+        super().__init__(f"{url} is not in the cache and the fetcher is offline")
+        self.url = url
 
-        clean_item_data = data_format.replace("\n", "|").split("|")
 
-        # Loop through the data list
-        for index, row in enumerate(clean_item_data):
+full_index_pattern = re.compile(r"/full-index/(\d{4})/QTR(\d)/")
 
-            # Loop for when the next txt file is found
-            if ".txt" in row:
 
-                # Values for the row retrieved, and indexed specifically to a standard SEC format
-                mini_list = clean_item_data[(index - 4) : index + 1]
+class ResponseCache:
+    def __init__(self, directory, size_limit):
+        self.directory = directory
+        self.size_limit = size_limit
+        self.lock = threading.Lock()
 
-                if len(mini_list) != 0:
-                    mini_list[4] = "https://www.sec.gov/Archives/" + mini_list[4]
-                    master_data.append(mini_list)
+        # Sizes and last use times of the cached files. The cache directory is walked on a background thread the
+        # first time an entry is written, entries written meanwhile are kept and nothing is evicted until it is done
+        self.entries = {}
+        self.total_size = 0
+        self.loaded = False
+        self.loader = None
 
-        ########
+    def path_for(self, url):
+        # https://www.sec.gov/Archives/edgar/data/320193/.../R2.htm -> <cache>/Archives/edgar/data/320193/.../R2.htm.gz
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path.strip("/") or "index"
 
-        # A dictionary list is created and updated containing all terms relating to the master file
+        if parts.query:
+            path += "_" + hashlib.sha1(parts.query.encode()).hexdigest()[:12]
 
-        ########
+        return os.path.join(self.directory, *path.split("/")) + ".gz"
 
-        for index, document in enumerate(master_data):
+    def is_immutable(self, url):
+        # Filings never change once archived, only the daily and quarterly directory listings grow over time
+        # The quarterly master files keep growing until their quarter is over
+        path = urllib.parse.urlsplit(url).path
+        if path.endswith("index.json") and "-index/" in path:
+            return False
 
-            # A dictionary is created for each item in the master list
-            document_dict = {}
-            document_dict["cik_number"] = document[0]
-            document_dict["company_name"] = document[1]
-            document_dict["form_id"] = document[2]
-            document_dict["date"] = document[3]
-            document_dict["file_url"] = document[4]
+        quarter = full_index_pattern.search(path)
+        if quarter:
+            return quarter_complete(int(quarter.group(1)), int(quarter.group(2)))
+        return True
 
-            master_data[index] = document_dict
+    def start_loading(self):
+        # Called with the lock held
+        if self.loader is None:
+            self.loader = threading.Thread(target=self.load_entries, daemon=True)
+            self.loader.start()
 
-            master_dictionary.append(document_dict)
-    return master_dictionary
+    def load_entries(self):
+        # The walk runs without the lock, so requests carry on however large the cache is
+        found = {}
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".gz"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found[path] = [stat.st_size, stat.st_mtime]
 
+        with self.lock:
+            # Entries written or used during the walk are newer than what it found
+            found.update(self.entries)
+            self.entries = found
+            self.total_size = sum(size for size, last_used in found.values())
+            self.loaded = True
 
-######
+            if self.total_size > self.size_limit:
+                self.evict()
 
-# This section retrieves the 10-K and 10-Q URLs along with the associated company names and CIK codes
-# The data is stored as a dataframe with the 10K and 10Qs, along with their respective filing dates, stored as lists
+    def get(self, url):
+        path = self.path_for(url)
 
-######
+        try:
+            with open(path, "rb") as f:
+                content = gzip.decompress(f.read())
+        except (OSError, EOFError):
+            return None
+
+        # The modified time doubles as the last use time for eviction
+        now = time.time()
+        os.utime(path, (now, now))
+        with self.lock:
+            if path in self.entries:
+                self.entries[path][1] = now
+
+        return content
+
+    def put(self, url, content):
+        path = self.path_for(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with atomic_write(path) as temp_path, open(temp_path, "wb") as f:
+            f.write(gzip.compress(content, compresslevel=6))
+
+        size = os.path.getsize(path)
+        with self.lock:
+            self.start_loading()
+
+            if path in self.entries:
+                self.total_size -= self.entries[path][0]
+            self.entries[path] = [size, time.time()]
+            self.total_size += size
+
+            if self.loaded and self.total_size > self.size_limit:
+                self.evict()
+
+    def evict(self):
+        # Oldest entries are removed until the cache is back to 90% of its limit
+        target = self.size_limit * 0.9
+
+        for path, (size, last_used) in sorted(
+            self.entries.items(), key=lambda entry: entry[1][1]
+        ):
+            if self.total_size <= target:
+                break
 
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            del self.entries[path]
+            self.total_size -= size
+
+
+class RateLimiter:
+    # Each request reserves the next free time slot, slots are 1 / rate seconds apart
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds):
+        # When the SEC throttles, no request at all goes out until the pause is over
+        now = asyncio.get_running_loop().time()
+        self.next_slot = max(self.next_slot, now + seconds)
+
+
+class AdaptiveLimit:
+    # Caps the requests in flight with additive increase, multiplicative decrease:
+    # the limit grows by one after a full window of good responses and halves on throttling or slow responses.
+    # Decreases are at most once per cooldown, so a burst of 429s from the same moment only counts once
+    def __init__(self, maximum, minimum=1, cooldown=2.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.cooldown = cooldown
+        self.limit = float(maximum)
+        self.active = 0
+        self.last_decrease = -math.inf
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+
+    async def release(self):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    async def increase(self):
+        async with self.condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+        metrics.gauge("concurrency_limit", int(self.limit))
+
+    def decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+        metrics.gauge("concurrency_limit", int(self.limit))
+        metrics.count("concurrency_decreases")
+
+
+def retry_after_seconds(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(retry_max_delay, retry_base_delay * 2 ** attempt))
+
+
+class EdgarFetcher:
+    def __init__(
+        self,
+        rate=requests_per_second,
+        in_flight=max_in_flight,
+        timeout=60,
+        cache=None,
+        offline=False,
+        origin=None,
+    ):
+        self.rate = rate
+        self.in_flight = in_flight
+        self.timeout = timeout
+        self.cache = cache
+        self.offline = offline
+        self.origin = origin
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+        self.run(self.open())
+
+    async def open(self):
+        # Connections are kept alive between requests, there is never a reason to hold more than the in-flight cap
+        connector = aiohttp.TCPConnector(limit=self.in_flight, keepalive_timeout=30)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": user_agent, "Accept-Encoding": "gzip, deflate"},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self.concurrency = AdaptiveLimit(self.in_flight)
+        self.limiter = RateLimiter(self.rate)
 
-def retrieve_filings(master_dictionary, year):
+    async def fetch(self, url):
+        # Archived filings are served from the cache whenever possible, directory listings only when offline
+        endpoint = endpoint_type(url)
 
-    # Initialise the master dataframe
-    com_files = pd.DataFrame(
-        {
-            "Name": [],
-            "CIK": [],
-            "10Ks": [],
-            "KDates": [],
-            "10Qs": [],
-            "QDates": [],
-            "SIC": [],
-        }
-    )
+        if self.cache is not None and (self.offline or self.cache.is_immutable(url)):
+            content = await self.loop.run_in_executor(None, self.cache.get, url)
 
-    for document_dict in master_dictionary:
+            if content is not None:
+                metrics.count("cache_hits", label=endpoint)
+                return content
 
-        # If the document is a 10K or 10Q, a series of checks are then performed
-        if document_dict["form_id"] == "10-Q" or document_dict["form_id"] == "10-K":
+        if self.offline:
+            raise CacheMiss(url)
 
-            # In the event the company isn't listed in the dataframe, a new row is added with the CIK no. and company name
-            if document_dict["cik_number"] not in set(com_files["CIK"]):
-                com_row = pd.DataFrame(
-                    {
-                        "Name": [document_dict["company_name"]],
-                        "CIK": [document_dict["cik_number"]],
-                        "10Ks": [[]],
-                        "KDates": [[]],
-                        "10Qs": [[]],
-                        "QDates": [[]],
-                        "SIC": [[]],
-                    }
+        attempt = 0
+        while True:
+            try:
+                content = await self.request(url, endpoint)
+                break
+            except (FetchError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                status = error.status if isinstance(error, FetchError) else None
+                if (
+                    status is not None and status not in retry_statuses
+                ) or attempt + 1 >= retry_attempts:
+                    raise
+
+                # Throttling asks for the wait in Retry-After, every other failure backs off exponentially
+                delay = backoff_delay(attempt)
+                if status in (429, 503) and error.retry_after is not None:
+                    delay = max(delay, error.retry_after)
+
+                attempt += 1
+                metrics.count(
+                    "retries", label=str(status) if status else type(error).__name__
                 )
-                com_files = pd.concat([com_files, com_row])
-
-                # Index reset each time a company is added to the dataframe
-                com_files = com_files.reset_index(drop=True)
-
-            # The 10Q or 10K document URLs are added to the company row along with the corresponding date
-            if document_dict["form_id"] == "10-Q":
-                ComIndex = com_files.index[
-                    com_files["CIK"] == document_dict["cik_number"]
-                ].tolist()[0]
-                com_files.at[ComIndex, "10Qs"].append(
-                    document_dict["file_url"]
-                    .replace("-", "")
-                    .replace(".txt", "/index.json")
+                log_event(
+                    logging.DEBUG,
+                    "Request retried",
+                    url=url,
+                    attempt=attempt,
+                    delay=round(delay, 2),
+                    error=str(error),
                 )
-                com_files.at[ComIndex, "QDates"].append(document_dict["date"])
-
-                if len(com_files.at[ComIndex, "SIC"]) == 0:
-
-                    # This gets the SIC webpage
-                    sic_url = document_dict["file_url"].replace(".txt", "")
-                    sic_url1 = sic_url.split("/")
-                    sic_url = (
-                        sic_url.replace("-", "")
-                        + "/"
-                        + sic_url1[-1]
-                        + "-index-headers.html"
-                    )
+                await asyncio.sleep(delay)
 
-                    sic_webpage = requests.get(sic_url).content
-                    soup = BeautifulSoup(sic_webpage).get_text()
+        if self.cache is not None:
+            await self.loop.run_in_executor(None, self.cache.put, url, content)
 
-                    try:
-                        match = re.findall(
-                            "(?<=STANDARD INDUSTRIAL CLASSIFICATION:\t)[^\n]*", soup
-                        )
-                        sic_number = re.findall("[\d]+", match[0])
-                        sic_number = sic_number[0]
-                        com_files.at[ComIndex, "SIC"].append(sic_number)
+        return content
 
-                    except:
-                        com_files.at[ComIndex, "SIC"].append("")
+    async def request(self, url, endpoint):
+        await self.concurrency.acquire()
+        try:
+            await self.limiter.wait()
 
-            else:
-                print(document_dict["file_url"])
-                ComIndex = com_files.index[
-                    com_files["CIK"] == document_dict["cik_number"]
-                ].tolist()[0]
-                com_files.at[ComIndex, "10Ks"].append(
-                    document_dict["file_url"]
-                    .replace("-", "")
-                    .replace(".txt", "/index.json")
-                )
-                com_files.at[ComIndex, "KDates"].append(document_dict["date"])
-
-                if len(com_files.at[ComIndex, "SIC"]) == 0:
-
-                    # This gets the SIC webpage
-                    sic_url = document_dict["file_url"].replace(".txt", "")
-                    sic_url1 = sic_url.split("/")
-                    sic_url = (
-                        sic_url.replace("-", "")
-                        + "/"
-                        + sic_url1[-1]
-                        + "-index-headers.html"
+            # Time from the request going out to the whole body being read, the rate limit wait isn't included
+            start = time.perf_counter()
+            try:
+                async with self.session.get(self.request_url(url)) as response:
+                    content = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # Dropped connections and timeouts are treated as a sign of overload as well
+                metrics.count("request_errors", label="connection")
+                self.concurrency.decrease()
+                raise
+            seconds = time.perf_counter() - start
+
+            metrics.observe("request_seconds", seconds, endpoint)
+            metrics.count("requests", label=endpoint)
+            metrics.count("bytes", len(content), label=endpoint)
+
+            if response.status >= 400:
+                metrics.count("request_errors", label=str(response.status))
+                retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+
+                if response.status in (429, 503):
+                    self.concurrency.decrease()
+                    self.limiter.pause(
+                        retry_after if retry_after is not None else backoff_delay(0)
                     )
+                raise FetchError(url, response.status, retry_after)
 
-                    sic_webpage = requests.get(sic_url).content
-                    soup = BeautifulSoup(sic_webpage).get_text()
+            if seconds > latency_target:
+                self.concurrency.decrease()
+            else:
+                await self.concurrency.increase()
+
+            return content
+        finally:
+            await self.concurrency.release()
+
+    def request_url(self, url):
+        # URLs keep pointing at www.sec.gov everywhere else, so cached pages and saved URLs are the same either way
+        if self.origin is None:
+            return url
+        parts = urllib.parse.urlsplit(url)
+        return (
+            self.origin.rstrip("/")
+            + parts.path
+            + ("?" + parts.query if parts.query else "")
+        )
 
-                    # This gets the SIC number and appends it to com_files
-                    try:
-                        match = re.findall(
-                            "(?<=STANDARD INDUSTRIAL CLASSIFICATION:\t)[^\n]*", soup
-                        )
-                        sic_number = re.findall("[\d]+", match[0])
-                        sic_number = sic_number[0]
-                        com_files.at[ComIndex, "SIC"].append(sic_number)
-
-                    except:
-                        com_files.at[ComIndex, "SIC"].append("")
-
-            # The URL of each filing is adjusted for future indexing to be in the .json format
-            document_dict["file_url"] = (
-                document_dict["file_url"]
-                .replace("-", "")
-                .replace(".txt", "/index.json")
-            )
+    async def fetch_safe(self, url):
+        # Used for batches, an error is handed back in place of the content so one bad URL doesn't sink the rest
+        try:
+            return await self.fetch(url)
+        except Exception as error:
+            return error
 
-    com_files.to_csv(f"com_files_{year}.csv", index=False)
-    return com_files
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
 
+    def get(self, url):
+        return self.run(self.fetch(url))
 
-######
+    def get_json(self, url):
+        return json.loads(self.get(url))
 
-# This section iterates through the 10K and 10Q filing URLs and creates corresponding CSV files for four main tables
-# The retrieved tables are iterated through to identify whether they fall into the main categories. If true, they are parsed
+    def get_many(self, urls):
+        # All URLs are requested concurrently, results come back in the same order as the URLs
+        async def gather():
+            return await asyncio.gather(*[self.fetch_safe(url) for url in urls])
 
-######
+        return self.run(gather())
 
+    def iter_many(self, urls, window=None):
+        # Yields (url, content) in order while keeping up to 'window' requests running ahead of the consumer
+        # If the consumer stops early, the requests that are still running are cancelled
+        window = window or self.in_flight
+        urls = list(urls)
+        pending = collections.deque()
+        next_url = 0
 
-def load_filing_names(filing_path):
-    # File loading of the confirmed filing names, and the scraped file names
-    # This section hasn't been split into multiple functions to increase legibilty, however, it could be split to reduce number of lines written
+        try:
+            while next_url < len(urls) or pending:
+                while next_url < len(urls) and len(pending) < window:
+                    pending.append(
+                        (
+                            urls[next_url],
+                            asyncio.run_coroutine_threadsafe(
+                                self.fetch_safe(urls[next_url]), self.loop
+                            ),
+                        )
+                    )
+                    next_url += 1
 
-    # Filing names retrieved, cleaned and sorted
-    File_Doc_names = pd.read_excel(filing_path + r"\Filing Document Names.xlsx")
+                url, future = pending.popleft()
+                yield url, future.result()
+        finally:
+            for url, future in pending:
+                future.cancel()
 
-    headers = File_Doc_names.columns.to_list()
+    def close(self):
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
 
-    terms_list = []
-    for i in headers:
-        terms_list.append(File_Doc_names[i].to_list())
 
-    # nan values removed that occur due to different string lengths
-    terms_list = [[x for x in y if str(x) != "nan"] for y in terms_list]
-    terms_list = [
-        ["".join(c.lower() for c in s if c not in string.punctuation) for s in y]
-        for y in terms_list
-    ]
+def get_fetcher():
+    global fetcher
 
-    # Scraped filing names retrieved, cleaned and sorted
-    Scraped_File_Doc_names = pd.read_excel(
-        filing_path + r"\Scraped Filing Document Names.xlsx", index_col=0
-    )
+    if fetcher is None:
+        fetcher = EdgarFetcher(
+            cache=ResponseCache(cache_directory, cache_size_limit),
+            offline=offline_mode,
+            origin=sec_origin,
+        )
+        atexit.register(fetcher.close)
 
-    scraped_list = []
-    for i in headers:
-        scraped_list.append(Scraped_File_Doc_names[i].to_list())
+    return fetcher
 
-    scraped_list = [[x for x in y if str(x) != "nan"] for y in scraped_list]
-    scraped_list = [
-        ["".join(c.lower() for c in s if c not in string.punctuation) for s in y]
-        for y in scraped_list
-    ]
 
-    # Default filing row names and keys
-    Default_Doc_Terms = pd.read_excel(filing_path + r"\Default Filing Terms.xlsx")
+######
 
-    default_terms = []
-    for i in headers:
-        default_terms.append(Default_Doc_Terms[i].to_list())
+# The SEC daily index files are requested through the SEC master data navigator
 
-    default_terms = [[x for x in y if str(x) != "nan"] for y in default_terms]
-    default_terms = [
-        ["".join(c.lower() for c in s if c not in string.punctuation) for s in y]
-        for y in default_terms
-    ]
+######
+def get_year_links(year, base_url):
+    # This line sets up a link to https://www.sec.gov/Archives/edgar/daily-index/###YEAR VARIABLE###/
+    # This is the ###YEAR VARIABLE### page of all the quarterly filing indexes
+    year_url = make_url(base_url, [year, "index.json"])
 
-    return terms_list, scraped_list, headers, default_terms
+    # Requesting the content for ###YEAR VARIABLE###
+    decoded_content = get_fetcher().get_json(year_url)
 
+    quarters = [item["name"] for item in decoded_content["directory"]["item"]]
 
-def parse_filings(
-    filing_name,
-    term_list,
-    com_files,
-    term_date,
-    base_url,
-    scraped_list,
-    default_terms,
-    headers,
-):
-    print(len(com_files))
-    for company in range(0, len(com_files)):
-        print("Company " + str(company))
-        # Iterate through a companies 10Ks
+    # The daily-index filings for every quarter are requested together
+    qtr_urls = [make_url(base_url, [year, qtr, "index.json"]) for qtr in quarters]
+    qtr_contents = get_fetcher().get_many(qtr_urls)
 
-        # index to restart code if errors out
-        if company < 2861:
-            continue
+    year_links = []
+    # Iterating through a list of quarters
+    for qtr, qtr_url, file_content in zip(quarters, qtr_urls, qtr_contents):
 
-        for filing in com_files.at[company, filing_name]:
-            print("Filing " + filing)
+        if isinstance(file_content, Exception):
+            raise file_content
 
-            # URL requested and json format retrieved
-            content = requests.get(filing).json()
+        # New URL requested as json structure
+        decoded_content = json.loads(file_content)
 
-            xml_summary = ""
+        # For each file retrieved, the type and URL is stored
+        for file in decoded_content["directory"]["item"]:
 
-            for file in content["directory"]["item"]:
+            file_url = make_url(base_url, [year, qtr, file["name"]])
+            year_links.append(file_url)
+    return year_links
 
-                # The filing summary url can be used to add terms to the dictionary in the event that a document cannot be found
-                if file["name"] == "FilingSummary.xml":
 
-                    xml_summary = (
-                        base_url + content["directory"]["name"] + "/" + file["name"]
-                    )
+######
 
-            base_url_hold = xml_summary.replace("FilingSummary.xml", "")
+# Find 'master' files for each year
+# The master files are parsed one line at a time and only the filings of the form types being scraped are kept,
+# so memory stays flat however many daily or quarterly files a run covers
 
-            try:
+######
 
-                # Content requested
-                content = requests.get(xml_summary).content
+# Form types kept while the master files are parsed, each with the form it is indexed and scraped as. Other forms
+# are added with the form they stand for, e.g. "10-K405": "10-K" scrapes them along with the 10-Ks
+form_types = {"10-K": "10-K", "10-Q": "10-Q"}
+
+# One row of a master file
+IndexRecord = collections.namedtuple(
+    "IndexRecord", ["cik", "company_name", "form_type", "date_filed", "file_name"]
+)
+
+
+def iter_master_index(path, forms=None):
+    # Yields an IndexRecord for every filing in a master .idx file, optionally only those of the given form types
+    # The file is memory mapped and never decoded as a whole
+    forms = None if forms is None else {form.encode() for form in forms}
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+            # The header is a few lines of description, then the column names and a line of dashes
+            # Company names can contain "--", so the header is found by its column names rather than by splitting on dashes
+            columns = data.find(b"CIK|Company Name|Form Type|Date Filed|")
+            if columns == -1:
+                return
+
+            dashes = data.find(b"\n", columns) + 1
+            position = data.find(b"\n", dashes) + 1
+            if dashes == 0 or position == 0:
+                return
+
+            size = len(data)
+            while position < size:
+                end = data.find(b"\n", position)
+                if end == -1:
+                    end = size
+
+                fields = data[position:end].rstrip(b"\r").split(b"|")
+                position = end + 1
+
+                if len(fields) < 5:
+                    continue
+
+                # A company name containing "|" is the only way a line can have more than five fields
+                form_type = fields[-3]
+                if forms is not None and form_type not in forms:
+                    continue
+
+                yield IndexRecord(
+                    int(fields[0]),
+                    b"|".join(fields[1:-3]).decode("utf-8", "ignore"),
+                    form_type.decode(),
+                    fields[-2].decode(),
+                    fields[-1].decode(),
+                )
 
-            except:
-                print(f"{filing} does not contain a FilingSummary.xml page.")
-                continue
 
-            # Content parsed
-            soup = BeautifulSoup(content, "lxml")
+def get_master_files(year_links, year):
 
-            # The 'myreports' tag contains all the individual reports submitted
-            reports = soup.find("myreports")
+    # Creates a directory to hold the master files
 
-            # A master list of components is created
-            master_reports = []
+    master_file_path = "master_files" + "_" + year
 
-            # Each 'myreports' tag reports iterated through
-            # Based on the SEC website structure, the last item is avoided
-            for report in reports.find_all("report")[:-1]:
+    if not os.path.exists(master_file_path):
+        os.makedirs(master_file_path)
 
-                # Dictionary for relevant parts created
-                report_dict = {}
-                report_dict["name_short"] = report.shortname.text
-                report_dict["name_long"] = report.longname.text
-                report_dict["position"] = report.position.text
-                report_dict["category"] = report.menucategory.text
-                report_dict["url"] = base_url_hold + report.htmlfilename.text
+    # Links to master files found for each year
+    matching = [link for link in year_links if "master" in link]
 
-                # Each dictionary is appended to the master list
-                master_reports.append(report_dict)
+    # The master files are downloaded a few at a time ahead of the parsing below
+    for master, content in get_fetcher().iter_many(matching):
 
-            # List to hold URLs initialsed
-            statements_url = []
+        log_event(logging.INFO, "Master file requested", url=master)
 
-            for names in headers:
-                best_match_url = []
-                # print(names)
-                for report_dict in master_reports:
+        if isinstance(content, Exception):
+            raise content
 
-                    # This section lists the key terms and attempts to identify the type of report it is based on the presence of key terms
+        # Master file name created for each master file
+        result = re.search("master.(.*).idx", master)
+        file_name = os.path.join(master_file_path, result.group(1))
 
-                    x1 = default_terms[headers.index(names)]
-                    url_hold = best_fit_url(
-                        master_reports, default_terms[headers.index(names)]
-                    )
+        # A copy of the master file is saved, it is then parsed from disk rather than held in memory
+        with open(file_name, "wb") as f:
+            f.write(content)
+        del content
 
-                    if url_hold == "No match found":
-                        statements_url.append(url_hold)
-                        break
-                    else:
-                        print("Best fit algorithm found match for " + str(names))
-                        statements_url.append(url_hold["url"])
-                        break
+        yield from iter_master_index(file_name, form_types)
 
-            print(statements_url)
-            # statements_url.append(best_match_url[0])
 
-            ########################
+######
 
-            # All the statements are assembled into a single dataset
+# This section retrieves the 10-K and 10-Q URLs along with the associated company names and CIK codes
+# The data is stored as a dataframe with the 10K and 10Qs, along with their respective filing dates, stored as lists
 
-            ########################
+######
 
-            for i in range(0, len(statements_url)):
-                if type(statements_url[i]) == list:
-                    statements_url[i] = statements_url[i][0]
 
-            statements_data = []
+# Columns of com_files that hold the filings and filing dates of each form type
+form_columns = {"10-K": ("10Ks", "KDates"), "10-Q": ("10Qs", "QDates")}
 
-            # Loop through each statement url
-            for statement in statements_url:
 
-                if statement != "No match found":
-                    # A dictionary is defined that will store the different parts of the statement
-                    statement_data = {}
-                    statement_data["headers"] = []
-                    statement_data["sections"] = []
-                    statement_data["data"] = []
+def accession_number(file_name):
+    # edgar/data/1000045/0001193125-20-000001.txt -> 0001193125-20-000001
+    return file_name.rsplit("/", 1)[-1].replace(".txt", "")
 
-                    # Statement file content requested
-                    content = requests.get(statement).content
-                    report_soup = BeautifulSoup(content, "html")
 
-                    # All rows found and parsed
-                    for index, row in enumerate(report_soup.table.find_all("tr")):
+def sic_header_url(file_url):
+    # https://www.sec.gov/Archives/edgar/data/1000045/0001193125-20-000001.txt ->
+    # https://www.sec.gov/Archives/edgar/data/1000045/000119312520000001/0001193125-20-000001-index-headers.html
+    sic_url = file_url.replace(".txt", "")
+    sic_url1 = sic_url.split("/")
+    return sic_url.replace("-", "") + "/" + sic_url1[-1] + "-index-headers.html"
 
-                        cols = row.find_all("td")
 
-                        # Statement for a regular row and not section or table header
-                        if (
-                            len(row.find_all("th")) == 0
-                            and len(row.find_all("strong")) == 0
-                        ):
-                            reg_row = [ele.text.strip() for ele in cols]
-                            statement_data["data"].append(reg_row)
+def accession_id(file_name):
+    # edgar/data/1000045/0001193125-20-000001.txt -> 119312520000001, the accession number as an integer
+    return int(accession_number(file_name).replace("-", ""))
 
-                        # Statement for a regular row and a section but not a table header
-                        elif (
-                            len(row.find_all("th")) == 0
-                            and len(row.find_all("strong")) != 0
-                        ):
-                            sec_row = cols[0].text.strip()
-                            statement_data["sections"].append(sec_row)
 
-                        # Statement if none of the above are recognised, therefore it's a table header
-                        elif len(row.find_all("th")) != 0:
-                            hed_row = [ele.text.strip() for ele in row.find_all("th")]
-                            statement_data["headers"].append(hed_row)
+def filing_url(cik, accession):
+    # 1000045, 119312520000001 -> https://www.sec.gov/Archives/edgar/data/1000045/000119312520000001/index.json
+    return f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession:018d}/index.json"
 
-                        else:
-                            print("We encountered an error.")
 
-                    # Appended to master file
-                    statements_data.append(statement_data)
-                else:
-                    statements_data.append(statement)
-
-                # Data saved in common file
-
-            print("saving data")
-            save_data(
-                filing_name,
-                statements_data,
-                com_files,
-                term_date,
-                company,
-                filing,
-                headers,
-            )
-    return scraped_list
+def filing_file_url(cik, accession):
+    # 1000045, 119312520000001 -> https://www.sec.gov/Archives/edgar/data/1000045/0001193125-20-000001.txt
+    accession = f"{accession:018d}"
+    accession = f"{accession[:10]}-{accession[10:12]}-{accession[12:]}"
+    return f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession}.txt"
 
 
-def save_data(
-    filing_name, statements_data, com_files, term_date, company, filing, headers
-):
+######
 
-    for stat_num in range(0, len(statements_data)):
-        if statements_data[stat_num] != "No match found":
-            # Grab the proper components
+# SIC codes
+# Each company's SIC code is read from the header page of one of its filings. Codes are kept in a SQLite database so a
+# company is only ever looked up once, and unknown companies are looked up in batches on a background thread while
+# the index is still being built
 
-            if len(statements_data[stat_num]["headers"]) == 1:
-                index_num = 1
-            else:
-                index_num = 0
+######
 
-            doc_header = statements_data[stat_num]["headers"][
-                (len(statements_data[stat_num]["headers"]) - 1)
-            ]
-            doc_data = statements_data[stat_num]["data"]
-
-            # Data is converted into a dataframe
-            doc_df = pd.DataFrame(doc_data)
-
-            # Define the Index column, rename it, and we need to make sure to drop the old column once we reindex.
-            doc_df.index = doc_df[0]
-            doc_df.index.name = "Category"
-            doc_df = doc_df.drop(0, axis=1)
-
-            # Get rid of the '$', '(', ')', and convert the '' to NaNs.
-            doc_df = (
-                doc_df.replace("[\$,)%]", "", regex=True)
-                .replace("[(]", "-", regex=True)
-                .replace("", "NaN", regex=True)
-                .replace("\[", "", regex=True)
-                .replace("\]", "", regex=True)
-            )
+# The SIC line of the header reads "STANDARD INDUSTRIAL CLASSIFICATION:	SERVICES-PREPACKAGED SOFTWARE [7372]"
+sic_pattern = re.compile(rb"STANDARD INDUSTRIAL CLASSIFICATION:[^\n]*?(\d+)")
 
-            # Strings are converted into floats
-            # If there is an error, the document check is skipped
-            try:
-                doc_df = doc_df.astype(float)
-            except:
-                break
 
-            # Column header names inserted
-            doc_df.columns = doc_header[index_num:]
+def scan_sic(content):
+    # The raw bytes are searched directly, the page never needs to be parsed as HTML
+    match = sic_pattern.search(content)
+    return match.group(1).decode() if match else ""
 
-            #####################################################################
-            # Regular expression removes special characters from company name. This helps if the company name contains a "\\" which may break code.
-            # Some special characters are also not permitted in folder names.
 
-            if not os.path.exists(
-                data_directory
-                + "\\"
-                + re.sub("[^a-zA-Z0-9 \n\.]", "", com_files["Name"][company]).strip()
-            ):
-                os.makedirs(
-                    data_directory
-                    + "\\"
-                    + re.sub(
-                        "[^a-zA-Z0-9 \n\.]", "", com_files["Name"][company]
-                    ).strip()
+class SicStore:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sic_codes "
+            "(cik INTEGER PRIMARY KEY, sic TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get_many(self, ciks):
+        # SQLite limits the number of parameters in one query, so the CIKs are looked up in chunks
+        ciks = list(ciks)
+        found = {}
+        with self.lock:
+            for start in range(0, len(ciks), 500):
+                chunk = ciks[start : start + 500]
+                rows = self.connection.execute(
+                    "SELECT cik, sic FROM sic_codes WHERE cik IN ({})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    chunk,
                 )
-
-            # A file is created in each company's folder with a name structured: Filing type + Filing date + Table type
-            new_file_dir = (
-                data_directory
-                + "\\"
-                + re.sub("[^a-zA-Z0-9 \n\.]", "", com_files["Name"][company]).strip()
-                + "\\"
-                + filing_name[0:3]
-                + "_"
-                + com_files.at[company, term_date][
-                    com_files.at[company, filing_name].index(filing)
-                ]
-                + "_"
-                + str(com_files.at[company, "CIK"])
-                + "_"
-                + str(com_files.at[company, "SIC"][0])
-                + "_"
-                + headers[stat_num]
+                found.update(rows)
+        return found
+
+    def put_many(self, codes):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sic_codes (cik, sic) VALUES (?, ?)",
+                codes.items(),
             )
-            print("This is the new_file_dir: " + new_file_dir)
-            if not os.path.exists(new_file_dir):
-                doc_df.to_csv(new_file_dir)
-                print("data saved")
-
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class SicResolver:
+    # Companies are handed over as they are found, the lookups run on their own thread so the index build never waits
+    def __init__(self, store, batch_size=64):
+        self.store = store
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def submit(self, cik, file_url):
+        self.queue.put((cik, file_url))
+
+    def work(self):
+        finished = False
+        while not finished:
+            batch = []
+            item = self.queue.get()
+
+            # Everything already waiting is taken in the same batch
+            while item is not None:
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            finished = item is None
+
+            if len(batch) != 0:
+                self.resolve(batch)
+
+    def resolve(self, batch):
+        known = self.store.get_many(cik for cik, file_url in batch)
+        unknown = {cik: file_url for cik, file_url in batch if cik not in known}
+
+        contents = get_fetcher().get_many(
+            [sic_header_url(file_url) for file_url in unknown.values()]
+        )
 
-def best_fit_url(master_reports, default_list):
+        # Failed requests are left out of the store so they are tried again on the next run
+        self.store.put_many(
+            {
+                cik: scan_sic(content)
+                for cik, content in zip(unknown, contents)
+                if not isinstance(content, Exception)
+            }
+        )
 
-    print("Best fit algorithm initiated")
-    # Hold values initialised
-    match_values = []
+    def finish(self):
+        self.queue.put(None)
+        self.thread.join()
 
-    # print("These are the master reports")
-    # print(master_reports)
-    # print(len(master_reports))
 
-    # Loop through each statement url
-    for statement in master_reports:
-        # print("This is the statement")
-        # print(statement)
+def retrieve_filings(master_dictionary, year, resolve_sic=True):
 
-        # A dictionary is defined that will store the different parts of the statement
-        statement_data = {}
-        statement_data["headers"] = []
-        statement_data["sections"] = []
-        statement_data["data"] = []
+    # Filings go straight to the filing index on disk as they are found, only each company's name is kept in memory
+    # Companies are kept in the order they are first seen, as they were when the dataframe was grown row by row
+    companies = {}
 
-        hold_term = 0
-        while hold_term == 0:
+    # The same filing can be listed in more than one daily index, each accession number is only kept once
+    seen_accessions = set()
 
-            # Statement file content requested
-            # Hold term is added in because there is a strange error in BeautifulSoup which causes it to error out randomly
-            # This hold term ensures that if an error out occurs, the code will run again until it works
-            try:
-                content1 = requests.get(statement["url"]).content
-                hold_term = 1
-            except:
-                hold_term = 0
+    index_directory = filing_index_path(year)
+    index_writer = FilingIndexWriter(index_directory)
 
-        hold_term = 0
-        while hold_term == 0:
-            try:
-                report_soup = BeautifulSoup(content1, "html")
-                hold_term = 1
-            except:
-                hold_term = 0
+    # SIC codes are looked up alongside the index build
+    if resolve_sic:
+        sic_store = SicStore(sic_database)
+        sic_resolver = SicResolver(sic_store)
 
-        # All rows found and parsed
-        try:
-            for index, row in enumerate(report_soup.table.find_all("tr")):
+    for record in master_dictionary:
 
-                cols = row.find_all("td")
+        # Only 10Ks and 10Qs are kept
+        if record.form_type not in form_types:
+            continue
 
-                # Statement for a regular row and not section or table header
-                if len(row.find_all("th")) == 0 and len(row.find_all("strong")) == 0:
-                    reg_row = [ele.text.strip() for ele in cols]
-                    statement_data["data"].append(reg_row)
+        accession = accession_id(record.file_name)
+        if accession in seen_accessions:
+            continue
+        seen_accessions.add(accession)
+
+        # The SIC code of a new company is looked up from the header page of its first filing
+        if record.cik not in companies:
+            companies[record.cik] = record.company_name
+            if resolve_sic:
+                sic_resolver.submit(
+                    record.cik, "https://www.sec.gov/Archives/" + record.file_name
+                )
+
+        index_writer.add(
+            record.cik, form_types[record.form_type], record.date_filed, accession
+        )
+
+    # Companies whose SIC code couldn't be found are given a blank code
+    if resolve_sic:
+        sic_resolver.finish()
+        sic_codes = sic_store.get_many(companies.keys())
+        sic_store.close()
+    else:
+        sic_codes = {}
+
+    # The company table is written last and marks the index as complete
+    index_writer.finish(
+        [(cik, name, sic_codes.get(cik, "")) for cik, name in companies.items()]
+    )
+
+    # The filings are handed back as they are loaded at start up, URLs are only made when a filing is requested
+    return load_filing_index(index_directory)
+
+
+######
+
+# Filing index
+# The filings found in the master files are kept on disk as Arrow (Feather) files with one row per filing.
+# Rows are written out in parts while the index is built, so an interrupted build keeps what it found, and the
+# company table (name and SIC code) is written last to mark the index as complete.
+# The files are uncompressed so they are memory mapped when loaded rather than parsed.
+# A filing is stored as its CIK, form, date and accession number, every URL of the filing is made from the CIK and
+# accession number when it is needed
+
+######
+
+
+@functools.lru_cache(maxsize=None)
+def filing_index_schema():
+    return pa.schema(
+        [
+            ("cik", pa.int64()),
+            ("form", pa.dictionary(pa.int8(), pa.string())),
+            ("date_filed", pa.date32()),
+            ("accession", pa.int64()),
+        ]
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def company_index_schema():
+    return pa.schema([("cik", pa.int64()), ("name", pa.string()), ("sic", pa.string())])
+
+
+def filing_index_path(year):
+    return "filing_index" + "_" + year
+
+
+def filing_index_complete(directory):
+    return os.path.exists(os.path.join(directory, "companies.arrow"))
+
+
+def filing_dates(dates):
+    # Daily indexes give dates as 20200102, quarterly indexes as 2020-01-02
+    # Both are read as numbers and turned into days without going through datetime objects
+    dates = np.array([int(date.replace("-", "")) for date in dates], dtype=np.int64)
+    months = (dates // 10000 - 1970) * 12 + dates // 100 % 100 - 1
+    days = months.astype("datetime64[M]").astype("datetime64[D]") + (dates % 100 - 1)
+    return days
+
+
+def filing_table(rows):
+    # rows holds the cik, form, date_filed and accession columns as lists
+    return pa.table(
+        [
+            pa.array(rows["cik"], pa.int64()),
+            pa.array(rows["form"], pa.string())
+            .dictionary_encode()
+            .cast(filing_index_schema().field("form").type),
+            pa.array(filing_dates(rows["date_filed"]), pa.date32()),
+            pa.array(rows["accession"], pa.int64()),
+        ],
+        schema=filing_index_schema(),
+    )
+
+
+def company_table(companies):
+    # companies is a list of (cik, name, sic)
+    ciks, names, sic_codes = zip(*companies) if companies else ((), (), ())
+    return pa.table(
+        [
+            pa.array(ciks, pa.int64()),
+            pa.array(names, pa.string()),
+            pa.array(sic_codes, pa.string()),
+        ],
+        schema=company_index_schema(),
+    )
+
+
+def write_arrow(table, path):
+    with atomic_write(path) as temp_path:
+        pa.feather.write_feather(table, temp_path, compression="uncompressed")
+
+
+class FilingIndexWriter:
+    def __init__(self, directory, part_size=100000):
+        self.directory = directory
+        self.part_size = part_size
+        self.part_count = 0
+        self.rows = {name: [] for name in ("cik", "form", "date_filed", "accession")}
+
+        # The index is rebuilt from scratch, parts left by an earlier build are removed
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".arrow") or name.endswith(".tmp"):
+                os.remove(os.path.join(directory, name))
+
+    def add(self, cik, form, date_filed, accession):
+        self.rows["cik"].append(cik)
+        self.rows["form"].append(form)
+        self.rows["date_filed"].append(date_filed)
+        self.rows["accession"].append(accession)
+
+        if len(self.rows["cik"]) >= self.part_size:
+            self.write_part()
+
+    def write_part(self):
+        if len(self.rows["cik"]) == 0:
+            return
+
+        self.part_count += 1
+        write_arrow(
+            filing_table(self.rows),
+            os.path.join(self.directory, f"filings-{self.part_count:05d}.arrow"),
+        )
+        self.rows = {name: [] for name in self.rows}
+
+    def finish(self, companies):
+        self.write_part()
+        write_arrow(
+            company_table(companies), os.path.join(self.directory, "companies.arrow")
+        )
+
+
+def read_arrow(path):
+    return pa.feather.read_table(path, memory_map=True)
+
+
+def read_filing_part(path):
+    # One part of the filing index as numpy arrays: cik, form (categorical), date_filed (datetime64[D]) and accession
+    # The arrays are copied out of the memory map, so the index can be rewritten while it is loaded
+    table = read_arrow(path)
+    return (
+        np.array(table.column("cik").to_pandas(), dtype=np.int64),
+        table.column("form").to_pandas(),
+        np.array(
+            table.column("date_filed").cast(pa.int32()).to_pandas(),
+            dtype="datetime64[D]",
+        ),
+        np.array(table.column("accession").to_pandas(), dtype=np.int64),
+    )
+
+
+class FilingIndex:
+    # The filing index in memory, one numpy array per column instead of an object per filing: with the company table
+    # a filing takes under 30 bytes where the com_files lists of URL and date strings took about 200. Forms are held
+    # as int8 codes into 'forms', names and SIC codes are held once per company, and URLs are only made for the
+    # filings they are asked of
+    def __init__(self, cik, form, date_filed, accession, forms, companies):
+        self.cik = cik
+        self.form = form
+        self.date_filed = date_filed
+        self.accession = accession
+        self.forms = forms
+
+        # cik, name and sic arrays with one entry per company
+        self.companies = companies
+
+    def __len__(self):
+        return len(self.cik)
+
+    @property
+    def nbytes(self):
+        return (
+            self.cik.nbytes
+            + self.form.nbytes
+            + self.date_filed.nbytes
+            + self.accession.nbytes
+        )
+
+    def take(self, rows):
+        # rows is a boolean mask or an array of positions, the company table is shared
+        return FilingIndex(
+            self.cik[rows],
+            self.form[rows],
+            self.date_filed[rows],
+            self.accession[rows],
+            self.forms,
+            self.companies,
+        )
+
+    def form_mask(self, forms):
+        codes = [code for code, form in enumerate(self.forms) if form in forms]
+        return np.isin(self.form, codes)
+
+    def select(self, forms=None, first_year=None, last_year=None):
+        # Filings of the given form types filed from first_year to last_year, worked out on the arrays as a whole
+        mask = np.ones(len(self), dtype=bool)
+        if forms is not None:
+            mask &= self.form_mask(forms)
+        if first_year is not None:
+            mask &= self.date_filed >= np.datetime64(f"{first_year:04d}-01-01", "D")
+        if last_year is not None:
+            mask &= self.date_filed < np.datetime64(f"{last_year + 1:04d}-01-01", "D")
+        return self.take(mask)
+
+    def company_position(self, ciks):
+        return pd.Index(self.companies["cik"]).get_indexer(ciks)
+
+    def urls(self, rows=None):
+        # index.json URLs, e.g. https://www.sec.gov/Archives/edgar/data/1000045/000119312520000001/index.json
+        rows = slice(None) if rows is None else rows
+        return [
+            filing_url(cik, accession)
+            for cik, accession in zip(
+                self.cik[rows].tolist(), self.accession[rows].tolist()
+            )
+        ]
+
+    def file_urls(self, rows=None):
+        # URLs of the full submission text files, as the master files list them
+        rows = slice(None) if rows is None else rows
+        return [
+            filing_file_url(cik, accession)
+            for cik, accession in zip(
+                self.cik[rows].tolist(), self.accession[rows].tolist()
+            )
+        ]
+
+
+def load_filing_index(*directories):
+    # Returns the filings of every directory as one FilingIndex
+    parts = [
+        read_filing_part(os.path.join(directory, name))
+        for directory in directories
+        for name in sorted(os.listdir(directory))
+        if name.startswith("filings-") and name.endswith(".arrow")
+    ]
+
+    # Every part has its own form categories, the codes are made to agree before the parts are joined
+    forms = tuple(sorted({form for part in parts for form in part[1].cat.categories}))
+    cik = np.concatenate([part[0] for part in parts] or [np.zeros(0, np.int64)])
+    form = np.concatenate(
+        [
+            pd.Categorical(part[1], categories=forms).codes.astype(np.int8)
+            for part in parts
+        ]
+        or [np.zeros(0, np.int8)]
+    )
+    date_filed = np.concatenate(
+        [part[2] for part in parts] or [np.zeros(0, "datetime64[D]")]
+    )
+    accession = np.concatenate([part[3] for part in parts] or [np.zeros(0, np.int64)])
+
+    # A company in more than one directory keeps the first SIC code found for it
+    companies = {}
+    for directory in directories:
+        if not filing_index_complete(directory):
+            continue
+        table = read_arrow(os.path.join(directory, "companies.arrow")).to_pydict()
+        for company_cik, name, sic in zip(table["cik"], table["name"], table["sic"]):
+            known = companies.get(company_cik)
+            if known is None or known[1] == "":
+                companies[company_cik] = (name, sic)
+
+    # An interrupted build has no company table yet, the filings are still usable on their own
+    for company_cik in pd.unique(cik).tolist():
+        companies.setdefault(company_cik, ("", ""))
+
+    company_arrays = {
+        "cik": np.array(list(companies), dtype=np.int64),
+        "name": np.array([name for name, sic in companies.values()], dtype=object),
+        "sic": np.array([sic for name, sic in companies.values()], dtype=object),
+    }
+    return FilingIndex(cik, form, date_filed, accession, forms, company_arrays)
+
+
+def build_com_files(filings):
+    # Turns the filing index back into the com_files layout, one row per company with the filings of each form
+    # type and their dates held as lists, companies in the order they were first seen. The scraper plans from the
+    # index arrays, this layout is only kept for the reference save_data and the benchmarks
+    companies = pd.unique(filings.cik)
+    com_files = pd.DataFrame({"CIK": companies})
+    position = filings.company_position(companies)
+    com_files["Name"] = filings.companies["name"][position]
+
+    # Dates are given back as they are written in the master files, e.g. 20200102
+    dates = filings.date_filed
+    years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+    days = (dates - dates.astype("datetime64[M]")).astype(np.int64) + 1
+    date_strings = (years * 10000 + months * 100 + days).astype(str)
+
+    company_position = pd.Index(companies).get_indexer(filings.cik)
+
+    # The rows of each form are grouped by company with a stable sort, which keeps every company's filings in order
+    # URLs are only made for the rows of each form once they are in that order
+    for form, (files_column, dates_column) in form_columns.items():
+        rows = np.flatnonzero(filings.form_mask([form]))
+        rows = rows[np.argsort(company_position[rows], kind="stable")]
+        bounds = np.cumsum(
+            np.bincount(company_position[rows], minlength=len(companies))
+        )[:-1]
+
+        urls = np.array(filings.urls(rows), dtype=object)
+        com_files[files_column] = [part.tolist() for part in np.split(urls, bounds)]
+        com_files[dates_column] = [
+            part.tolist() for part in np.split(date_strings[rows], bounds)
+        ]
+
+    com_files["SIC"] = [[code] for code in filings.companies["sic"][position]]
+
+    return com_files[["Name", "CIK", "10Ks", "KDates", "10Qs", "QDates", "SIC"]]
+
+
+######
+
+# Quarterly full index
+# EDGAR also publishes one master index per quarter under full-index/<year>/QTR<n>/, a multi-year range is covered by
+# a few dozen requests instead of one request per day. Each quarter becomes its own part of the filing index and is
+# recorded in a manifest, so later runs only request the quarters that are new or were still open when last fetched
+
+######
+
+full_index_url = r"https://www.sec.gov/Archives/edgar/full-index"
+full_index_directory = "filing_index_full"
+
+# EDGAR starts in 1993, the first complete year is 1994
+full_index_first_year = 1993
+
+
+def quarter_start(year, quarter):
+    return datetime.date(year, 3 * quarter - 2, 1)
+
+
+def quarter_complete(year, quarter, today=None):
+    # The index of a quarter keeps growing until the filings of its last day have been added, a couple of days
+    # after the quarter ends
+    today = today or datetime.date.today()
+    next_quarter = quarter_start(year + quarter // 4, quarter % 4 + 1)
+    return today >= next_quarter + datetime.timedelta(days=2)
+
+
+def index_quarters(first_year, last_year, today=None):
+    today = today or datetime.date.today()
+    return [
+        (year, quarter)
+        for year in range(max(first_year, full_index_first_year), last_year + 1)
+        for quarter in range(1, 5)
+        if quarter_start(year, quarter) <= today
+    ]
+
+
+def quarter_index_url(year, quarter):
+    # The compressed master file is around a tenth of the size of master.idx
+    return make_url(full_index_url, [str(year), f"QTR{quarter}", "master.gz"])
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(directory, manifest):
+    with atomic_write(os.path.join(directory, "manifest.json")) as temp_path, open(
+        temp_path, "w"
+    ) as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def ingest_full_index(first_year, last_year, directory=None, resolve_sic=True):
+    # Brings the filing index in 'directory' up to date for every quarter from first_year to last_year
+    directory = directory or full_index_directory
+    os.makedirs(directory, exist_ok=True)
+
+    master_file_path = os.path.join(directory, "master_files")
+    os.makedirs(master_file_path, exist_ok=True)
+
+    manifest = load_manifest(directory)
+    quarters = [
+        (year, quarter)
+        for year, quarter in index_quarters(first_year, last_year)
+        if not manifest.get(f"{year}Q{quarter}", {}).get("complete", False)
+    ]
+    progress_logger.info(f"{len(quarters)} quarterly indexes to request")
+
+    # Companies already in the index keep their name and SIC code
+    companies = {}
+    if filing_index_complete(directory):
+        for cik, name, sic in zip(
+            *read_arrow(os.path.join(directory, "companies.arrow")).to_pydict().values()
+        ):
+            companies[cik] = [name, sic]
+
+    submitted = set()
+    if resolve_sic:
+        sic_store = SicStore(sic_database)
+        sic_resolver = SicResolver(sic_store)
+
+        # A run stopped part way leaves companies that were never looked up, they are looked up from their first filing
+        blank = [cik for cik, (name, sic) in companies.items() if sic == ""]
+        never_looked_up = set(blank) - set(sic_store.get_many(blank))
+        if len(never_looked_up) != 0:
+            filings = load_filing_index(directory)
+            rows = np.flatnonzero(np.isin(filings.cik, list(never_looked_up)))
+            rows = rows[np.unique(filings.cik[rows], return_index=True)[1]]
+            for cik, file_url in zip(
+                filings.cik[rows].tolist(), filings.file_urls(rows)
+            ):
+                submitted.add(cik)
+                sic_resolver.submit(cik, file_url)
+
+    urls = [quarter_index_url(year, quarter) for year, quarter in quarters]
+    for (year, quarter), (url, content) in zip(
+        quarters, get_fetcher().iter_many(urls, window=2)
+    ):
+        name = f"{year}Q{quarter}"
+        log_event(logging.INFO, "Master file requested", url=url)
+
+        if isinstance(content, Exception):
+            raise content
+
+        # The master file is kept on disk and parsed from there, as the daily master files are
+        file_name = os.path.join(master_file_path, name + ".idx")
+        with open(file_name, "wb") as f:
+            f.write(gzip.decompress(content))
+        del content
+
+        rows = {column: [] for column in ("cik", "form", "date_filed", "accession")}
+        seen_accessions = set()
+        for record in iter_master_index(file_name, form_types):
+            accession = accession_id(record.file_name)
+            if accession in seen_accessions:
+                continue
+            seen_accessions.add(accession)
+
+            rows["cik"].append(record.cik)
+            rows["form"].append(form_types[record.form_type])
+            rows["date_filed"].append(record.date_filed)
+            rows["accession"].append(accession)
+
+            # Companies without a SIC code are looked up, those already known are answered by the SIC store
+            company = companies.setdefault(record.cik, [record.company_name, ""])
+            if resolve_sic and company[1] == "" and record.cik not in submitted:
+                submitted.add(record.cik)
+                sic_resolver.submit(
+                    record.cik, "https://www.sec.gov/Archives/" + record.file_name
+                )
+
+        # A quarter fetched again replaces its earlier part, the manifest is only updated once the part and the
+        # companies it brought in are written, so a quarter in the manifest is never missing its company names
+        write_arrow(
+            filing_table(rows), os.path.join(directory, f"filings-{name}.arrow")
+        )
+        save_company_table(directory, companies, sic_store if resolve_sic else None)
+        manifest[name] = {
+            "complete": quarter_complete(year, quarter),
+            "filings": len(rows["cik"]),
+            "fetched": datetime.date.today().isoformat(),
+        }
+        save_manifest(directory, manifest)
+
+    # Companies whose SIC code couldn't be found keep a blank code and are looked up again with their next filing
+    if resolve_sic:
+        sic_resolver.finish()
+        save_company_table(directory, companies, sic_store)
+        sic_store.close()
+    else:
+        save_company_table(directory, companies)
+
+
+def save_company_table(directory, companies, sic_store=None):
+    # companies is {cik: [name, sic]}, blank SIC codes are filled in from the codes found so far before it is written
+    if sic_store is not None:
+        blank = [cik for cik, (name, sic) in companies.items() if sic == ""]
+        for cik, sic in sic_store.get_many(blank).items():
+            companies[cik][1] = sic
+
+    write_arrow(
+        company_table([(cik, name, sic) for cik, (name, sic) in companies.items()]),
+        os.path.join(directory, "companies.arrow"),
+    )
+
+
+######
+
+# This section iterates through the 10K and 10Q filing URLs and creates corresponding CSV files for four main tables
+# The retrieved tables are iterated through to identify whether they fall into the main categories. If true, they are parsed
+
+######
+
+
+def load_filing_names(filing_path):
+    # File loading of the confirmed filing names, and the scraped file names
+    # This section hasn't been split into multiple functions to increase legibilty, however, it could be split to reduce number of lines written
+
+    # Filing names retrieved, cleaned and sorted
+    File_Doc_names = pd.read_excel(
+        os.path.join(filing_path, "Filing Document Names.xlsx")
+    )
+
+    headers = File_Doc_names.columns.to_list()
+
+    terms_list = []
+    for i in headers:
+        terms_list.append(File_Doc_names[i].to_list())
+
+    # nan values removed that occur due to different string lengths
+    terms_list = [[x for x in y if str(x) != "nan"] for y in terms_list]
+    terms_list = [
+        ["".join(c.lower() for c in s if c not in string.punctuation) for s in y]
+        for y in terms_list
+    ]
+
+    # Scraped filing names retrieved, cleaned and sorted
+    Scraped_File_Doc_names = pd.read_excel(
+        os.path.join(filing_path, "Scraped Filing Document Names.xlsx"), index_col=0
+    )
+
+    scraped_list = []
+    for i in headers:
+        scraped_list.append(Scraped_File_Doc_names[i].to_list())
+
+    scraped_list = [[x for x in y if str(x) != "nan"] for y in scraped_list]
+    scraped_list = [
+        ["".join(c.lower() for c in s if c not in string.punctuation) for s in y]
+        for y in scraped_list
+    ]
+
+    # Default filing row names and keys
+    Default_Doc_Terms = pd.read_excel(
+        os.path.join(filing_path, "Default Filing Terms.xlsx")
+    )
+
+    default_terms = []
+    for i in headers:
+        default_terms.append(Default_Doc_Terms[i].to_list())
+
+    default_terms = [[x for x in y if str(x) != "nan"] for y in default_terms]
+    default_terms = [
+        ["".join(c.lower() for c in s if c not in string.punctuation) for s in y]
+        for y in default_terms
+    ]
+
+    return terms_list, scraped_list, headers, default_terms
+
+
+######
+
+# Statements
+# A matched statement is held as typed arrays: the row labels, the section names, the column periods with their
+# durations and a float64 matrix of the values. Every cell is converted in one pass, a cell that isn't a number is marked as failed and left
+# blank, so one odd cell no longer loses the whole statement
+
+######
+
+# Footnote markers such as "[1]" that are attached to the values
+footnote_pattern = re.compile(r"\[\d+\]")
+
+# Characters removed from a cell before it is read as a number, "(" is kept to mark negatives
+cell_strip_characters = "$,)%[] \xa0"
+
+# Cells are joined with a character that never appears in an R page
+cell_separator = "\x1f"
+
+
+def convert_cells(rows, width):
+    # Rows are padded to the statement's width and every cell is converted in one go: the cells are joined into one
+    # string so footnotes and symbols are removed in a single pass over it, then read as numbers together
+    cells = [cell for row in rows for cell in (row[:width] + [""] * (width - len(row)))]
+    text = footnote_pattern.sub("", cell_separator.join(cells))
+    for character in cell_strip_characters:
+        text = text.replace(character, "")
+
+    # "(1,234)" is a negative number
+    text = np.array(
+        text.replace("(", "-").split(cell_separator) if len(cells) != 0 else [],
+        dtype=object,
+    )
+
+    # Blank cells stay NaN, a cell with anything other than a number in it is marked as failed
+    values = np.full(len(text), np.nan)
+    filled = text != ""
+    values[filled] = pd.to_numeric(text[filled], errors="coerce")
+    failed = filled & np.isnan(values)
+
+    return values.reshape(len(rows), width), failed.reshape(len(rows), width)
+
+
+class Statement:
+    def __init__(
+        self, title, labels, sections, periods, values, failed, durations=None
+    ):
+        self.title = title
+        self.labels = labels
+        self.sections = sections
+        self.periods = periods
+        self.values = values
+        self.failed = failed
+        # "3 Months Ended" or "9 Months Ended" for each period, blank where the statement doesn't say
+        self.durations = durations if durations is not None else [""] * len(periods)
+
+    @property
+    def failed_cells(self):
+        # Cells that held something other than a number
+        return int(self.failed.sum())
+
+    @classmethod
+    def from_table(cls, statement_data):
+        headers = statement_data["headers"]
+        rows = statement_data["data"]
+
+        # With one header row the first cell is the table title, with two the periods are all in the second row
+        index_num = 1 if len(headers) == 1 else 0
+        doc_header = headers[-1] if len(headers) != 0 else []
+        periods = doc_header[index_num:]
+        title = headers[0][0] if len(headers) != 0 and len(headers[0]) != 0 else ""
+
+        labels = [row[0] if len(row) != 0 else "" for row in rows]
+        width = max([len(row) - 1 for row in rows] + [0])
+
+        # Some statements have an extra column of notes that has no period header, only the dated columns are kept
+        if len(periods) != 0:
+            width = min(width, len(periods))
+            periods = periods[:width]
+        else:
+            periods = [""] * width
+
+        # With two header rows the first heads the periods with their durations, a 10-Q's quarter and year to date
+        # columns end on the same dates
+        durations = headers[0][1:] if len(headers) > 1 else []
+        durations = (durations + [""] * width)[:width]
+
+        values, failed = convert_cells([row[1:] for row in rows], width)
+
+        return cls(
+            title,
+            labels,
+            statement_data["sections"],
+            periods,
+            values,
+            failed,
+            durations,
+        )
+
+    def to_frame(self):
+        doc_df = pd.DataFrame(self.values, index=self.labels, columns=self.periods)
+        doc_df.index.name = "Category"
+        return doc_df
+
+
+######
+
+# Output store
+# Statements are saved as tidy rows, one per (line item, period), in a parquet dataset laid out as
+#   Statement Data/year=2020/form=10-K/statement=Consolidated%20Balance%20Sheet/part-<run>-<n>.parquet
+# Rows are buffered and written a row group at a time. Every write is a new file, so a run never touches the files of
+# an earlier run and incremental runs simply add to the dataset. Filings are journaled once their rows are written, so
+# a run that stops in between scrapes them again: a filing whose rows a partition already has is skipped there
+
+######
+
+
+@functools.lru_cache(maxsize=None)
+def statement_schema():
+    return pa.schema(
+        [
+            ("cik", pa.int64()),
+            ("sic", pa.string()),
+            ("filing_date", pa.date32()),
+            ("accession", pa.string()),
+            ("line", pa.int32()),
+            ("line_item", pa.string()),
+            ("period", pa.string()),
+            ("duration", pa.string()),
+            ("value", pa.float64()),
+        ]
+    )
+
+
+def parse_filing_date(date):
+    # Daily indexes give dates as 20200102, quarterly indexes as 2020-01-02
+    date = date.replace("-", "")
+    return datetime.date(int(date[0:4]), int(date[4:6]), int(date[6:8]))
+
+
+class StatementStore:
+    def __init__(self, directory, row_group_size=100000, flush_interval=120):
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.flush_interval = flush_interval
+
+        # Files written by this run are named after it, so runs never overwrite each other
+        self.run_id = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        self.file_count = 0
+
+        # Partition (year, form, statement) -> buffered columns
+        self.buffers = {}
+        self.buffered_rows = 0
+        self.last_flush = time.monotonic()
+
+        # Partition -> accessions already in its files, read the first time a statement is added to it
+        self.saved = {}
+
+    def saved_accessions(self, partition):
+        if partition not in self.saved:
+            path = self.partition_path(partition)
+            accessions = set()
+            if os.path.isdir(path):
+                for name in os.listdir(path):
+                    if name.endswith(".parquet"):
+                        table = pq.read_table(
+                            os.path.join(path, name), columns=["accession"]
+                        )
+                        accessions.update(
+                            table.column("accession").unique().to_pylist()
+                        )
+            self.saved[partition] = accessions
+        return self.saved[partition]
+
+    def add(self, statement, statement_name, form, cik, sic, filing_date, accession):
+        filing_date = parse_filing_date(filing_date)
+        partition = (str(filing_date.year), form, statement_name)
+
+        if accession in self.saved_accessions(partition):
+            metrics.count("statements_already_saved")
+            return
+
+        # Every cell that holds a number becomes a row
+        rows, columns = np.nonzero(~np.isnan(statement.values))
+        if len(rows) == 0:
+            return
+
+        buffer = self.buffers.setdefault(
+            partition, {name: [] for name in statement_schema().names}
+        )
+        count = len(rows)
+        buffer["cik"].extend([int(cik)] * count)
+        buffer["sic"].extend([str(sic)] * count)
+        buffer["filing_date"].extend([filing_date] * count)
+        buffer["accession"].extend([accession] * count)
+        buffer["line"].extend(rows.tolist())
+        buffer["line_item"].extend([statement.labels[row] for row in rows])
+        buffer["period"].extend([statement.periods[column] for column in columns])
+        buffer["duration"].extend([statement.durations[column] for column in columns])
+        buffer["value"].extend(statement.values[rows, columns].tolist())
+
+        self.buffered_rows += count
+        if len(buffer["cik"]) >= self.row_group_size:
+            self.write_partition(partition)
+
+    def should_flush(self):
+        # Everything is written out regularly so the journal, which only records written filings, keeps moving
+        return (
+            self.buffered_rows >= self.row_group_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def partition_path(self, partition):
+        # Partition values are URI encoded, pyarrow decodes them when the dataset is read (from pyarrow 6, which
+        # requirements.txt pins), so statement names with slashes or apostrophes filter and load as written
+        year, form, statement_name = partition
+        return os.path.join(
+            self.directory,
+            "year=" + year,
+            "form=" + urllib.parse.quote(form, safe=""),
+            "statement=" + urllib.parse.quote(statement_name, safe=""),
+        )
+
+    def write_partition(self, partition):
+        buffer = self.buffers.pop(partition)
+        table = pa.Table.from_pydict(buffer, schema=statement_schema())
+
+        path = self.partition_path(partition)
+        os.makedirs(path, exist_ok=True)
+
+        self.file_count += 1
+        file_name = os.path.join(
+            path, f"part-{self.run_id}-{self.file_count:05d}.parquet"
+        )
+        with atomic_write(file_name) as temp_path:
+            pq.write_table(table, temp_path, row_group_size=self.row_group_size)
+
+        self.buffered_rows -= table.num_rows
+
+    def flush(self):
+        for partition in list(self.buffers):
+            self.write_partition(partition)
+        self.last_flush = time.monotonic()
+
+
+def load_statements(directory=None, filters=None, columns=None):
+    # Reads the saved statements back, filters are pushed down to the partitions and row groups, e.g.
+    # load_statements(filters=[("statement", "==", "Consolidated Balance Sheet"), ("sic", "==", "2080")])
+    return pd.read_parquet(
+        directory or output_directory, filters=filters, columns=columns
+    )
+
+
+# CSV output
+# With output_format = "csv" every statement is its own CSV file in a folder per company in the data directory.
+# Company names such as "AMARIN CORP PLC\UK" or "UNIVERSAL DISPLAY CORP \PA\" hold characters that aren't allowed in
+# folder names, so names are cleaned once per company. Cleaning can give two companies the same name, so each folder
+# records the CIK it belongs to, and a company whose cleaned name is already taken by another CIK gets a folder with
+# its CIK added
+
+# Characters kept in folder names, anything else (slashes included) is removed exactly as save_data always has, so
+# the folders of earlier runs are found again
+unsafe_name_pattern = re.compile(r"[^a-zA-Z0-9 \n.]")
+
+
+def safe_name(name):
+    return unsafe_name_pattern.sub("", str(name)).strip()
+
+
+class CompanyDirectories:
+    # The folder of every company, resolved the first time the company is saved and then kept for the run
+    marker = ".cik"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def owner(self, path):
+        try:
+            with open(os.path.join(path, self.marker)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def path(self, cik, name):
+        cik = str(int(cik))
+        with self.lock:
+            if cik in self.paths:
+                return self.paths[cik]
+
+            base = safe_name(name) or "CIK " + cik
+            path = os.path.join(self.directory, base)
+
+            # Folders made before the CIK was recorded are taken over by the first company to save into them
+            if self.owner(path) not in (None, cik):
+                path = os.path.join(self.directory, f"{base} CIK {cik}")
+
+            os.makedirs(path, exist_ok=True)
+            if self.owner(path) is None:
+                with open(os.path.join(path, self.marker), "w") as f:
+                    f.write(cik)
+
+            self.paths[cik] = path
+            return path
+
+
+# Company folders of each data directory, shared by everything that saves into it during the run
+company_directories = {}
+
+
+def get_company_directories(directory):
+    return company_directories.setdefault(directory, CompanyDirectories(directory))
+
+
+def statement_file_name(form, filing_date, cik, sic, statement_name):
+    # Filing type + filing date + CIK + SIC + table type, e.g. 10K_20200102_320193_3571_Balance Sheet
+    # Header names are kept as they are written in Filing Document Names.xlsx, only path separators are taken out
+    statement_name = statement_name.replace("/", "").replace("\\", "")
+    return "_".join(
+        [form.replace("-", "")[0:3], filing_date, str(cik), str(sic), statement_name]
+    )
+
+
+class CsvStore:
+    # Same interface as StatementStore: statements are buffered by add and written out by flush
+    def __init__(self, directory, names, batch_size=500, flush_interval=120):
+        self.directory = directory
+        # CIK -> company name
+        self.names = names
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.directories = get_company_directories(directory)
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def add(self, statement, statement_name, form, cik, sic, filing_date, accession):
+        path = os.path.join(
+            self.directories.path(cik, self.names.get(cik, "")),
+            statement_file_name(form, filing_date, cik, sic, statement_name),
+        )
+        self.buffer.append((path, statement))
+
+    def should_flush(self):
+        return (
+            len(self.buffer) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.flush_interval
+        )
+
+    def flush(self):
+        buffer, self.buffer = self.buffer, []
+
+        # Company folders are made when they are resolved, they are only checked again once per batch in case the
+        # data directory was cleared during the run
+        for directory in {os.path.dirname(path) for path, statement in buffer}:
+            os.makedirs(directory, exist_ok=True)
+
+        for path, statement in buffer:
+            # A statement already saved by an earlier run is left as it is
+            if not os.path.exists(path):
+                # Cells that aren't numbers are left blank rather than dropping the whole statement
+                # A file cut short would count as saved, so it only appears once it is complete
+                with atomic_write(path) as temp_path:
+                    statement.to_frame().to_csv(temp_path)
+                log_event(logging.DEBUG, "Statement saved", path=path)
+        self.last_flush = time.monotonic()
+
+
+class StatementWriter:
+    # Saves statements on a thread of its own, so neither the network nor the process stage ever waits on the disk.
+    # Filings are handed over through a bounded queue, their statements are written out in batches by the store and
+    # each filing is journaled once its statements are on disk
+    def __init__(self, store, journal, queue_size=None):
+        self.store = store
+        self.journal = journal
+        self.queue = queue.Queue(queue_size or writer_queue_size)
+
+        # Filings whose statements are buffered in the store but not yet written
+        self.unflushed = []
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, filing, statements, details):
+        # statements are (statement, statement name, form, CIK, SIC, filing date, accession) for StatementStore.add
+        self.queue.put((filing, statements, details))
+
+    def run(self):
+        while True:
+            # The store is also flushed when no filing has arrived for a while
+            try:
+                item = self.queue.get(timeout=5)
+            except queue.Empty:
+                if self.store.should_flush():
+                    self.flush()
+                continue
+
+            if item is None:
+                self.flush()
+                return
+
+            filing, statements, details = item
+            try:
+                with metrics.timer("write_seconds"):
+                    for statement in statements:
+                        self.store.add(*statement)
+                self.unflushed.append((filing, details))
+            except Exception as error:
+                log_event(
+                    logging.ERROR,
+                    "Filing could not be saved",
+                    filing=filing,
+                    error=str(error),
+                )
+
+            if self.store.should_flush():
+                self.flush()
+
+    def flush(self):
+        try:
+            with metrics.timer("flush_seconds"):
+                self.store.flush()
+        except Exception as error:
+            # The filings aren't journaled, so the next run scrapes them again
+            log_event(
+                logging.ERROR,
+                "Statements could not be written",
+                filings=len(self.unflushed),
+                error=str(error),
+            )
+        else:
+            for filing, details in self.unflushed:
+                self.journal.record(filing, "done", **details)
+        self.unflushed = []
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+######
+
+# Journal
+# Every filing that is finished is written to an append-only journal as soon as it is done. On start up the planner
+# takes the journaled filings out of the filing index, so a restarted run carries on where the last one stopped without
+# requesting anything it already has
+
+######
+
+# Outcomes that mean a filing never needs to be requested again
+final_statuses = {"done", "no_filing_summary", "unparseable"}
+
+
+def filing_accession(filing):
+    # https://www.sec.gov/Archives/edgar/data/1000045/000119312520000001/index.json -> 000119312520000001
+    return filing.rstrip("/").split("/")[-2]
+
+
+class ScrapeJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def completed(self):
+        accessions = set()
+
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                # A run killed mid write can leave a partial last line, it is ignored and the filing is redone
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+
+                if entry.get("status") in final_statuses:
+                    accessions.add(entry["accession"])
+        return accessions
+
+    def record(self, filing, status, **details):
+        entry = {
+            "accession": filing_accession(filing),
+            "filing": filing,
+            "status": status,
+        }
+        entry.update(details)
+
+        # Each entry is on disk before the next filing starts
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def plan_filings(filings, form, completed):
+    # The filings of the form that aren't in the journal yet, with each company's filings together and the companies
+    # in the order they were first seen. It is all worked out on the index arrays, a filing's URL is only made once
+    # it is fetched
+    completed = np.fromiter(
+        (int(accession) for accession in completed),
+        dtype=np.int64,
+        count=len(completed),
+    )
+    rows = np.flatnonzero(
+        filings.form_mask([form]) & ~np.isin(filings.accession, completed)
+    )
+    companies = pd.factorize(filings.cik)[0][rows]
+    return filings.take(rows[np.argsort(companies, kind="stable")])
+
+
+def request_stop(signum, frame):
+    # A second signal stops straight away
+    if stop_requested.is_set():
+        raise KeyboardInterrupt
+
+    progress_logger.warning("Stop requested, finishing the filings in progress")
+    stop_requested.set()
+
+
+def install_stop_handlers():
+    # Signal handlers can only be set from the main thread
+    if threading.current_thread() is not threading.main_thread():
+        return {}
+
+    previous_handlers = {}
+    for name in ("SIGINT", "SIGTERM"):
+        if hasattr(signal, name):
+            signum = getattr(signal, name)
+            previous_handlers[signum] = signal.signal(signum, request_stop)
+    return previous_handlers
+
+
+def restore_stop_handlers(previous_handlers):
+    for signum, handler in previous_handlers.items():
+        signal.signal(signum, handler)
+
+
+######
+
+# Sharding
+# A backfill can be split across machines. Each one runs a shard, "3/8" runs shard 3 of 8 (shards are numbered from
+# 0), and only scrapes the companies that fall in it. Companies go to shards by a hash of their CIK, or balanced by
+# their number of filings so every shard finishes at about the same time. The hash split only depends on the CIK, so
+# every machine agrees on it. The balanced split depends on the filing index of the machine that works it out, so the
+# first run saves it to Shards/split-of-<n>.json and every later run uses that file: copy it to the other machines
+# before starting them. Companies that aren't in a saved split go by the hash of their CIK.
+# A shard keeps its outputs and journal in Shards/shard-<i>-of-<n>, merge_shards combines them into the main ones
+
+######
+
+shards_directory = os.path.join(os.getcwd(), "Shards")
+
+
+def parse_shard(spec):
+    # "3/8" -> (3, 8)
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard {spec!r} should be given as <index>/<count>, e.g. 3/8")
+
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} is outside 0 to {count - 1}")
+    return index, count
+
+
+def shard_path(shard):
+    index, count = shard
+    return os.path.join(shards_directory, f"shard-{index:03d}-of-{count:03d}")
+
+
+def cik_hash(cik):
+    # Python's hash() changes between processes, crc32 is the same on every machine
+    return zlib.crc32(str(int(cik)).encode())
+
+
+def split_path(count):
+    return os.path.join(shards_directory, f"split-of-{count:03d}.json")
+
+
+def read_split(count):
+    # CIK -> shard of the saved balanced split, None if there isn't one yet
+    try:
+        with open(split_path(count), encoding="utf-8") as f:
+            return {int(cik): shard for cik, shard in json.load(f).items()}
+    except FileNotFoundError:
+        return None
+
+
+def save_split(count, split):
+    # The first split to be saved is kept, a run that loses the race to save its own reads back the one in place
+    os.makedirs(shards_directory, exist_ok=True)
+    temp_path = f"{split_path(count)}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({str(cik): int(shard) for cik, shard in split.items()}, f)
+    try:
+        os.link(temp_path, split_path(count))
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_path)
+    return read_split(count)
+
+
+def assign_shards(filings, count, weighted=False):
+    # Returns the shard of every filing, all the filings of a company go to the same shard
+    ciks, companies, counts = np.unique(
+        filings.cik, return_inverse=True, return_counts=True
+    )
+    ciks = ciks.tolist()
+    hashes = np.array([cik_hash(cik) for cik in ciks], dtype=np.int64)
+
+    if not weighted:
+        return (hashes % count)[companies]
+
+    split = read_split(count)
+    if split is None:
+        split = save_split(
+            count, dict(zip(ciks, balanced_shards(counts, count, hashes).tolist()))
+        )
+    shards = np.array(
+        [split.get(cik, value % count) for cik, value in zip(ciks, hashes.tolist())],
+        dtype=np.int64,
+    )
+    return shards[companies]
+
+
+def balanced_shards(filings, count, hashes):
+    # filings holds the number of filings of each company
+    # Largest companies first, each to the shard with the fewest filings so far, ties broken by CIK hash
+    order = np.lexsort((hashes, -filings))
+    loads = [0] * count
+    shards = np.zeros(len(filings), dtype=np.int64)
+    for position in order:
+        shard = min(range(count), key=lambda number: (loads[number], number))
+        shards[position] = shard
+        loads[shard] += filings[position]
+    return shards
+
+
+def shard_filings(filings, shard, weighted=False):
+    index, count = shard
+    return filings.take(assign_shards(filings, count, weighted) == index)
+
+
+def use_shard_paths(shard):
+    # Every output of the run goes into the shard's own directory
+    global output_directory, data_directory, journal_path, merged_journal_path
+    global metrics_path, log_path
+
+    directory = shard_path(shard)
+    os.makedirs(directory, exist_ok=True)
+
+    merged_journal_path = journal_path
+    output_directory = os.path.join(directory, "Statement Data")
+    data_directory = os.path.join(directory, "Data Directory")
+    journal_path = os.path.join(directory, "scrape_journal.jsonl")
+    metrics_path = os.path.join(directory, "secscrape_metrics.txt")
+    log_path = os.path.join(directory, "secscrape.log")
+    return directory
+
+
+def read_journal(path):
+    entries = []
+    if not os.path.exists(path):
+        return entries
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def merge_names(lists, headers):
+    # Union of the scraped filing names of every list, each header's names in the order they were first seen
+    merged = [[] for _ in headers]
+    for names in lists:
+        for header_num, header in enumerate(headers):
+            for name in names.get(header, []):
+                if isinstance(name, str) and name not in merged[header_num]:
+                    merged[header_num].append(name)
+    return merged
+
+
+def read_scraped_names(path):
+    if not os.path.exists(path):
+        return {}
+    names = pd.read_excel(path, index_col=0)
+    return {column: names[column].dropna().tolist() for column in names.columns}
+
+
+def write_scraped_names(path, scraped_list, headers):
+    df = pd.DataFrame(scraped_list).transpose()
+    df.columns = headers
+    df.to_excel(path)
+
+
+def merge_shards(directories=None, filing_path=None):
+    # Combines shard outputs into the main dataset, journal and Scraped Filing Document Names.xlsx
+    # A filing finished by more than one shard (after a change in the number of shards) is kept from the first only
+    if directories is None:
+        directories = sorted(
+            os.path.join(shards_directory, name)
+            for name in os.listdir(shards_directory)
+            if name.startswith("shard-")
+        )
+    filing_path = filing_path or os.path.join(os.getcwd(), "Filing Names")
+
+    journal = ScrapeJournal(journal_path)
+    done = journal.completed()
+
+    for directory in directories:
+        entries = read_journal(os.path.join(directory, "scrape_journal.jsonl"))
+
+        # Filings already in the main journal are dropped from this shard's statements
+        duplicates = {
+            entry["accession"]
+            for entry in entries
+            if entry.get("status") in final_statuses and entry["accession"] in done
+        }
+        merged = merge_statement_data(
+            os.path.join(directory, "Statement Data"), output_directory, duplicates
+        )
+        merged += merge_csv_data(
+            os.path.join(directory, "Data Directory"), data_directory
+        )
+
+        # The statements are in place before their filings are journaled
+        added = 0
+        for entry in entries:
+            if entry.get("status") in final_statuses and entry["accession"] not in done:
+                details = {
+                    key: value
+                    for key, value in entry.items()
+                    if key not in ("accession", "filing", "status")
+                }
+                journal.record(entry["filing"], entry["status"], **details)
+                done.add(entry["accession"])
+                added += 1
+
+        progress_logger.info(
+            f"{directory}: {added} filings and {merged} statement files merged"
+        )
+    journal.close()
+
+    # Scraped filing names of every shard are added to the main list
+    names_path = os.path.join(filing_path, "Scraped Filing Document Names.xlsx")
+    headers = pd.read_excel(
+        os.path.join(filing_path, "Filing Document Names.xlsx")
+    ).columns.to_list()
+    scraped_list = merge_names(
+        [read_scraped_names(names_path)]
+        + [
+            read_scraped_names(
+                os.path.join(directory, "Scraped Filing Document Names.xlsx")
+            )
+            for directory in directories
+        ],
+        headers,
+    )
+    write_scraped_names(names_path, scraped_list, headers)
+
+
+def merge_statement_data(source, destination, duplicates):
+    # Part files have names unique to the run that wrote them, so they are copied across as they are
+    # Rows of duplicate filings are filtered out of a part file that has any
+    merged = 0
+    if not os.path.exists(source):
+        return merged
+
+    for root, directories, files in os.walk(source):
+        for name in sorted(files):
+            if not name.endswith(".parquet"):
+                continue
+
+            target_directory = os.path.join(destination, os.path.relpath(root, source))
+            target = os.path.join(target_directory, name)
+            if os.path.exists(target):
+                continue
+            os.makedirs(target_directory, exist_ok=True)
+
+            table = pq.read_table(os.path.join(root, name))
+            if duplicates:
+                keep = [
+                    accession not in duplicates
+                    for accession in table.column("accession").to_pylist()
+                ]
+                table = table.filter(pa.array(keep))
+
+                if table.num_rows == 0:
+                    continue
+
+            with atomic_write(target) as temp_path:
+                pq.write_table(table, temp_path)
+            merged += 1
+
+    return merged
+
+
+def merge_csv_data(source, destination):
+    # Company folders of a CSV shard are found again in the main data directory by their CIK, as CsvStore finds them
+    # A statement file the main directory already has is left as it is, as it is when a run saves it again
+    merged = 0
+    if not os.path.exists(source):
+        return merged
+
+    directories = get_company_directories(destination)
+    for name in sorted(os.listdir(source)):
+        folder = os.path.join(source, name)
+        cik = directories.owner(folder)
+        if cik is None:
+            continue
+
+        # A folder the shard had to name after its CIK may not need it in the main directory
+        if name.endswith(f" CIK {cik}"):
+            name = name[: -len(f" CIK {cik}")]
+        target_directory = directories.path(cik, name)
+        for file_name in sorted(os.listdir(folder)):
+            target = os.path.join(target_directory, file_name)
+            if file_name == directories.marker or os.path.exists(target):
+                continue
+
+            with atomic_write(target) as temp_path:
+                shutil.copyfile(os.path.join(folder, file_name), temp_path)
+            merged += 1
+
+    return merged
+
+
+######
+
+# XBRL financial data
+# Every XBRL filing lists its instance document, which holds every fact of every statement, with a presentation
+# linkbase that says which concepts each report shows and in what order, and a label linkbase with their row labels.
+# These three files are requested in place of the R pages, and every report in FilingSummary.xml is rebuilt from them
+# as the same table an R page parses to, so classifying and saving the statements don't change. Reports the linkbases
+# don't cover, and filings that don't list the three files, fall back to their R pages.
+# The files are read with iterparse and every element is cleared once it has been read
+
+######
+
+xbrli_namespace = "{http://www.xbrl.org/2003/instance}"
+link_namespace = "{http://www.xbrl.org/2003/linkbase}"
+xlink_namespace = "{http://www.w3.org/1999/xlink}"
+xsi_nil = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+xml_lang = "{http://www.w3.org/XML/1998/namespace}lang"
+
+standard_label_role = "http://www.xbrl.org/2003/role/label"
+
+# Instances are named in many ways (aapl-20200926.xml, msft-10k_20200630_htm.xml, form10k_htm.xml), so any XML file
+# of the filing that isn't a linkbase, an R page of an early filing or the filing summary is taken as its instance
+not_instance_pattern = re.compile(
+    r"(.*_(cal|def|lab|pre|ref)|R\d+|FilingSummary|primary_doc)\.xml", re.IGNORECASE
+)
+
+# A period is kept as a column of a statement when at least this share of the best filled period's rows have a value
+# in it, so a concept that is also reported for other dates doesn't add a column of its own
+period_coverage = 0.25
+
+# A report is only rebuilt when at least this share of its rows have a value without dimensions, reports that are
+# mostly broken down by a dimension, such as many statements of equity, are read from their R page
+row_coverage = 0.5
+
+
+def xbrl_documents(content, base_url):
+    # URLs of the instance, presentation linkbase and label linkbase listed in a filing directory, None if any is missing
+    names = [file["name"] for file in content["directory"]["item"]]
+
+    instances = [
+        name
+        for name in names
+        if name.lower().endswith(".xml") and not not_instance_pattern.fullmatch(name)
+    ]
+    presentations = [name for name in names if name.lower().endswith("_pre.xml")]
+    labels = [name for name in names if name.lower().endswith("_lab.xml")]
+
+    if len(instances) == 0 or len(presentations) == 0 or len(labels) == 0:
+        return None
+
+    # Inline XBRL filings can list an instance of each kind, the one extracted by the SEC is read
+    instances.sort(key=lambda name: not name.lower().endswith("_htm.xml"))
+
+    folder = base_url + content["directory"]["name"] + "/"
+    return [folder + instances[0], folder + presentations[0], folder + labels[0]]
+
+
+def iter_elements(content, tag=None):
+    # Yields the elements of a document as they are closed, then frees them and everything read before them
+    for event, element in lxml.etree.iterparse(
+        io.BytesIO(content),
+        events=("end",),
+        tag=tag,
+        huge_tree=True,
+        remove_comments=True,
+    ):
+        yield element
+
+        parent = element.getparent()
+        if tag is not None or (parent is not None and parent.getparent() is None):
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def concept_name(href):
+    # ...us-gaap-2020-01-31.xsd#us-gaap_Assets -> Assets
+    return href.rsplit("#", 1)[-1].split("_", 1)[-1]
+
+
+def xbrl_date(text):
+    return datetime.date.fromisoformat(text.strip()[:10])
+
+
+def unit_kind(measures):
+    if len(measures) == 1 and measures[0].startswith("iso4217:"):
+        return "monetary"
+    if len(measures) == 1 and measures[0].endswith(":shares"):
+        return "shares"
+    return "other"
+
+
+def parse_instance(content):
+    # concept -> {period: (value, unit kind, decimals)} for every numeric fact whose context has no dimensions
+    # A period is (start date, end date), with no start date for an instant
+    periods = {}
+    units = {}
+    raw_facts = []
+
+    for element in iter_elements(content):
+        tag = element.tag
+        if not isinstance(tag, str):
+            continue
+
+        if tag == xbrli_namespace + "context":
+            # Facts broken down by a dimension belong to the notes and details, not the face of a statement
+            if (
+                element.find(".//" + xbrli_namespace + "segment") is None
+                and element.find(".//" + xbrli_namespace + "scenario") is None
+            ):
+                instant = element.findtext(".//" + xbrli_namespace + "instant")
+                if instant is not None:
+                    periods[element.get("id")] = (None, xbrl_date(instant))
+                else:
+                    periods[element.get("id")] = (
+                        xbrl_date(
+                            element.findtext(".//" + xbrli_namespace + "startDate")
+                        ),
+                        xbrl_date(
+                            element.findtext(".//" + xbrli_namespace + "endDate")
+                        ),
+                    )
+
+        elif tag == xbrli_namespace + "unit":
+            units[element.get("id")] = unit_kind(
+                [
+                    measure.text.strip()
+                    for measure in element.iter(xbrli_namespace + "measure")
+                ]
+            )
+
+        # Text facts have no unit
+        elif (
+            element.get("contextRef") is not None and element.get("unitRef") is not None
+        ):
+            if element.get(xsi_nil) == "true" or element.text is None:
+                continue
+            try:
+                value = float(element.text.strip())
+            except ValueError:
+                continue
+
+            decimals = element.get("decimals", "INF")
+            raw_facts.append(
+                (
+                    lxml.etree.QName(tag).localname,
+                    element.get("contextRef"),
+                    element.get("unitRef"),
+                    0 if decimals == "INF" else int(decimals),
+                    value,
+                )
+            )
+
+    # Contexts and units can come after the facts that use them, so facts are only resolved once everything is read
+    facts = {}
+    for concept, context, unit, decimals, value in raw_facts:
+        if context in periods:
+            facts.setdefault(concept, {}).setdefault(
+                periods[context], (value, units.get(unit, "other"), decimals)
+            )
+
+    return facts
+
+
+def parse_presentation(content):
+    # role -> [(concept, preferred label role)] in the order the report shows them
+    roles = {}
+
+    for element in iter_elements(content, tag=link_namespace + "presentationLink"):
+        locators = {}
+        children = collections.defaultdict(list)
+        targets = set()
+
+        for child in element:
+            if child.tag == link_namespace + "loc":
+                locators[child.get(xlink_namespace + "label")] = concept_name(
+                    child.get(xlink_namespace + "href")
+                )
+            elif child.tag == link_namespace + "presentationArc":
+                target = child.get(xlink_namespace + "to")
+                children[child.get(xlink_namespace + "from")].append(
+                    (
+                        float(child.get("order") or 0),
+                        target,
+                        child.get("preferredLabel"),
+                    )
+                )
+                targets.add(target)
+
+        # Depth first from every root, children in the order of their arcs
+        rows = roles.setdefault(element.get(xlink_namespace + "role"), [])
+        stack = [
+            (label, None)
+            for label in reversed(list(locators))
+            if label not in targets and label in children
+        ]
+        seen = set()
+        while stack:
+            label, preferred = stack.pop()
+            if label in seen or label not in locators:
+                continue
+            seen.add(label)
+
+            rows.append((locators[label], preferred))
+            for order, target, target_preferred in sorted(
+                children[label], key=lambda arc: arc[0], reverse=True
+            ):
+                stack.append((target, target_preferred))
+
+    return roles
+
+
+def parse_labels(content):
+    # concept -> {label role: text}, English labels first
+    labels = {}
+
+    for element in iter_elements(content, tag=link_namespace + "labelLink"):
+        locators = {}
+        resources = collections.defaultdict(list)
+        arcs = []
+
+        for child in element:
+            if child.tag == link_namespace + "loc":
+                locators[child.get(xlink_namespace + "label")] = concept_name(
+                    child.get(xlink_namespace + "href")
+                )
+            elif child.tag == link_namespace + "label":
+                resources[child.get(xlink_namespace + "label")].append(
+                    (
+                        not child.get(xml_lang, "en").lower().startswith("en"),
+                        child.get(xlink_namespace + "role", standard_label_role),
+                        " ".join((child.text or "").split()),
+                    )
+                )
+            elif child.tag == link_namespace + "labelArc":
+                arcs.append(
+                    (
+                        child.get(xlink_namespace + "from"),
+                        child.get(xlink_namespace + "to"),
+                    )
+                )
+
+        for source, target in arcs:
+            if source not in locators:
+                continue
+            concept_labels = labels.setdefault(locators[source], {})
+            for foreign, role, text in sorted(resources.get(target, [])):
+                concept_labels.setdefault(role, text)
+
+    return labels
+
+
+def period_label(period):
+    # The end date as the R pages head their columns, e.g. "Sep. 26, 2020"
+    end = period[1]
+    month = end.strftime("%b")
+    return f"{month}{'' if month == 'May' else '.'} {end.day}, {end.year}"
+
+
+def period_duration(period):
+    # "3 Months Ended" as the R pages head the columns of a duration, blank for an instant
+    start, end = period
+    if start is None:
+        return ""
+    return f"{round((end - start).days / (365.25 / 12))} Months Ended"
+
+
+def period_order(period):
+    # Durations first, shortest first, then instants, latest first within each
+    start, end = period
+    length = (end - start).days if start is not None else math.inf
+    return (length, -end.toordinal())
+
+
+def xbrl_table(title, rows, facts, labels):
+    # Builds the table an R page of the report would parse to: the periods are headed by their end dates, under a
+    # header row of their durations unless they are all instants
+    statement_data = {"headers": [], "sections": [], "data": []}
+
+    counts = collections.Counter(
+        period for concept, preferred in rows for period in facts.get(concept, {})
+    )
+    if len(counts) == 0:
+        return statement_data
+
+    most = max(counts.values())
+    periods = sorted(
+        (period for period, count in counts.items() if count >= most * period_coverage),
+        key=period_order,
+    )
+
+    # Amounts and share counts are shown in the scale they were reported to, as the R pages show them "in Millions"
+    scales = {}
+    for kind in ("monetary", "shares"):
+        decimals = collections.Counter(
+            fact[2]
+            for concept, preferred in rows
+            for period, fact in facts.get(concept, {}).items()
+            if fact[1] == kind and period in periods
+        )
+        if len(decimals) != 0 and decimals.most_common(1)[0][0] <= -3:
+            scales[kind] = 10 ** -decimals.most_common(1)[0][0]
+
+    durations = [period_duration(period) for period in periods]
+    if any(durations):
+        statement_data["headers"].append([title] + durations)
+        statement_data["headers"].append([period_label(period) for period in periods])
+    else:
+        statement_data["headers"].append(
+            [title] + [period_label(period) for period in periods]
+        )
+
+    for concept, preferred in rows:
+        concept_facts = facts.get(concept, {})
+        concept_labels = labels.get(concept, {})
+        label = (
+            concept_labels.get(preferred)
+            or concept_labels.get(standard_label_role)
+            or concept
+        )
+
+        cells = []
+        for period in periods:
+            if period not in concept_facts:
+                cells.append("")
+                continue
+
+            value, kind, decimals = concept_facts[period]
+            # Negated labels show the value with its sign flipped, e.g. "Payments for repurchase of common stock"
+            if preferred is not None and "negated" in preferred.lower():
+                value = -value
+            cells.append(repr(value / scales.get(kind, 1)))
+
+        if any(cells):
+            statement_data["data"].append([label] + cells)
+        elif concept.endswith("Abstract"):
+            statement_data["sections"].append(label)
+
+    return statement_data
+
+
+def xbrl_tables(master_reports, instance, presentation, labels):
+    # {report index: table} for every report of the filing the presentation linkbase covers and the instance fills
+    facts = parse_instance(instance)
+    roles = parse_presentation(presentation)
+    labels = parse_labels(labels)
+
+    tables = {}
+    for index, report in enumerate(master_reports):
+        if report.get("role") in roles:
+            rows = roles[report["role"]]
+            table = xbrl_table(report["name_short"], rows, facts, labels)
+
+            concepts = [
+                concept
+                for concept, preferred in rows
+                if not concept.endswith("Abstract")
+            ]
+            if (
+                len(table["data"]) != 0
+                and len(table["data"]) >= len(concepts) * row_coverage
+            ):
+                tables[index] = table
+
+    return tables
+
+
+######
+
+# Filing pipeline
+# Each filing goes through three stages that run at the same time on different filings:
+#   fetch   - threads request the filing listing, FilingSummary.xml and the R pages the classifier will need
+#   process - a pool of processes (one per core) parses the R pages, scores them and builds the statements
+#   write   - a single thread saves the statements and journals the filing
+# The number of filings between the first and last stage is capped, so memory stays bounded however fast each stage is
+
+######
+
+# Scorer and header words of each process in the pool, set up once when the process starts
+worker_scorer = None
+worker_header_tokens = None
+
+
+def filing_summary_url(content, base_url):
+    # The filing summary url can be used to add terms to the dictionary in the event that a document cannot be found
+    xml_summary = ""
+
+    for file in content["directory"]["item"]:
+        if file["name"] == "FilingSummary.xml":
+            xml_summary = base_url + content["directory"]["name"] + "/" + file["name"]
+
+    return xml_summary
+
+
+def parse_filing_summary(content, base_url_hold):
+    # Content parsed
+    soup = bs4.BeautifulSoup(content, "lxml")
+
+    # The 'myreports' tag contains all the individual reports submitted
+    reports = soup.find("myreports")
+
+    if reports is None:
+        return None
+
+    # A master list of components is created
+    master_reports = []
+
+    # Each 'myreports' tag reports iterated through
+    # Based on the SEC website structure, the last item is avoided
+    for report in reports.find_all("report")[:-1]:
+
+        # Dictionary for relevant parts created
+        report_dict = {}
+        report_dict["name_short"] = report.shortname.text
+        report_dict["name_long"] = report.longname.text
+        report_dict["position"] = report.position.text
+        # Early XBRL filings don't have a menu category
+        report_dict["category"] = (
+            report.menucategory.text if report.menucategory else ""
+        )
+        # Role of the report in the XBRL presentation linkbase
+        report_dict["role"] = report.role.text.strip() if report.role else ""
+        report_dict["url"] = base_url_hold + report.htmlfilename.text
+
+        # Each dictionary is appended to the master list
+        master_reports.append(report_dict)
+
+    return master_reports
+
+
+def init_filing_worker(default_terms, header_tokens):
+    global worker_scorer, worker_header_tokens
+
+    # Ctrl+C is handled by the main process, which lets the pool finish the filings in progress
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    worker_scorer = BigramScorer(default_terms)
+    worker_header_tokens = header_tokens
+
+
+def process_filing(master_reports, pages, xbrl=None, tables=None, failed=()):
+    # Runs in the process pool: classifies the reports of a filing and parses the matched statements
+    # If the classifier needs R pages that weren't downloaded, their indices are handed back instead
+    # The reports rebuilt from the XBRL files are handed back with them, so they are only built once
+    # 'failed' holds the reports whose R pages couldn't be requested and are empty in 'pages'
+    start = time.perf_counter()
+    if xbrl is not None:
+        try:
+            tables = xbrl_tables(master_reports, *xbrl)
+        except Exception as error:
+            log_event(
+                logging.WARNING,
+                "XBRL files could not be read, R pages are used",
+                error=str(error),
+            )
+            tables = {}
+
+    classifier = ReportClassifier(
+        master_reports, worker_scorer, worker_header_tokens, pages, tables
+    )
+
+    # Timings are handed back with the result, the metrics are kept in the main process
+    # A filing whose pages can't be classified or parsed is handed back as unparseable, anything raised out of this
+    # function is a failure of the pool rather than of the filing
+    try:
+        matches = classifier.classify_all()
+    except MissingPages as missing:
+        return {"status": "need", "indices": missing.indices, "tables": tables}
+    except Exception as error:
+        if len(failed) != 0:
+            return {"status": "incomplete", "error": str(error)}
+        return {"status": "unparseable", "error": str(error)}
+    classify_seconds = time.perf_counter() - start
+
+    # A missing page of a report that was matched, or that could have been, leaves the filing to the next run
+    failed_pages = sorted(set(failed) & classifier.considered)
+    if len(failed_pages) != 0:
+        return {
+            "status": "incomplete",
+            "error": f"R pages of reports {failed_pages} could not be requested",
+        }
+
+    # List to hold URLs initialsed
+    statements_url = []
+    statements_tier = []
+    statements_data = []
+    short_names = []
+
+    for url_hold, tier in matches:
+        statements_tier.append(tier)
+
+        if url_hold == "No match found":
+            statements_url.append(url_hold)
+            statements_data.append(url_hold)
+            short_names.append(None)
+        else:
+            try:
+                statements_data.append(classifier.statement(url_hold))
+            except Exception as error:
+                return {"status": "unparseable", "error": str(error)}
+            statements_url.append(url_hold["url"])
+            short_names.append(clean_report_name(url_hold["name_short"]))
+
+    return {
+        "status": "done",
+        "statements_url": statements_url,
+        "statements_tier": statements_tier,
+        "statements_data": statements_data,
+        "short_names": short_names,
+        "pages_fetched": len(pages),
+        # Matched statements are built from the R pages already downloaded for classifying,
+        # none of them is requested again and a page parsed while scoring isn't parsed again
+        "fetches_avoided": classifier.fetches_avoided,
+        "parses_avoided": classifier.parses_avoided,
+        "pages_parsed": len(classifier.tables) - len(classifier.xbrl_indices),
+        "xbrl_statements": sum(
+            url != "No match found"
+            and master_reports.index(report) in classifier.xbrl_indices
+            for (report, tier), url in zip(matches, statements_url)
+        ),
+        "classify_seconds": classify_seconds,
+        "statements_seconds": time.perf_counter() - start - classify_seconds,
+    }
+
+
+class FilingPipeline:
+    def __init__(
+        self,
+        form,
+        filings,
+        base_url,
+        scraped_list,
+        default_terms,
+        headers,
+        header_tokens,
+        journal,
+        workers=None,
+        fetch_workers=8,
+    ):
+        self.form = form
+        self.companies = filings.companies
+        self.base_url = base_url
+        self.scraped_list = scraped_list
+        self.headers = headers
+        self.header_tokens = header_tokens
+        self.journal = journal
+
+        # Statements are saved by a writer thread of their own, filings are only journaled once they are on disk
+        if output_format == "parquet":
+            store = StatementStore(output_directory)
+        else:
+            store = CsvStore(
+                data_directory,
+                dict(
+                    zip(self.companies["cik"].tolist(), self.companies["name"].tolist())
+                ),
+            )
+        self.writer = StatementWriter(store, journal)
+
+        self.workers = workers or os.cpu_count() or 1
+        self.fetch_workers = fetch_workers
+
+        # Running totals reported at the end of the run
+        self.counters = collections.Counter()
+
+        # Every filing holds a slot from when it is queued for fetching until it has been handed to the writer
+        self.max_in_flight = 2 * (self.workers + self.fetch_workers)
+        self.slots = threading.Semaphore(self.max_in_flight)
+
+        # Filings to fetch, and filings that need more R pages, which are fetched first
+        self.fetch_queue = queue.Queue()
+        self.refetch_queue = queue.Queue()
+        self.write_queue = queue.Queue()
+
+        # Set once a worker process dies, the run is then stopped as no filing can be processed any more
+        self.pool_broken = threading.Event()
+
+        for name in worker_modules:
+            importlib.import_module(name)
+
+        # Header words are computed in the main process so every worker uses the same ones
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_filing_worker,
+            initargs=(default_terms, header_tokens),
+        )
+
+    def run(self, pending):
+        fetchers = [
+            threading.Thread(target=self.fetch_stage, daemon=True)
+            for _ in range(self.fetch_workers)
+        ]
+        writer = threading.Thread(target=self.write_stage, daemon=True)
+
+        for thread in fetchers + [writer]:
+            thread.start()
+
+        # Each filing is queued as its row of the index, the fetch stage makes its URL
+        rows = zip(
+            pending.cik.tolist(),
+            pending.accession.tolist(),
+            pending.date_filed.tolist(),
+            pending.company_position(pending.cik).tolist(),
+        )
+
+        try:
+            for cik, accession, date_filed, company in rows:
+
+                # On SIGINT/SIGTERM no new filings are started, those already in the pipeline are finished and journaled
+                if stop_requested.is_set():
+                    progress_logger.warning(
+                        "Stop requested, the run can be resumed from the journal"
+                    )
+                    break
+                if self.pool_broken.is_set():
+                    break
+
+                self.slots.acquire()
+                self.fetch_queue.put(
+                    {
+                        "cik": cik,
+                        "accession": accession,
+                        "date_filed": date_filed,
+                        "company": company,
+                    }
+                )
+
+            # Once every slot is free again, every filing has been written
+            for _ in range(self.max_in_flight):
+                self.slots.acquire()
+        finally:
+            for _ in fetchers:
+                self.fetch_queue.put(None)
+            self.write_queue.put(None)
+
+            for thread in fetchers + [writer]:
+                thread.join()
+            self.pool.shutdown()
+
+            # Everything still buffered is written and journaled
+            self.writer.close()
+
+            progress_logger.info(
+                f"{self.counters['fetches_avoided']} statement requests and "
+                f"{self.counters['parses_avoided']} statement parses avoided"
+            )
+
+        # The filings that were in progress aren't journaled, so the next run does them again
+        if self.pool_broken.is_set():
+            raise RuntimeError(
+                "A worker process died and the run was stopped, "
+                "it can be resumed from the journal"
+            )
+
+    def next_job(self):
+        # Filings waiting for more R pages go first, they are holding a slot
+        while True:
+            try:
+                return self.refetch_queue.get_nowait()
+            except queue.Empty:
+                pass
+
+            try:
+                return self.fetch_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def fetch_stage(self):
+        while True:
+            job = self.next_job()
+            if job is None:
+                return
+
+            # Whatever goes wrong, the filing reaches the write stage, which frees its slot
+            try:
+                if "master_reports" in job:
+                    self.fetch_pages(job, job["needed"])
+                else:
+                    if not self.fetch_filing(job):
+                        continue
+                self.submit(job)
+            except Exception as error:
+                self.failed(job, error)
+
+    def fetch_filing(self, job):
+        filing = job["filing"] = filing_url(job["cik"], job["accession"])
+        log_event(logging.DEBUG, "Filing requested", filing=filing)
+
+        # URL requested and json format retrieved
+        listing = get_fetcher().get_json(filing)
+        xml_summary = filing_summary_url(listing, self.base_url)
+        base_url_hold = xml_summary.replace("FilingSummary.xml", "")
 
-                # Statement for a regular row and a section but not a table header
-                elif len(row.find_all("th")) == 0 and len(row.find_all("strong")) != 0:
-                    sec_row = cols[0].text.strip()
-                    statement_data["sections"].append(sec_row)
+        try:
+            # Content requested
+            content = get_fetcher().get(xml_summary) if xml_summary else None
+        except FetchError as error:
+            # Only a page that isn't there is journaled as missing, anything else is tried again on the next run
+            if error.status != 404:
+                raise
+            content = None
+
+        if content is None:
+            log_event(
+                logging.INFO, "Filing has no FilingSummary.xml page", filing=filing
+            )
+            self.write_queue.put(dict(job, status="no_filing_summary"))
+            return False
 
-                # Statement if none of the above are recognised, therefore it's a table header
-                elif len(row.find_all("th")) != 0:
-                    hed_row = [ele.text.strip() for ele in row.find_all("th")]
-                    statement_data["headers"].append(hed_row)
+        job["master_reports"] = parse_filing_summary(content, base_url_hold)
 
-                else:
-                    print("We encountered an error.")
+        if job["master_reports"] is None:
+            log_event(
+                logging.INFO, "FilingSummary.xml page has no reports", filing=filing
+            )
+            self.write_queue.put(dict(job, status="unparseable"))
+            return False
+
+        job["pages"] = {}
+
+        # Where the filing has its XBRL files they are requested in place of the R pages, any R page still needed for
+        # a report they don't cover is requested once the process stage asks for it
+        documents = (
+            xbrl_documents(listing, self.base_url)
+            if statement_source == "xbrl"
+            else None
+        )
+        if documents is not None and any(
+            report["role"] for report in job["master_reports"]
+        ):
+            contents = get_fetcher().get_many(documents)
+            if not any(isinstance(content, Exception) for content in contents):
+                job["xbrl"] = contents
+                return True
+            log_event(
+                logging.WARNING,
+                "XBRL files could not be requested, R pages are used",
+                filing=filing,
+            )
 
-            # Grab the proper components
+        # The R pages every header is likely to need are downloaded together
+        # Only the report names are needed for that, so no scorer is given to the classifier here
+        classifier = ReportClassifier(job["master_reports"], None, self.header_tokens)
+        self.fetch_pages(job, classifier.first_pages())
+        return True
+
+    def fetch_pages(self, job, indices):
+        urls = [job["master_reports"][i]["url"] for i in indices]
+
+        for index, content in zip(indices, get_fetcher().get_many(urls)):
+            # A page that still fails after its retries is scored as an empty page, within the filing's failure budget
+            # The filing is only finished if none of these reports turns out to matter for a match
+            if isinstance(content, Exception):
+                job.setdefault("failed_pages", []).append(index)
+                content = b""
+            job["pages"][index] = content
+
+        # Past the budget the filing is left out of the journal, so the next run tries it again
+        failures = len(job.get("failed_pages", []))
+        if failures > filing_failure_budget:
+            metrics.count("failure_budget_exhausted")
+            raise RuntimeError(f"{failures} R pages could not be requested")
+
+    def submit(self, job):
+        future = self.pool.submit(
+            process_filing,
+            job["master_reports"],
+            job["pages"],
+            job.pop("xbrl", None),
+            job.get("tables"),
+            job.get("failed_pages", ()),
+        )
+        future.add_done_callback(lambda future: self.processed(job, future))
+
+    def processed(self, job, future):
+        # process_filing hands back a filing it can't parse as a result, an exception here comes from the pool
+        try:
+            result = future.result()
+        except Exception as error:
+            self.failed(job, error)
+            return
+
+        if result["status"] == "need":
+            job["needed"] = result["indices"]
+            job["tables"] = result["tables"]
+            self.refetch_queue.put(job)
+        else:
+            self.write_queue.put(dict(job, **result))
+
+    def failed(self, job, error):
+        # Filings that fail for reasons other than their content are left out of the journal and tried again
+        if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+            if not self.pool_broken.is_set():
+                log_event(
+                    logging.ERROR,
+                    "Process pool broke, stopping the run",
+                    error=str(error),
+                )
+            self.pool_broken.set()
+        self.write_queue.put(dict(job, status="error", error=str(error)))
 
-            if len(statement_data["headers"]) == 1:
-                index_num = 1
-            elif len(statement_data["headers"]) == 2:
-                index_num = 0
+    def write_stage(self):
+        while True:
+            job = self.write_queue.get()
+            if job is None:
+                return
+
+            try:
+                self.write(job)
+            except Exception as error:
+                log_event(
+                    logging.ERROR,
+                    "Filing could not be saved",
+                    filing=job["filing"],
+                    error=str(error),
+                )
+            finally:
+                metrics.count("filings", label=job["status"])
+                metrics.advance()
+                self.slots.release()
+
+    def write(self, job):
+        filing = job["filing"]
+
+        # A filing that couldn't be requested or processed isn't journaled, so it is tried again on the next run
+        if job["status"] == "error":
+            log_event(
+                logging.WARNING,
+                "Filing could not be scraped",
+                filing=filing,
+                error=job["error"],
+            )
+            return
+
+        # Unparseable filings are final, incomplete ones are journaled but done again on the next run
+        if job["status"] != "done":
+            if "error" in job:
+                log_event(
+                    logging.WARNING,
+                    "Filing not finished",
+                    filing=filing,
+                    status=job["status"],
+                    error=job["error"],
+                )
+                self.journal.record(filing, job["status"], error=job["error"])
             else:
-                pass
+                self.journal.record(filing, job["status"])
+            return
+
+        log_event(
+            logging.INFO,
+            "Filing classified",
+            filing=filing,
+            statements=job["statements_url"],
+            tiers=job["statements_tier"],
+            pages_fetched=job["pages_fetched"],
+            pages_parsed=job["pages_parsed"],
+            xbrl_statements=job["xbrl_statements"],
+            reports=len(job["master_reports"]),
+            classify_seconds=round(job["classify_seconds"], 4),
+        )
+
+        metrics.observe("classify_seconds", job["classify_seconds"])
+        metrics.observe("statements_seconds", job["statements_seconds"])
+        metrics.observe(
+            "r_pages_parsed_per_filing", job["pages_parsed"], buckets=count_buckets
+        )
+        metrics.count("r_pages_parsed", job["pages_parsed"])
+        metrics.count("xbrl_statements", job["xbrl_statements"])
+        for url, tier in zip(job["statements_url"], job["statements_tier"]):
+            metrics.count(
+                "statements", label="no_match" if url == "No match found" else "matched"
+            )
+            metrics.count("statement_tiers", label=tier)
+
+        self.counters["fetches_avoided"] += job["fetches_avoided"]
+        self.counters["parses_avoided"] += job["parses_avoided"]
+
+        for header_num, short_name in enumerate(job["short_names"]):
+            # The name of the matched report is kept for the scraped filing names list
+            if (
+                short_name is not None
+                and short_name not in self.scraped_list[header_num]
+            ):
+                self.scraped_list[header_num].append(short_name)
+
+        # Cells of each matched statement that held something other than a number, and were left blank
+        failed_cells = {
+            header: statement.failed_cells
+            for header, statement in zip(self.headers, job["statements_data"])
+            if statement != "No match found"
+        }
+        metrics.count("failed_cells", sum(failed_cells.values()))
+
+        details = {
+            "statements": {
+                header: "no_match" if url == "No match found" else "matched"
+                for header, url in zip(self.headers, job["statements_url"])
+            },
+            "tiers": dict(zip(self.headers, job["statements_tier"])),
+            "failed_cells": failed_cells,
+        }
+
+        # The filing date and the company's row in the company table come from the filing index
+        cik = job["cik"]
+        sic = self.companies["sic"][job["company"]]
+        filing_date = job["date_filed"].strftime("%Y%m%d")
+        accession = filing_accession(filing)
+        statements = [
+            (statement, header, self.form, cik, sic, filing_date, accession)
+            for header, statement in zip(self.headers, job["statements_data"])
+            if statement != "No match found"
+        ]
+        self.writer.put(filing, statements, details)
 
-            doc_header = statement_data["headers"][(len(statement_data["headers"]) - 1)]
-            doc_data = statement_data["data"]
 
-            # Data is converted into a dataframe
-            doc_df = pd.DataFrame(doc_data)
+def parse_filings(
+    form,
+    term_list,
+    filings,
+    base_url,
+    scraped_list,
+    default_terms,
+    headers,
+    workers=None,
+    fetch_workers=8,
+):
+    # Distinctive words of each header's names, used to classify reports by their FilingSummary names
+    header_tokens = metadata_tokens(headers, term_list)
+
+    # Filings finished in an earlier run are taken out before anything is requested
+    journal = ScrapeJournal(journal_path)
+    completed = journal.completed()
+    if merged_journal_path is not None:
+        completed |= {
+            entry["accession"]
+            for entry in read_journal(merged_journal_path)
+            if entry.get("status") in final_statuses
+        }
+    pending = plan_filings(filings, form, completed)
+    progress_logger.info(
+        f"{len(pd.unique(pending.cik))} companies, {len(pending)} filings to scrape"
+    )
+
+    metrics.plan(len(pending))
+    reporter = MetricsReporter(metrics, metrics_path, metrics_interval)
+    previous_handlers = install_stop_handlers()
+
+    try:
+        pipeline = FilingPipeline(
+            form,
+            filings,
+            base_url,
+            scraped_list,
+            default_terms,
+            headers,
+            header_tokens,
+            journal,
+            workers,
+            fetch_workers,
+        )
+        pipeline.run(pending)
+    finally:
+        restore_stop_handlers(previous_handlers)
+        reporter.stop()
+        journal.close()
+
+    return scraped_list
+
 
-            # Define the Index column, rename it, and we need to make sure to drop the old column once we reindex.
-            doc_df.index = doc_df[0]
-            doc_df.index.name = "Category"
-            doc_df = doc_df.drop(0, axis=1)
+######
+
+# Reference implementations
+# save_data, best_fit_url and list_average are the one-filing-at-a-time code the pipeline replaced. Nothing in the
+# scraper calls them any more, they are kept only as the baseline the benchmarks in Benchmarks/ compare the pipeline
+# with (run_benchmarks.py and bench_scoring.py)
+
+######
+
+
+def save_data(
+    filing_name,
+    statements_data,
+    com_files,
+    term_date,
+    company,
+    filing,
+    headers,
+    filing_date=None,
+):
+    # Saves the matched statements of one filing as CSV files straight away, the pipeline saves through a
+    # StatementWriter instead. The filing date can be handed in, otherwise it is looked up in com_files
+    if filing_date is None:
+        filing_date = com_files.at[company, term_date][
+            com_files.at[company, filing_name].index(filing)
+        ]
 
-            # Get rid of the '$', '(', ')', and convert the '' to NaNs.
-            doc_df = (
-                doc_df.replace("[\$,)%]", "", regex=True)
-                .replace("[(]", "-", regex=True)
-                .replace("", "NaN", regex=True)
-                .replace("\[", "", regex=True)
-                .replace("\]", "", regex=True)
+    form = next(
+        (form for form, (files, dates) in form_columns.items() if files == filing_name),
+        filing_name,
+    )
+    cik = com_files.at[company, "CIK"]
+    store = CsvStore(data_directory, {cik: com_files.at[company, "Name"]})
+
+    for header, statement in zip(headers, statements_data):
+        if statement != "No match found":
+
+            # Tables that haven't been converted yet are turned into a Statement here
+            if not isinstance(statement, Statement):
+                statement = Statement.from_table(statement)
+
+            store.add(
+                statement,
+                header,
+                form,
+                cik,
+                com_files.at[company, "SIC"][0],
+                filing_date,
+                filing_accession(filing),
             )
-        except:
-            print("We have encountered an error while looking for 'tr' in code")
-        # Strings are converted into floats
-        # If there is an error, the document check is skipped
+    store.flush()
 
-        try:
-            doc_df = doc_df.astype(float)
-            exception = 0
-        except:
-            exception = 1
-            # print("Exception")
 
-        # Column header names inserted
-        if len(doc_df.columns) == len(doc_header[index_num:]):
-            doc_df.columns = doc_header[index_num:]
+def best_fit_url(master_reports, default_list):
+    # Returns the best fit report together with its parsed statement, so the R page never has to be requested again
+
+    # Hold values initialised
+    match_values = []
+    parsed = []
+
+    # print("These are the master reports")
+    # print(master_reports)
+    # print(len(master_reports))
+
+    # The R pages are requested a few at a time ahead of the scoring, whatever is still running is dropped once a match is found
+    prefetch = get_fetcher().iter_many([report["url"] for report in master_reports])
+
+    # Loop through each statement url
+    for statement, (url, prefetched) in zip(master_reports, prefetch):
+        # print("This is the statement")
+        # print(statement)
 
-        # This loop is to convert the pandas index format (all the terms found in that report) into a list.
-        # The loop also cleans the list, ensuring that no punctuation is in the final list and all the terms are in lower case.
+        # The fetcher has already retried the page, one that still fails is scored as an empty page
+        content1 = prefetched
+        if isinstance(prefetched, Exception):
+            log_event(
+                logging.WARNING,
+                "R page could not be requested",
+                url=url,
+                error=str(prefetched),
+            )
+            content1 = b""
 
-        category_hold = []
-        for i in range(0, len(doc_df.index)):
-            category_hold.append(doc_df.index[i])
+        # All rows found and parsed
+        # The row labels are all the terms found in that report
+        try:
+            statement_parsed = Statement.from_table(parse_report_table(content1))
+            category_hold = statement_parsed.labels
+        except:
+            log_event(
+                logging.WARNING,
+                "R page table could not be parsed",
+                url=statement["url"],
+            )
+            statement_parsed = "No match found"
+            category_hold = []
+        parsed.append(statement_parsed)
 
+        # The list is cleaned, ensuring that no punctuation is in the final list and all the terms are in lower case.
         category_hold = [x.lower() for x in category_hold]
         category_hold = [
             "".join(c for c in s if c not in string.punctuation) for s in category_hold
@@ -837,20 +3797,19 @@ def best_fit_url(master_reports, default_list):
 
         # This new sections returns the first match that meets the threshold of > 2
         if list_average_calc > 2:
-            print(list_average_calc)
-            output = master_reports[match_values.index(list_average_calc)]
-            return output
+            match = match_values.index(list_average_calc)
+            prefetch.close()
+            return master_reports[match], parsed[match]
 
     # print("Values for each master report given: ")
     # print(default_list[0])
     # print(match_values)
 
     if sum(match_values) == 0 or max(match_values) < 2:
-        output = "No match found"
-    else:
-        output = master_reports[match_values.index(max(match_values))]
+        return "No match found", "No match found"
 
-    return output
+    match = match_values.index(max(match_values))
+    return master_reports[match], parsed[match]
 
 
 # def word2vec(word):
@@ -912,5 +3871,804 @@ def list_average(list_A, list_B):
     return cumulative_res
 
 
+######
+
+# Batch scoring
+# list_average compares every row label with every default term one pair at a time. The scorer below does the same
+# comparison for a whole filing at once: every row label of every report and every default term of every header are
+# turned into character bigram count vectors, and a single sparse matrix product gives the cosine of every pair.
+# The pairs over the threshold are then summed per (report, header), which is exactly what list_average returns
+
+######
+
+
+def bigram_list(x):
+    return [x[i] + x[i + 1] for i in range(0, len(x) - 1)]
+
+
+def clean_terms(terms):
+    # Same filtering as list_average, blank and single character terms can't form a bigram
+    return [x for x in terms if len(x) > 1]
+
+
+class BigramScorer:
+    def __init__(self, default_terms, threshold=0.80):
+        self.threshold = threshold
+        self.n_headers = len(default_terms)
+
+        # Bigram -> column number, it keeps growing as new bigrams are found in row labels
+        self.vocabulary = {}
+
+        terms = []
+        term_header = []
+        for header_num, term_list in enumerate(default_terms):
+            for term in clean_terms(term_list):
+                terms.append(term)
+                term_header.append(header_num)
+
+        self.terms = self.vectorize(terms)
+
+        # Maps each term row onto the header it belongs to
+        self.term_header = scipy.sparse.csr_matrix(
+            (np.ones(len(terms)), (np.arange(len(terms)), term_header)),
+            shape=(len(terms), self.n_headers),
+        )
+
+    def vectorize(self, words):
+        # Each word becomes a row of bigram counts scaled to unit length, so a dot product of two rows is their cosine
+        indices = []
+        indptr = [0]
+        for word in words:
+            for pair in bigram_list(word):
+                indices.append(self.vocabulary.setdefault(pair, len(self.vocabulary)))
+            indptr.append(len(indices))
+
+        matrix = scipy.sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(words), len(self.vocabulary)),
+        )
+        matrix.sum_duplicates()
+
+        lengths = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        lengths[lengths == 0] = 1
+        return scipy.sparse.diags(1 / lengths) @ matrix
+
+    def score(self, report_labels):
+        # report_labels holds the cleaned row labels of each report
+        # Returns an array of scores with a row for each report and a column for each header
+        labels = []
+        label_report = []
+        for report_num, label_list in enumerate(report_labels):
+            for label in clean_terms(label_list):
+                labels.append(label)
+                label_report.append(report_num)
+
+        if len(labels) == 0 or self.terms.shape[0] == 0:
+            return np.zeros((len(report_labels), self.n_headers))
+
+        label_matrix = self.vectorize(labels)
+
+        # Term vectors are widened to take in any bigrams that were only seen in the labels
+        terms = self.terms
+        terms.resize((terms.shape[0], len(self.vocabulary)))
+
+        # Cosine of every (label, term) pair, anything at or below the threshold doesn't count
+        cosines = (label_matrix @ terms.T).tocsr()
+        cosines.data[cosines.data <= self.threshold] = 0
+        cosines.eliminate_zeros()
+
+        label_report = scipy.sparse.csr_matrix(
+            (np.ones(len(labels)), (label_report, np.arange(len(labels)))),
+            shape=(len(report_labels), len(labels)),
+        )
+
+        return np.asarray((label_report @ cosines @ self.term_header).todense())
+
+
+def assign_reports(master_reports, scores, mode=None):
+    # Picks a report for every header in one step from an array of scores with a row for each report and a column
+    # for each header
+    #   "first" - the first report over 2, otherwise the best report if it reaches 2, the decision best_fit_url makes
+    #   "best"  - the best report if it reaches 2
+    mode = mode or assignment_mode
+    scores = np.asarray(scores, dtype=float)
+
+    if len(master_reports) == 0:
+        return ["No match found"] * (scores.shape[1] if scores.ndim == 2 else 0)
+
+    # Ties go to the earlier report
+    picks = scores.argmax(axis=0)
+    if mode == "first":
+        over = scores > 2
+        picks = np.where(over.any(axis=0), over.argmax(axis=0), picks)
+
+    found = scores.max(axis=0) >= 2
+    return [
+        master_reports[pick] if match else "No match found"
+        for pick, match in zip(picks, found)
+    ]
+
+
+def pick_best_fit(master_reports, match_values):
+    # The report picked for a single header from its list of scores
+    return assign_reports(master_reports, np.reshape(match_values, (-1, 1)))[0]
+
+
+def parse_report_table(content):
+    # Splits the first table of an R page into its header rows, section rows and data rows
+    # Rows are classified by their cells: any <th> makes it a header row, otherwise a <strong> in the label cell makes
+    # it a section row, anything else is a data row. Only the cells of each row are looked at, and the text of each
+    # cell is read in a single walk over it
+    # A dictionary is defined that will store the different parts of the statement
+    statement_data = {}
+    statement_data["headers"] = []
+    statement_data["sections"] = []
+    statement_data["data"] = []
+
+    if not content:
+        return statement_data
+
+    # R pages are generated by the SEC as UTF-8, so no time is spent guessing the character set
+    # Plain lxml elements are used, lxml.html looks up a Python class for every element it hands back
+    root = lxml.etree.fromstring(content, parser=report_parser())
+    table = root.find(".//table") if root is not None else None
+
+    if table is None:
+        return statement_data
+
+    # The text of a cell is serialised by lxml in a single pass over it
+    cell_text = functools.partial(
+        lxml.etree.tostring, method="text", encoding="unicode", with_tail=False
+    )
+
+    # All rows found and parsed
+    for row in table.iter("tr"):
+        ths = row.findall("th")
+
+        # Statement if a header cell is found, therefore it's a table header
+        # A cell heading several columns, such as "3 Months Ended", is repeated for each of them
+        if len(ths) != 0:
+            statement_data["headers"].append(
+                [
+                    text
+                    for ele in ths
+                    for text in [cell_text(ele).strip()] * header_span(ele)
+                ]
+            )
+            continue
+
+        tds = row.findall("td")
+
+        # Statement for a regular row and a section but not a table header
+        if len(tds) != 0 and tds[0].find(".//strong") is not None:
+            statement_data["sections"].append(cell_text(tds[0]).strip())
+
+        # Statement for a regular row and not section or table header
+        else:
+            statement_data["data"].append([cell_text(ele).strip() for ele in tds])
+
+    return statement_data
+
+
+def header_span(element):
+    try:
+        return max(int(element.get("colspan", 1)), 1)
+    except ValueError:
+        return 1
+
+
+def report_labels(statement_data):
+    # The row labels of a statement, lower case and without punctuation, as best_fit_url cleans them
+    labels = [row[0].lower() for row in statement_data["data"] if len(row) != 0]
+    return ["".join(c for c in s if c not in string.punctuation) for s in labels]
+
+
+def parse_reports(contents):
+    # Parses the table of every R page, pages that failed to download or parse give an empty table
+    tables = []
+    for content in contents:
+        if isinstance(content, Exception):
+            tables.append(parse_report_table(None))
+            continue
+
+        try:
+            tables.append(parse_report_table(content))
+        except Exception as error:
+            log_event(
+                logging.WARNING, "R page table could not be parsed", error=str(error)
+            )
+            tables.append(parse_report_table(None))
+
+    return tables
+
+
+def score_reports(reports, scorer, contents=None, tables=None):
+    # Every R page is requested together and parsed once, then scored against all headers at the same time
+    # Pages that have already been downloaded can be handed in as contents, or already parsed as tables
+    if tables is None:
+        if contents is None:
+            contents = get_fetcher().get_many([report["url"] for report in reports])
+        tables = parse_reports(contents)
+
+    return scorer.score([report_labels(table) for table in tables])
+
+
+######
+
+# Metadata classification
+# FilingSummary.xml already names every report and says which menu it sits in. For most filings a report called
+# "CONSOLIDATED BALANCE SHEETS" in the "Statements" menu is the balance sheet, so reports are classified from their
+# names first. R pages are only requested when the names are ambiguous, and then only for the reports whose names fit
+
+######
+
+# Words that appear in the name of nearly every statement and say nothing about which statement it is
+metadata_stopwords = {
+    "consolidated",
+    "consolidating",
+    "condensed",
+    "combined",
+    "statement",
+    "statements",
+    "of",
+    "and",
+    "the",
+    "in",
+    "for",
+    "unaudited",
+    "audited",
+    "interim",
+    "changes",
+    "usd",
+}
+
+# Other names used for the same statement, rewritten to the words used in the headers
+metadata_synonyms = {
+    "financial position": "balance sheet",
+    "financial condition": "balance sheet",
+    "shareholders": "stockholders",
+    "shareowners": "stockholders",
+    "earnings": "income",
+}
+
+
+def clean_report_name(name):
+    # Report names are cleaned the same way as the filing names lists
+    return "".join(c.lower() for c in name if c not in string.punctuation)
+
+
+def name_tokens(name):
+    # Punctuation is replaced by spaces so that "STOCKHOLDERS' (DEFICIT) EQUITY" splits into words
+    name = "".join(" " if c in string.punctuation else c for c in name.lower())
+    name = " ".join(name.split())
+
+    for phrase, replacement in metadata_synonyms.items():
+        name = name.replace(phrase, replacement)
+
+    tokens = set()
+    for word in name.split():
+        if word in metadata_stopwords or len(word) < 2:
+            continue
+
+        # Plurals are folded so "SHEETS" matches "Sheet" and "FLOWS" matches "Flows"
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+
+        tokens.add(word)
+    return tokens
+
+
+def metadata_tokens(headers, term_list):
+    # The distinctive words of each header name, together with the confirmed filing names for that header
+    header_tokens = []
+    for header_num, header in enumerate(headers):
+        tokens = name_tokens(header)
+        for name in term_list[header_num]:
+            tokens |= name_tokens(name)
+        header_tokens.append(tokens)
+    return header_tokens
+
+
+def metadata_score(report, tokens):
+    # Share of the distinctive words in the report name that belong to the header
+    # The long name looks like "0002 - Statement - CONSOLIDATED BALANCE SHEETS", the prefix is removed first
+    long_name = re.sub(r"^\s*\d+\s*-\s*[^-]*-\s*", "", report["name_long"])
+
+    score = 0
+    for name in (report["name_short"], long_name):
+        report_tokens = name_tokens(name)
+        if len(report_tokens) != 0:
+            score = max(score, len(report_tokens & tokens) / len(report_tokens))
+    return score
+
+
+class MissingPages(Exception):
+    # Raised when the classifier needs R pages it wasn't given, the caller downloads them and classifies again
+    def __init__(self, indices):
+        super().__init__(f"R pages {indices} have not been downloaded")
+        self.indices = indices
+
+
+class ReportClassifier:
+    # Classifies the reports of one filing in three tiers:
+    #   metadata - a single report in the Statements menu has a name that fully fits the header, no R page is needed
+    #   labels   - several reports have names that fit, only their R pages are requested and scored on row labels
+    #   full     - no name fits, every report in the Statements menu is scored, then every report in the filing
+    # R pages are requested as they are needed, unless the downloaded pages are handed in as {report index: content}
+    # Reports already built from the XBRL files are handed in as {report index: table} and need no R page
+    def __init__(self, master_reports, scorer, header_tokens, pages=None, tables=None):
+        self.master_reports = master_reports
+        self.scorer = scorer
+        self.pages = pages
+        self.n_headers = len(header_tokens)
+
+        self.name_scores = [
+            [metadata_score(report, tokens) for tokens in header_tokens]
+            for report in master_reports
+        ]
+
+        # Filings from before menu categories existed have every report searched as a statement
+        self.statements = [
+            index
+            for index, report in enumerate(master_reports)
+            if report["category"].lower() == "statements"
+        ] or list(range(len(master_reports)))
+
+        # Label scores of each report against every header, so no R page is requested twice in a filing
+        self.label_scores = {}
+
+        # Tables parsed while scoring are kept, a matched statement is built from them rather than parsed again
+        self.tables = dict(tables or {})
+        self.xbrl_indices = set(self.tables)
+        self.parsed_statements = {}
+        self.parses_avoided = 0
+
+        # Matched statements whose R page was downloaded while classifying, rather than requested for the statement
+        self.fetches_avoided = 0
+
+        # Every report that was in the running for a header, any of their pages could have changed a match
+        self.considered = set()
+
+    @property
+    def pages_fetched(self):
+        return len(self.label_scores)
+
+    def page_contents(self, indices):
+        if self.pages is None:
+            return get_fetcher().get_many(
+                [self.master_reports[i]["url"] for i in indices]
+            )
+
+        if any(index not in self.pages for index in indices):
+            raise MissingPages([i for i in indices if i not in self.pages])
+        return [self.pages[i] for i in indices]
+
+    def score_pages(self, indices):
+        # Reports are parsed and scored against every header the first time any header needs them
+        missing = [index for index in indices if index not in self.label_scores]
+
+        if len(missing) != 0:
+            unparsed = [index for index in missing if index not in self.tables]
+            if len(unparsed) != 0:
+                for index, table in zip(
+                    unparsed, parse_reports(self.page_contents(unparsed))
+                ):
+                    self.tables[index] = table
+
+            scores = score_reports(
+                [self.master_reports[i] for i in missing],
+                self.scorer,
+                tables=[self.tables[i] for i in missing],
+            )
+            for index, row in zip(missing, scores):
+                self.label_scores[index] = row
+
+    def best_by_labels(self, indices, header_num):
+        self.considered.update(indices)
+        self.score_pages(indices)
+
+        return pick_best_fit(
+            [self.master_reports[i] for i in indices],
+            [self.label_scores[i][header_num] for i in indices],
+        )
+
+    def metadata_match(self, header_num):
+        full_fits = [i for i in self.statements if self.name_scores[i][header_num] == 1]
+
+        # A single report whose name only fits this header decides it outright
+        if len(full_fits) == 1 and self.name_scores[full_fits[0]].count(1) == 1:
+            return full_fits[0], full_fits
+
+        return None, full_fits
+
+    def first_pages(self):
+        # The R pages the first tier of every header needs, they can all be downloaded before classifying
+        # This is the matched page for headers decided by metadata, otherwise the reports whose names fit
+        indices = set()
+        for header_num in range(self.n_headers):
+            index, full_fits = self.metadata_match(header_num)
+
+            if index is not None:
+                indices.add(index)
+            else:
+                indices.update(
+                    full_fits
+                    or [
+                        i
+                        for i in self.statements
+                        if self.name_scores[i][header_num] >= 0.5
+                    ]
+                    or self.statements
+                )
+        return sorted(indices)
+
+    def classify(self, header_num):
+        index, full_fits = self.metadata_match(header_num)
+
+        if index is not None:
+            self.considered.add(index)
+            return self.master_reports[index], "metadata"
+
+        partial_fits = full_fits or [
+            i for i in self.statements if self.name_scores[i][header_num] >= 0.5
+        ]
+
+        if len(partial_fits) != 0:
+            output = self.best_by_labels(partial_fits, header_num)
+            if output != "No match found":
+                return output, "labels"
+
+        # Statements menu first, then the whole filing
+        output = self.best_by_labels(self.statements, header_num)
+        if output == "No match found" and len(self.statements) != len(
+            self.master_reports
+        ):
+            output = self.best_by_labels(
+                list(range(len(self.master_reports))), header_num
+            )
+
+        return output, "full"
+
+    def classify_all(self):
+        # The candidates of every header are scored together in one pass before any header is decided, only headers
+        # that fall through to the full tier score more reports
+        self.score_pages(self.first_pages())
+
+        return [self.classify(header_num) for header_num in range(self.n_headers)]
+
+    def statement(self, report):
+        # The parsed statement of a matched report, a report matched by several headers is only converted once
+        index = self.master_reports.index(report)
+
+        # Statements built from the XBRL files never had an R page to reuse
+        reused = index not in self.xbrl_indices
+
+        if index in self.parsed_statements:
+            self.parses_avoided += 1
+            self.fetches_avoided += reused
+            return self.parsed_statements[index]
+
+        if index not in self.tables:
+            self.tables[index] = parse_reports(self.page_contents([index]))[0]
+        elif reused:
+            self.parses_avoided += 1
+            self.fetches_avoided += 1
+
+        self.parsed_statements[index] = Statement.from_table(self.tables[index])
+        return self.parsed_statements[index]
+
+
+######
+
+# Command line
+# Every stage can be run on its own: index brings the filing index up to date, sic looks up the SIC codes the index
+# is missing, scrape runs the pipeline, merge combines shard outputs, export writes the saved statements to a single
+# file and status reports progress. pandas, pyarrow and the rest are only imported by the stages that use them, so
+# status answers straight away
+#
+#   python "000 - SECScrape 6.1.py" index --first-year 2015 --last-year 2020
+#   python "000 - SECScrape 6.1.py" scrape --first-year 2020 --forms 10-K 10-Q --format csv
+#   python "000 - SECScrape 6.1.py" export statements.csv --forms 10-K --statements "Consolidated Balance Sheet"
+#   python "000 - SECScrape 6.1.py" status
+
+######
+
+
+def resolve_missing_sic(first_year, last_year):
+    # Looks up every company of the filing index that has no SIC code yet, e.g. after an index run with --no-sic
+    sic_store = SicStore(sic_database)
+    found = 0
+
+    for directory in index_directories(first_year, last_year):
+        if not filing_index_complete(directory):
+            continue
+
+        companies = read_arrow(os.path.join(directory, "companies.arrow")).to_pydict()
+        missing = {
+            cik for cik, sic in zip(companies["cik"], companies["sic"]) if sic == ""
+        }
+        if len(missing) == 0:
+            continue
+
+        # Any filing of a company has its SIC code in the header page, the first one of each company is used
+        sic_resolver = SicResolver(sic_store)
+        filings = load_filing_index(directory)
+        rows = np.flatnonzero(np.isin(filings.cik, list(missing)))
+        rows = rows[np.unique(filings.cik[rows], return_index=True)[1]]
+        for cik, file_url in zip(filings.cik[rows].tolist(), filings.file_urls(rows)):
+            sic_resolver.submit(cik, file_url)
+        sic_resolver.finish()
+
+        sic_codes = sic_store.get_many(missing)
+        companies["sic"] = [
+            sic_codes.get(cik, sic) if sic == "" else sic
+            for cik, sic in zip(companies["cik"], companies["sic"])
+        ]
+        write_arrow(
+            company_table(
+                list(zip(companies["cik"], companies["name"], companies["sic"]))
+            ),
+            os.path.join(directory, "companies.arrow"),
+        )
+
+        resolved = sum(1 for cik in missing if sic_codes.get(cik, "") != "")
+        found += resolved
+        progress_logger.info(
+            f"{directory}: {len(missing)} companies without a SIC code, "
+            f"{resolved} found"
+        )
+
+    sic_store.close()
+    return found
+
+
+def export_statements(
+    path, first_year=None, last_year=None, forms=None, statements=None
+):
+    # Writes the saved statements to one file, the format is taken from its extension: .parquet, .xlsx or .csv
+    filters = []
+    if first_year is not None:
+        filters.append(("year", ">=", first_year))
+    if last_year is not None:
+        filters.append(("year", "<=", last_year))
+    if forms:
+        filters.append(("form", "in", list(forms)))
+    if statements:
+        filters.append(("statement", "in", list(statements)))
+
+    frame = load_statements(filters=filters or None)
+
+    if path.endswith(".parquet"):
+        frame.to_parquet(path, index=False)
+    elif path.endswith(".xlsx"):
+        frame.to_excel(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+    progress_logger.info(f"{len(frame)} rows written to {path}")
+    return len(frame)
+
+
+def journal_counts(path):
+    # Number of filings in each status, a filing journaled more than once counts with its last status
+    statuses = {}
+    for entry in read_journal(path):
+        statuses[entry.get("accession")] = entry.get("status")
+    counts = {}
+    for status in statuses.values():
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+# Lines of the metrics file shown by status
+status_metrics = (
+    "filings_planned",
+    "filings_finished",
+    "filings_per_minute",
+    "eta_seconds",
+    "filings{",
+)
+
+
+def show_status():
+    # Progress of the scrape, read from the journal, manifest and metrics files alone
+    journals = [("scrape", journal_path)]
+    if os.path.exists(shards_directory):
+        journals += [
+            (name, os.path.join(shards_directory, name, "scrape_journal.jsonl"))
+            for name in sorted(os.listdir(shards_directory))
+            if name.startswith("shard-")
+        ]
+
+    for name, path in journals:
+        counts = journal_counts(path)
+        finished = sum(
+            value for status, value in counts.items() if status in final_statuses
+        )
+        details = ", ".join(
+            f"{status} {value}" for status, value in sorted(counts.items())
+        )
+        print(
+            f"{name}: {finished} filings finished"
+            + (f" ({details})" if details else "")
+        )
+
+    manifest = load_manifest(full_index_directory)
+    if manifest:
+        complete = sum(1 for quarter in manifest.values() if quarter.get("complete"))
+        filings = sum(quarter.get("filings", 0) for quarter in manifest.values())
+        fetched = max(quarter.get("fetched", "") for quarter in manifest.values())
+        print(
+            f"full index: {len(manifest)} quarters ({complete} complete, "
+            f"{min(manifest)} to {max(manifest)}), {filings} filings, "
+            f"last fetched {fetched}"
+        )
+    for name in sorted(os.listdir(os.getcwd())):
+        if name.startswith("filing_index_") and name != full_index_directory:
+            print(
+                f"{name}: {'complete' if filing_index_complete(name) else 'incomplete'}"
+            )
+
+    # Headline figures of the last or running scrape, the full set is in the metrics file
+    if os.path.exists(metrics_path):
+        age = time.time() - os.path.getmtime(metrics_path)
+        with open(metrics_path) as f:
+            lines = [line.rstrip() for line in f if line.startswith(status_metrics)]
+        print(f"metrics written {age:.0f}s ago: " + ", ".join(lines))
+
+
+def add_year_arguments(parser, default=None):
+    parser.add_argument(
+        "--first-year", type=int, default=default, help="first year of filings"
+    )
+    parser.add_argument(
+        "--last-year",
+        type=int,
+        help="last year of filings, the first year if not given",
+    )
+
+
+def year_range(args):
+    last_year = args.last_year if args.last_year is not None else args.first_year
+    if args.first_year is not None and last_year < args.first_year:
+        raise SystemExit(
+            f"--last-year {last_year} is before --first-year {args.first_year}"
+        )
+    return args.first_year, last_year
+
+
+def command_line(argv=None):
+    global index_source, output_format, output_directory, data_directory
+
+    this_year = datetime.date.today().year
+    parser = argparse.ArgumentParser(
+        description="Scrapes the financial statements of 10-K and 10-Q filings "
+        "from EDGAR"
+    )
+    parser.add_argument(
+        "--source",
+        choices=["full-index", "daily-index"],
+        default=index_source,
+        help="EDGAR index the filings come from",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    index_command = commands.add_parser(
+        "index", help="bring the filing index up to date"
+    )
+    add_year_arguments(index_command, this_year)
+    index_command.add_argument(
+        "--no-sic", action="store_true", help="leave the SIC codes to the sic command"
+    )
+
+    sic_command = commands.add_parser(
+        "sic", help="look up the SIC codes missing from the filing index"
+    )
+    add_year_arguments(sic_command, this_year)
+
+    scrape_command = commands.add_parser(
+        "scrape", help="scrape the statements of the filings in the index"
+    )
+    add_year_arguments(scrape_command, this_year)
+    scrape_command.add_argument(
+        "--forms", nargs="+", choices=list(form_columns), default=["10-K"]
+    )
+    scrape_command.add_argument(
+        "--output", help="directory the statements are saved in"
+    )
+    scrape_command.add_argument(
+        "--format", choices=["parquet", "csv"], default=output_format
+    )
+    scrape_command.add_argument(
+        "--shard", type=parse_shard, help="scrape shard <index>/<count> only, e.g. 0/8"
+    )
+    scrape_command.add_argument(
+        "--weighted", action="store_true", help="balance shards by number of filings"
+    )
+    scrape_command.add_argument(
+        "--workers",
+        type=int,
+        help="processes parsing filings, one per CPU if not given",
+    )
+    scrape_command.add_argument(
+        "--fetch-workers", type=int, default=8, help="threads requesting filings"
+    )
+    scrape_command.add_argument(
+        "--refresh-index",
+        action="store_true",
+        help="bring the filing index up to date before scraping",
+    )
+
+    merge_command = commands.add_parser(
+        "merge", help="merge shard outputs into the main dataset"
+    )
+    merge_command.add_argument(
+        "directories",
+        nargs="*",
+        metavar="directory",
+        help="shard directories, every shard in Shards if none are given",
+    )
+
+    export_command = commands.add_parser(
+        "export", help="write the saved statements to a .csv, .xlsx or .parquet file"
+    )
+    export_command.add_argument("path")
+    add_year_arguments(export_command)
+    export_command.add_argument("--forms", nargs="+", choices=list(form_columns))
+    export_command.add_argument(
+        "--statements",
+        nargs="+",
+        help="statement names, e.g. 'Consolidated Balance Sheet'",
+    )
+    export_command.add_argument(
+        "--output", help="directory the statements were saved in"
+    )
+
+    commands.add_parser("status", help="show the progress of the index and the scrape")
+
+    args = parser.parse_args(argv)
+    index_source = args.source
+
+    # Run without a command, the script scrapes as it always has
+    if args.command is None:
+        args = parser.parse_args(["--source", args.source, "scrape"])
+
+    if args.command == "status":
+        show_status()
+        return
+
+    # A scrape sets up logging itself, once it knows which shard it writes to
+    if args.command != "scrape":
+        configure_logging()
+
+    if args.command == "index":
+        refresh_index(*year_range(args), resolve_sic=not args.no_sic)
+    elif args.command == "sic":
+        resolve_missing_sic(*year_range(args))
+    elif args.command == "merge":
+        merge_shards(args.directories or None)
+    elif args.command == "export":
+        if args.output:
+            output_directory = os.path.abspath(args.output)
+        export_statements(
+            args.path, *year_range(args), forms=args.forms, statements=args.statements
+        )
+    elif args.command == "scrape":
+        output_format = args.format
+        if args.output:
+            output_directory = data_directory = os.path.abspath(args.output)
+        first_year, last_year = year_range(args)
+        main(
+            first_year,
+            last_year,
+            args.forms,
+            args.shard,
+            args.weighted,
+            args.workers,
+            args.fetch_workers,
+            args.refresh_index,
+        )
+
+
 if __name__ == "__main__":
-    main()
+    command_line()
@@ -0,0 +1,108 @@
+#########
+
+# Benchmark: loading the filing index and planning the scrape at start up
+# The Arrow filing index written by retrieve_filings is compared with the com_files CSV it replaced, which was read
+# back with eval on every list column, and with building the com_files layout from the index. The memory the scraper
+# keeps per filing (the index arrays and the company table) is compared with the com_files dataframe of URL and
+# date strings it used to keep
+
+#########
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from scraper import load_scraper
+from bench_retrieve_filings import make_index
+
+scraper = load_scraper()
+
+
+def load_csv(path):
+    return pd.read_csv(
+        path,
+        converters={
+            column: lambda x: eval(x)
+            for column in ["10Ks", "KDates", "10Qs", "QDates", "SIC"]
+        },
+    )
+
+
+def company_bytes(companies):
+    # The company table holds its names and SIC codes as Python strings
+    strings = [
+        value for column in ["name", "sic"] for value in companies[column].tolist()
+    ]
+    return sum(array.nbytes for array in companies.values()) + sum(
+        sys.getsizeof(value) for value in strings
+    )
+
+
+def run(n_rows, n_companies, seed):
+    records = make_index(n_rows, n_companies, seed)
+
+    # Everything is written to a temporary directory, kept out of the repository
+    os.chdir(tempfile.mkdtemp())
+
+    filings = scraper.retrieve_filings(iter(records), "bench", resolve_sic=False)
+    com_files = scraper.build_com_files(filings)
+    com_files.to_csv("com_files_bench.csv", index=False)
+
+    start = time.perf_counter()
+    csv_files = load_csv("com_files_bench.csv")
+    csv_seconds = time.perf_counter() - start
+
+    # Start up as the scraper does it: the index is loaded and the 10-Ks of 2020 are planned from its arrays
+    start = time.perf_counter()
+    filings = scraper.load_filing_index(scraper.filing_index_path("bench"))
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selected = filings.select(["10-K"], 2020, 2020)
+    pending = scraper.plan_filings(selected, "10-K", set())
+    plan_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arrow_files = scraper.build_com_files(filings)
+    build_seconds = time.perf_counter() - start
+
+    kept_bytes = filings.nbytes + company_bytes(filings.companies)
+    frame_bytes = com_files.memory_usage(deep=True).sum()
+    for column in ["10Ks", "KDates", "10Qs", "QDates", "SIC"]:
+        frame_bytes += sum(
+            sys.getsizeof(value) for values in com_files[column] for value in values
+        )
+
+    print(f"{len(filings)} filings, {len(arrow_files)} companies")
+    print(f"CSV with eval:            {csv_seconds:.3f}s")
+    print(f"Arrow filing index:       {index_seconds:.3f}s")
+    print(f"  + 10-Ks of 2020 planned: {plan_seconds:.3f}s, {len(pending)} filings")
+    print(f"  + com_files layout:     {build_seconds:.3f}s")
+    kept_per_filing = kept_bytes / len(filings)
+    frame_per_filing = frame_bytes / len(filings)
+    print(f"Bytes kept per filing:    {kept_per_filing:.0f}", end=" ")
+    print(f"(com_files {frame_per_filing:.0f})")
+
+    # Both loads have to give back the same filings
+    for column in ["Name", "CIK", "10Ks", "KDates", "10Qs", "QDates"]:
+        assert list(csv_files[column]) == list(arrow_files[column]), column
+
+    # And the plan holds the 10-Ks of 2020 in the order com_files lists them
+    expected = [
+        url for urls in scraper.build_com_files(selected)["10Ks"] for url in urls
+    ]
+    assert pending.urls() == expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--companies", type=int, default=8000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run(args.rows, args.companies, args.seed)
@@ -0,0 +1,61 @@
+#########
+
+# Benchmark: retrieve_filings on a synthetic master index
+# The index is grown in steps up to the full size, time per row should stay flat if the stage scales linearly
+
+#########
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from scraper import load_scraper
+
+scraper = load_scraper()
+
+
+def make_index(n_rows, n_companies, seed):
+    rng = random.Random(seed)
+    records = []
+    for row in range(n_rows):
+        cik = rng.randrange(1, n_companies + 1)
+        form_type = rng.choice(["10-K", "10-Q", "10-Q", "10-Q", "8-K"])
+        date = f"2020{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+        records.append(
+            scraper.IndexRecord(
+                cik,
+                f"COMPANY {cik} INC",
+                form_type,
+                date,
+                f"edgar/data/{cik}/0000000000-20-{row:06d}.txt",
+            )
+        )
+    return records
+
+
+def run(n_rows, n_companies, steps, seed):
+    records = make_index(n_rows, n_companies, seed)
+
+    # retrieve_filings writes the filing index to the working directory, that is kept out of the repository
+    os.chdir(tempfile.mkdtemp())
+
+    print(f"{'rows':>10} {'seconds':>10} {'us per row':>12}")
+    for step in range(1, steps + 1):
+        size = n_rows * step // steps
+        start = time.perf_counter()
+        scraper.retrieve_filings(iter(records[:size]), "bench", resolve_sic=False)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>10} {elapsed:>10.3f} {elapsed / size * 1e6:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--companies", type=int, default=8000)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run(args.rows, args.companies, args.steps, args.seed)
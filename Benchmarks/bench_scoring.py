@@ -0,0 +1,178 @@
+#########
+
+# Benchmark: pairwise list_average loop against the sparse BigramScorer
+# Both are run over the same filings and must give the same best fit report for every header: first over synthetic
+# filings, then over the real filings and R pages of the fixture corpus, where best_fit_url itself is compared with
+# the scoring the pipeline uses
+
+#########
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import string
+import tempfile
+import time
+
+import pandas as pd
+
+from scraper import load_scraper, repo_directory
+from run_benchmarks import Corpus, benchmark_directory
+
+scraper = load_scraper()
+
+# Words used for the row labels of the note and detail reports that make up most of a filing
+filler_words = (
+    "accrued liabilities lease obligations goodwill intangible assets segment "
+    "information income taxes deferred revenue recognition fair value measurements "
+    "derivative instruments pension benefits debt maturities warrants share based "
+    "compensation restructuring charges acquisitions contingencies related party "
+    "transactions subsequent events inventories property plant equipment "
+    "depreciation amortization weighted average"
+).split()
+
+
+def load_default_terms():
+    default_doc_terms = pd.read_excel(
+        os.path.join(repo_directory, "Filing Names", "Default Filing Terms.xlsx")
+    )
+
+    default_terms = []
+    for i in default_doc_terms.columns:
+        terms = [x for x in default_doc_terms[i].to_list() if str(x) != "nan"]
+        default_terms.append(
+            [
+                "".join(c.lower() for c in s if c not in string.punctuation)
+                for s in terms
+            ]
+        )
+    return default_terms
+
+
+def make_filing(default_terms, n_reports, rng):
+    # A filing has its cover page first, then the statements, then a long tail of notes and details
+    reports = []
+    reports.append([" ".join(rng.sample(filler_words, 3)) for _ in range(20)])
+
+    for terms in default_terms:
+        labels = rng.sample(terms, min(len(terms), 25))
+        labels += [" ".join(rng.sample(filler_words, 4)) for _ in range(10)]
+        rng.shuffle(labels)
+        reports.append(labels)
+
+    while len(reports) < n_reports:
+        reports.append(
+            [
+                " ".join(rng.sample(filler_words, rng.randint(2, 6)))
+                for _ in range(rng.randint(5, 40))
+            ]
+        )
+
+    master_reports = [{"url": f"R{i + 1}.htm"} for i in range(len(reports))]
+    return master_reports, reports
+
+
+def pairwise_best_fit(master_reports, reports, default_list):
+    # best_fit_url without the network: reports are scored in order until one passes 2
+    match_values = []
+    for labels in reports:
+        match_values.append(scraper.list_average(labels, default_list))
+        if match_values[-1] > 2:
+            break
+
+    return scraper.pick_best_fit(master_reports[: len(match_values)], match_values)
+
+
+def run(n_filings, n_reports, seed):
+    rng = random.Random(seed)
+    default_terms = load_default_terms()
+    filings = [make_filing(default_terms, n_reports, rng) for _ in range(n_filings)]
+
+    start = time.perf_counter()
+    pairwise = [
+        [pairwise_best_fit(master_reports, reports, terms) for terms in default_terms]
+        for master_reports, reports in filings
+    ]
+    pairwise_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scorer = scraper.BigramScorer(default_terms)
+    batch = []
+    for master_reports, reports in filings:
+        scores = scorer.score(reports)
+        batch.append(
+            [
+                scraper.pick_best_fit(master_reports, scores[:, h].tolist())
+                for h in range(len(default_terms))
+            ]
+        )
+    batch_time = time.perf_counter() - start
+
+    print(f"Filings: {n_filings}, reports per filing: {n_reports}")
+    print(f"Pairwise list_average: {pairwise_time:.3f}s")
+    print(f"Sparse BigramScorer:   {batch_time:.3f}s")
+    print(f"Speedup: {pairwise_time / batch_time:.1f}x")
+    print(f"Identical decisions: {pairwise == batch}")
+
+
+def run_corpus():
+    # Every filing of the fixture corpus that has a FilingSummary.xml, nothing is requested from the SEC
+    work_directory = tempfile.mkdtemp(prefix="secscrape_scoring_")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            corpus = Corpus(work_directory)
+
+        # best_fit_url requests and scores the R pages of a filing in order, one header at a time
+        start = time.perf_counter()
+        pairwise = [
+            [
+                scraper.best_fit_url(master_reports, terms)[0]
+                for terms in corpus.default_terms
+            ]
+            for company, filing, master_reports in corpus.filings
+        ]
+        pairwise_time = time.perf_counter() - start
+
+        # The pipeline scores every R page of a filing against every header at once
+        start = time.perf_counter()
+        scorer = scraper.BigramScorer(corpus.default_terms)
+        batch = [
+            scraper.assign_reports(
+                master_reports, scraper.score_reports(master_reports, scorer), "first"
+            )
+            for company, filing, master_reports in corpus.filings
+        ]
+        batch_time = time.perf_counter() - start
+    finally:
+        os.chdir(benchmark_directory)
+        scraper.get_fetcher().close()
+        scraper.fetcher = None
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    reports = sum(
+        len(master_reports) for company, filing, master_reports in corpus.filings
+    )
+    matched = sum(
+        report != "No match found" for decisions in batch for report in decisions
+    )
+    print(
+        f"Fixture corpus: {len(corpus.filings)} filings, {reports} reports, "
+        f"{matched} statements matched"
+    )
+    print(f"best_fit_url:          {pairwise_time:.3f}s")
+    print(f"Sparse BigramScorer:   {batch_time:.3f}s")
+    print(f"Identical decisions: {pairwise == batch}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filings", type=int, default=20)
+    parser.add_argument("--reports", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run(args.filings, args.reports, args.seed)
+    run_corpus()
@@ -0,0 +1,128 @@
+#########
+
+# Benchmark: BeautifulSoup row loop against the lxml parse_report_table
+# Both parsers are run over the same large R pages and must return the same headers, sections and data
+# Each parser is timed as the best of a few rounds, the two taking turns, as a single run on a busy machine can be
+# off by half
+
+#########
+
+import argparse
+import random
+import timeit
+
+from bs4 import BeautifulSoup
+
+from scraper import load_scraper
+
+scraper = load_scraper()
+
+
+def soup_report_table(content):
+    # The R page parsing best_fit_url and parse_filings used before parse_report_table, with header cells repeated
+    # for every column they span as parse_report_table gives them
+    statement_data = {"headers": [], "sections": [], "data": []}
+    # "html" resolved to the lxml tree builder, it is named here to keep BeautifulSoup from warning
+    report_soup = BeautifulSoup(content, "lxml")
+
+    for row in report_soup.table.find_all("tr"):
+        cols = row.find_all("td")
+
+        if len(row.find_all("th")) == 0 and len(row.find_all("strong")) == 0:
+            statement_data["data"].append([ele.text.strip() for ele in cols])
+        elif len(row.find_all("th")) == 0 and len(row.find_all("strong")) != 0:
+            statement_data["sections"].append(cols[0].text.strip())
+        elif len(row.find_all("th")) != 0:
+            statement_data["headers"].append(
+                [
+                    ele.text.strip()
+                    for ele in row.find_all("th")
+                    for _ in range(int(ele.get("colspan", 1)))
+                ]
+            )
+
+    return statement_data
+
+
+def make_r_page(n_rows, n_periods, rng):
+    # Laid out like an SEC R page: two header rows, then section rows in bold and data rows with numbers
+    periods = "".join(
+        f'<th class="th"><div>Dec. 31, {2020 - i}</div></th>' for i in range(n_periods)
+    )
+    page = [
+        "<html><head><title></title></head><body>",
+        '<span style="display: none;">v3.20.4</span>',
+        '<table class="report" border="0" cellspacing="2" id="idm1">',
+        '<tr><th class="tl" colspan="1" rowspan="2"><div style="width: 200px;"><strong>'
+        "CONSOLIDATED BALANCE SHEETS - USD ($)<br> $ in Millions</strong></div></th>"
+        f'<th class="th" colspan="{n_periods}">12 Months Ended</th></tr>',
+        f"<tr>{periods}</tr>",
+    ]
+
+    for row in range(n_rows):
+        if row % 15 == 0:
+            page.append(
+                '<tr class="re">'
+                '<td class="pl " style="border-bottom: 0px;" valign="top">'
+                '<a class="a" href="javascript:void(0);">'
+                f"<strong>Section {row}:</strong></a></td>"
+                + '<td class="text">&#160;<span></span></td>' * n_periods
+                + "</tr>"
+            )
+            continue
+
+        values = "".join(
+            f'<td class="nump">$ {rng.randint(-99999, 99999):,}<span></span></td>'
+            for _ in range(n_periods)
+        )
+        page.append(
+            f'<tr class="{"ro" if row % 2 else "re"}">'
+            '<td class="pl " style="border-bottom: 0px;" valign="top">'
+            '<a class="a" href="javascript:void(0);" '
+            f"onclick=\"top.Show.showAR( this, 'defref_us-gaap_Item{row}', window );\">"
+            f"Line item number {row} &#8212; net of allowance</a></td>{values}</tr>"
+        )
+
+    page.append("</table></body></html>")
+    return "".join(page).encode("utf-8")
+
+
+def best_times(parsers, pages, repeat):
+    times = [[] for _ in parsers]
+    for _ in range(repeat):
+        for parse, parser_times in zip(parsers, times):
+            parser_times.append(
+                timeit.timeit(lambda: [parse(page) for page in pages], number=1)
+            )
+    return [min(parser_times) for parser_times in times]
+
+
+def run(n_pages, n_rows, n_periods, seed, repeat):
+    rng = random.Random(seed)
+    pages = [make_r_page(n_rows, n_periods, rng) for _ in range(n_pages)]
+
+    soup_results = [soup_report_table(page) for page in pages]
+    lxml_results = [scraper.parse_report_table(page) for page in pages]
+
+    soup_time, lxml_time = best_times(
+        [soup_report_table, scraper.parse_report_table], pages, repeat
+    )
+
+    size = sum(len(page) for page in pages) / n_pages / 1024
+    print(f"Pages: {n_pages}, rows per page: {n_rows}, average size: {size:.0f} KiB")
+    print(f"BeautifulSoup: {soup_time:.3f}s")
+    print(f"lxml:          {lxml_time:.3f}s")
+    print(f"Speedup: {soup_time / lxml_time:.1f}x")
+    print(f"Identical output: {soup_results == lxml_results}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=400)
+    parser.add_argument("--periods", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    run(args.pages, args.rows, args.periods, args.seed, args.repeat)
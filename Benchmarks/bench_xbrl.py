@@ -0,0 +1,115 @@
+#########
+
+# Benchmark: statements read from the R pages against statements rebuilt from the XBRL instance
+# Run over the filings of the fixture corpus that have their XBRL instance and linkbases, 10-Ks and a 10-Q with
+# both quarter and year to date columns. Every report the XBRL engine rebuilds must give the same header rows (but
+# for the title), row labels and amounts as its R page, and the reports it leaves to the R pages are listed
+
+#########
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from scraper import load_scraper
+from run_benchmarks import Corpus, benchmark_directory
+
+scraper = load_scraper()
+
+
+def column_headers(table):
+    # The header rows without the title, which the R page writes out in full
+    headers = table["headers"]
+    return [headers[0][1:]] + headers[1:] if len(headers) != 0 else []
+
+
+def same_statement(page_table, rebuilt_table):
+    # Headers, labels, periods and amounts, with empty cells in the same places
+    page = scraper.Statement.from_table(page_table)
+    rebuilt = scraper.Statement.from_table(rebuilt_table)
+    return (
+        column_headers(page_table) == column_headers(rebuilt_table)
+        and page.labels == rebuilt.labels
+        and page.periods == rebuilt.periods
+        and np.array_equal(page.values, rebuilt.values, equal_nan=True)
+    )
+
+
+def run():
+    # Nothing is requested from the SEC, the fixture corpus is served from the response cache
+    work_directory = tempfile.mkdtemp(prefix="secscrape_xbrl_")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            corpus = Corpus(work_directory)
+
+        fetcher = scraper.get_fetcher()
+        filings = []
+        for company, filing, master_reports in corpus.filings:
+            documents = scraper.xbrl_documents(
+                fetcher.get_json(filing), "https://www.sec.gov"
+            )
+            if documents is not None:
+                pages = [fetcher.get(report["url"]) for report in master_reports]
+                filings.append(
+                    (
+                        filing,
+                        master_reports,
+                        pages,
+                        [fetcher.get(url) for url in documents],
+                    )
+                )
+
+        start = time.perf_counter()
+        page_tables = [
+            [scraper.parse_report_table(page) for page in pages]
+            for filing, master_reports, pages, xbrl in filings
+        ]
+        page_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        xbrl_tables = [
+            scraper.xbrl_tables(master_reports, *xbrl)
+            for filing, master_reports, pages, xbrl in filings
+        ]
+        xbrl_time = time.perf_counter() - start
+    finally:
+        os.chdir(benchmark_directory)
+        scraper.get_fetcher().close()
+        scraper.fetcher = None
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    rebuilt_count = 0
+    differences = []
+    for (filing, master_reports, pages, xbrl), tables, rebuilt in zip(
+        filings, page_tables, xbrl_tables
+    ):
+        print(filing)
+        for index, report in enumerate(master_reports):
+            if index not in rebuilt:
+                print(f"  {report['name_short']}: read from its R page")
+                continue
+
+            rebuilt_count += 1
+            statement = scraper.Statement.from_table(rebuilt[index])
+            same = same_statement(tables[index], rebuilt[index])
+            if not same:
+                differences.append((filing, report["name_short"]))
+            print(
+                f"  {report['name_short']}: {len(statement.labels)} rows, "
+                f"{statement.values.size} cells, "
+                f"{'same as' if same else 'different from'} its R page"
+            )
+
+    print(f"Filings with XBRL: {len(filings)}, reports rebuilt: {rebuilt_count}")
+    print(f"R pages parsed:        {page_time:.3f}s")
+    print(f"XBRL instance read:    {xbrl_time:.3f}s")
+    print(f"Identical statements: {len(differences) == 0}")
+
+
+if __name__ == "__main__":
+    run()
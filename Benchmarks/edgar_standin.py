@@ -0,0 +1,426 @@
+#########
+
+# Local EDGAR stand-in server
+# Serves a synthetic EDGAR tree with the www.sec.gov paths the scraper requests: the daily-index listings and master
+# files, the quarterly full-index master files, and for every filing its index.json, FilingSummary.xml, R pages and
+# index header page, and with --xbrl its XBRL instance, presentation linkbase and label linkbase. Pages are generated
+# on request from a fixed seed, so any scale can be served without building it on disk first. Latency, 429 throttling
+# and dropped connections are injected at set rates.
+#
+#   python edgar_standin.py --port 8080 --companies 2000 --latency 0.05 --throttle-rate 0.01
+#   SEC_ORIGIN=http://127.0.0.1:8080 python "000 - SECScrape 6.1.py"
+
+#########
+
+import argparse
+import datetime
+import functools
+import gzip
+import http.server
+import json
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+
+import make_fixtures
+
+year = make_fixtures.year
+
+sic_codes = [(company[2], company[3]) for company in make_fixtures.companies]
+
+
+class SyntheticEdgar:
+    # Every company files a 10-K and then 10-Qs, one filing per company on each of the first business days of Q1
+    def __init__(
+        self, companies=100, filings_per_company=2, filler_rows=200, seed=0, xbrl=False
+    ):
+        self.companies = companies
+        self.filings_per_company = filings_per_company
+        self.filler_rows = filler_rows
+        self.seed = seed
+        self.xbrl = xbrl
+
+        start = datetime.date(year, 1, 2)
+        business_days = [
+            start + datetime.timedelta(days=offset)
+            for offset in range(0, 88)
+            if (start + datetime.timedelta(days=offset)).weekday() < 5
+        ]
+        self.days = [
+            day.strftime("%Y%m%d") for day in business_days[:filings_per_company]
+        ]
+
+    def cik(self, company_num):
+        return 1000000 + company_num
+
+    def filing(self, company_num, filing_num):
+        cik = self.cik(company_num)
+        return {
+            "cik": cik,
+            "name": f"SYNTHETIC COMPANY {company_num} INC",
+            "form": "10-K" if filing_num == 0 else "10-Q",
+            "date": self.days[filing_num],
+            "accession": make_fixtures.accession(cik, filing_num + 1),
+            "sic": sic_codes[company_num % len(sic_codes)],
+        }
+
+    def filing_by_folder(self, cik, folder):
+        company_num = cik - 1000000
+        filing_num = int(folder[-6:]) - 1
+        if not (
+            0 <= company_num < self.companies
+            and 0 <= filing_num < self.filings_per_company
+        ):
+            return None
+        filing = self.filing(company_num, filing_num)
+        return filing if filing["accession"].replace("-", "") == folder else None
+
+    def rng(self, *key):
+        # A generator of its own for every page, so a page is the same whichever order pages are requested in
+        return random.Random(zlib.crc32(repr((self.seed,) + key).encode()))
+
+    @functools.lru_cache(maxsize=4096)
+    def reports(self, cik, accession, form):
+        return make_fixtures.filing_reports(self.rng(cik, accession), form, False)
+
+    def master_lines(self, day):
+        filing_num = self.days.index(day)
+        lines = []
+        for company_num in range(self.companies):
+            filing = self.filing(company_num, filing_num)
+            lines.append(
+                f"{filing['cik']}|{filing['name']}|{filing['form']}|{day}|"
+                f"edgar/data/{filing['cik']}/{filing['accession']}.txt"
+            )
+
+        rng = self.rng("filler", day)
+        for row in range(self.filler_rows):
+            cik = rng.randint(1000, 900000)
+            form = rng.choice(["8-K", "4", "SC 13G/A", "424B2", "S-8", "6-K"])
+            accession = make_fixtures.accession(cik, 500000 + row)
+            lines.append(
+                f"{cik}|FILER {cik} LLC|{form}|{day}|edgar/data/{cik}/{accession}.txt"
+            )
+        rng.shuffle(lines)
+        return lines
+
+    def page(self, path):
+        # Returns the content of a path, or None if there is nothing there
+        match = re.fullmatch(r"/Archives/edgar/daily-index/(\d{4})/index\.json", path)
+        if match:
+            return (
+                make_fixtures.directory_listing(f"{year}/", ["QTR1"])
+                if int(match.group(1)) == year
+                else None
+            )
+
+        match = re.fullmatch(
+            r"/Archives/edgar/daily-index/(\d{4})/QTR(\d)/index\.json", path
+        )
+        if match:
+            if int(match.group(1)) != year or match.group(2) != "1":
+                return None
+            return make_fixtures.directory_listing(
+                "QTR1/", [f"master.{day}.idx" for day in self.days]
+            )
+
+        match = re.fullmatch(
+            r"/Archives/edgar/daily-index/(\d{4})/QTR1/master\.(\d{8})\.idx", path
+        )
+        if match:
+            if match.group(2) not in self.days:
+                return None
+            header = make_fixtures.master_header(
+                "Master Index of EDGAR Dissemination Feed", match.group(2)
+            )
+            return (
+                header + "\n".join(self.master_lines(match.group(2))) + "\n"
+            ).encode()
+
+        match = re.fullmatch(
+            r"/Archives/edgar/full-index/(\d{4})/QTR(\d)/master\.gz", path
+        )
+        if match:
+            if int(match.group(1)) != year:
+                return None
+            lines = []
+            if match.group(2) == "1":
+                for day in self.days:
+                    iso_day = f"{day[0:4]}-{day[4:6]}-{day[6:8]}"
+                    lines += [
+                        line.replace(f"|{day}|", f"|{iso_day}|")
+                        for line in self.master_lines(day)
+                    ]
+            header = make_fixtures.master_header(
+                "Master Index of EDGAR Dissemination Feed", f"QTR{match.group(2)}"
+            )
+            return gzip.compress(
+                (header + "".join(line + "\n" for line in lines)).encode(), mtime=0
+            )
+
+        match = re.fullmatch(r"/Archives/edgar/data/(\d+)/(\d{18})/(.+)", path)
+        if match:
+            filing = self.filing_by_folder(int(match.group(1)), match.group(2))
+            if filing is None:
+                return None
+            return self.filing_page(filing, match.group(3))
+
+        return None
+
+    def filing_page(self, filing, name):
+        cik, accession = filing["cik"], filing["accession"]
+        reports = self.reports(cik, accession, filing["form"])
+        folder = f"Archives/edgar/data/{cik}/{accession.replace('-', '')}"
+
+        # The XBRL files are named after the company and the period end, as EDGAR names them
+        xbrl_prefix = f"syn{cik}-{year - 1}1231"
+
+        if name == "index.json":
+            items = ["FilingSummary.xml"] + [
+                f"R{number}.htm" for number in range(1, len(reports) + 1)
+            ]
+            items += [f"{accession}-index-headers.html", f"{accession}.txt"]
+            if self.xbrl:
+                items += [
+                    f"{xbrl_prefix}_htm.xml",
+                    f"{xbrl_prefix}_pre.xml",
+                    f"{xbrl_prefix}_lab.xml",
+                ]
+            return make_fixtures.directory_listing("/" + folder, items)
+
+        if name == "FilingSummary.xml":
+            return make_fixtures.filing_summary(reports, roles=self.xbrl)
+
+        if self.xbrl and name == f"{xbrl_prefix}_htm.xml":
+            periods = [
+                (f"{year - 1}-01-01", f"{year - 1}-12-31"),
+                (f"{year - 2}-01-01", f"{year - 2}-12-31"),
+            ]
+            return make_fixtures.xbrl_instance(
+                self.rng(cik, accession, name), reports, periods
+            )
+
+        if self.xbrl and name == f"{xbrl_prefix}_pre.xml":
+            return make_fixtures.presentation_linkbase(reports)
+
+        if self.xbrl and name == f"{xbrl_prefix}_lab.xml":
+            return make_fixtures.label_linkbase(reports)
+
+        if name == f"{accession}-index-headers.html":
+            sic, sic_name = filing["sic"]
+            return make_fixtures.index_headers(
+                cik,
+                filing["name"],
+                sic,
+                sic_name,
+                accession,
+                filing["form"],
+                filing["date"],
+            )
+
+        match = re.fullmatch(r"R(\d+)\.htm", name)
+        if match and 1 <= int(match.group(1)) <= len(reports):
+            title, category, rows = reports[int(match.group(1)) - 1]
+            periods = ["Dec. 31, 2019", "Dec. 31, 2018"]
+            return make_fixtures.r_page(
+                self.rng(cik, accession, name), title, periods, rows
+            )
+
+        return None
+
+
+class FaultInjector:
+    # Decides what happens to each request, with its own seeded generator so a run can be repeated
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        throttle_rate=0.0,
+        drop_rate=0.0,
+        retry_after=1,
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def decide(self):
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            roll = self.rng.random()
+
+        if roll < self.drop_rate:
+            return delay, "drop"
+        if roll < self.drop_rate + self.throttle_rate:
+            return delay, "throttle"
+        return delay, "serve"
+
+
+class StandinServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # The scraper keeps many connections open at once
+    request_queue_size = 256
+
+    def __init__(self, address, edgar, faults):
+        super().__init__(address, StandinHandler)
+        self.edgar = edgar
+        self.faults = faults
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "served": 0,
+            "bytes": 0,
+            "throttled": 0,
+            "dropped": 0,
+            "not_found": 0,
+        }
+
+    def count(self, **values):
+        with self.stats_lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    @property
+    def origin(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StandinHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split("?", 1)[0]
+
+        if path == "/__stats":
+            with server.stats_lock:
+                self.send_body(json.dumps(server.stats).encode(), "application/json")
+            return
+
+        server.count(requests=1)
+        delay, action = server.faults.decide()
+        if delay > 0:
+            time.sleep(delay)
+
+        if action == "drop":
+            # The connection is closed without any response, as a reset connection looks to the client
+            server.count(dropped=1)
+            self.close_connection = True
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return
+
+        if action == "throttle":
+            server.count(throttled=1)
+            self.send_response(429)
+            self.send_header("Retry-After", str(server.faults.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        content = server.edgar.page(path)
+        if content is None:
+            server.count(not_found=1)
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        server.count(served=1, bytes=len(content))
+        content_type = "application/json" if path.endswith(".json") else "text/html"
+        self.send_body(content, content_type)
+
+    def send_body(self, content, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_standin(host="127.0.0.1", port=0, edgar=None, faults=None):
+    # Starts the server on a background thread, port 0 picks a free port, the address is in server.origin
+    server = StandinServer(
+        (host, port), edgar or SyntheticEdgar(), faults or FaultInjector()
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--companies", type=int, default=100)
+    parser.add_argument("--filings-per-company", type=int, default=2)
+    parser.add_argument("--filler-rows", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="up to this many seconds more, at random",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="share of requests answered with 429",
+    )
+    parser.add_argument(
+        "--drop-rate", type=float, default=0.0, help="share of connections dropped"
+    )
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument(
+        "--xbrl",
+        action="store_true",
+        help="list and serve the XBRL files of every filing",
+    )
+
+
+def from_arguments(args):
+    edgar = SyntheticEdgar(
+        args.companies, args.filings_per_company, args.filler_rows, args.seed, args.xbrl
+    )
+    faults = FaultInjector(
+        args.latency,
+        args.jitter,
+        args.throttle_rate,
+        args.drop_rate,
+        args.retry_after,
+        args.seed,
+    )
+    return edgar, faults
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    edgar, faults = from_arguments(args)
+    server = StandinServer((args.host, args.port), edgar, faults)
+    print(
+        f"Serving a synthetic EDGAR tree of {args.companies} companies on "
+        f"{server.origin}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,199 @@
+#########
+
+# Load test: runs the filing pipeline against the local EDGAR stand-in at different worker counts
+# The filing index is built once from the stand-in, then every filing is scraped again for each combination of
+# process workers and fetch threads, without a response cache so every page is requested. Throughput and the
+# speedup over the first combination are reported for each, giving the scaling curve
+#
+#   python load_test.py --companies 500 --latency 0.05 --workers 1 2 4 --fetch-workers 4 8 16
+
+#########
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from scraper import load_scraper, repo_directory
+import edgar_standin
+
+scraper = load_scraper()
+
+year = str(edgar_standin.year)
+
+
+def server_stats(server):
+    with server.stats_lock:
+        return dict(server.stats)
+
+
+def use_fetcher(server, rate, in_flight):
+    if scraper.fetcher is not None:
+        scraper.fetcher.close()
+    scraper.fetcher = scraper.EdgarFetcher(
+        rate=rate, in_flight=in_flight, origin=server.origin
+    )
+
+
+def fresh_directory(work_directory, name):
+    path = os.path.join(work_directory, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def scrape(filings, filing_names, workers, fetch_workers, work_directory):
+    terms_list, scraped_list, headers, default_terms = filing_names
+
+    scraper.journal_path = os.path.join(
+        fresh_directory(work_directory, "journal"), "scrape_journal.jsonl"
+    )
+    scraper.output_directory = fresh_directory(work_directory, "Statement Data")
+    scraper.metrics = scraper.Metrics()
+
+    for form in ["10-K", "10-Q"]:
+        scraper.parse_filings(
+            form,
+            terms_list,
+            filings,
+            "https://www.sec.gov",
+            [list(names) for names in scraped_list],
+            default_terms,
+            headers,
+            workers=workers,
+            fetch_workers=fetch_workers,
+        )
+
+    return scraper.metrics
+
+
+def run(args):
+    edgar, faults = edgar_standin.from_arguments(args)
+    server = edgar_standin.start_standin(edgar=edgar, faults=faults)
+    print(f"Stand-in serving {args.companies} companies on {server.origin}")
+
+    work_directory = tempfile.mkdtemp(prefix="secscrape_load_")
+    os.chdir(work_directory)
+    scraper.metrics_path = os.path.join(work_directory, "secscrape_metrics.txt")
+    scraper.sic_database = os.path.join(work_directory, "sic_codes.sqlite")
+
+    results = {"standin": vars(args), "index": {}, "runs": []}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            filing_names = scraper.load_filing_names(
+                os.path.join(repo_directory, "Filing Names")
+            )
+
+            use_fetcher(server, args.rate, args.in_flight)
+            before = server_stats(server)
+            start = time.perf_counter()
+            filing_index = scraper.retrieve_filings(
+                scraper.get_master_files(
+                    scraper.get_year_links(
+                        year, "https://www.sec.gov/Archives/edgar/daily-index"
+                    ),
+                    year,
+                ),
+                year,
+            )
+            elapsed = time.perf_counter() - start
+
+        after = server_stats(server)
+        filings = len(filing_index)
+        results["index"] = {
+            "seconds": elapsed,
+            "filings": filings,
+            "requests": after["requests"] - before["requests"],
+        }
+        print(f"Index of {filings} filings built in {elapsed:.2f}s")
+
+        print(
+            f"{'workers':>8} {'fetch':>6} {'seconds':>9} {'filings/s':>10} "
+            f"{'requests/s':>11} {'MB/s':>7} {'429s':>6} {'drops':>6} {'errors':>7} "
+            f"{'speedup':>8}"
+        )
+        first = None
+        for workers in args.workers:
+            for fetch_workers in args.fetch_workers:
+                use_fetcher(server, args.rate, args.in_flight)
+                before = server_stats(server)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    metrics = scrape(
+                        filing_index,
+                        filing_names,
+                        workers,
+                        fetch_workers,
+                        work_directory,
+                    )
+                elapsed = time.perf_counter() - start
+                after = server_stats(server)
+
+                delta = {name: after[name] - before[name] for name in after}
+                outcomes = {
+                    label: value
+                    for (name, label), value in metrics.counters.items()
+                    if name == "filings"
+                }
+                errors = sum(
+                    value for label, value in outcomes.items() if label != "done"
+                )
+                throughput = filings / elapsed
+                first = first or throughput
+
+                result = {
+                    "workers": workers,
+                    "fetch_workers": fetch_workers,
+                    "seconds": elapsed,
+                    "filings_per_second": throughput,
+                    "requests_per_second": delta["requests"] / elapsed,
+                    "megabytes_per_second": delta["bytes"] / elapsed / 1e6,
+                    "server": delta,
+                    "outcomes": outcomes,
+                    "speedup": throughput / first,
+                }
+                results["runs"].append(result)
+                print(
+                    f"{workers:>8} {fetch_workers:>6} "
+                    f"{elapsed:>9.2f} {throughput:>10.2f} "
+                    f"{result['requests_per_second']:>11.1f} "
+                    f"{result['megabytes_per_second']:>7.2f} "
+                    f"{delta['throttled']:>6} {delta['dropped']:>6} {errors:>7} "
+                    f"{result['speedup']:>7.2f}x"
+                )
+    finally:
+        os.chdir(repo_directory)
+        if scraper.fetcher is not None:
+            scraper.fetcher.close()
+            scraper.fetcher = None
+        server.shutdown()
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    edgar_standin.add_arguments(parser)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--fetch-workers", type=int, nargs="+", default=[8])
+    parser.add_argument("--in-flight", type=int, default=32)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1000,
+        help="requests per second the fetcher may send",
+    )
+    parser.add_argument("--output", help="also save the results as JSON")
+    args = parser.parse_args()
+
+    run(args)
+    sys.exit(0)
@@ -0,0 +1,719 @@
+#########
+
+# Builds the fixture corpus in Benchmarks/fixtures
+# The files are laid out like the www.sec.gov paths they stand in for, so they can be loaded into the response cache
+# and the scraper run offline. The corpus is generated from a fixed seed, running this again gives the same files
+
+#########
+
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import shutil
+
+fixture_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+year = 2020
+days = ["20200102", "20200103", "20200106"]
+
+# Columns of the 10-Q that has XBRL: the quarter and the year to date both end on the first date, and its balance
+# sheet compares the end of the quarter with the end of the last fiscal year
+quarter_dates = ["Jun. 27, 2020", "Jun. 29, 2019"]
+quarter_year_end = "Sep. 28, 2019"
+quarter_periods = [
+    ("2020-03-29", "2020-06-27"),
+    ("2019-03-31", "2019-06-29"),
+    ("2019-09-29", "2020-06-27"),
+    ("2018-09-30", "2019-06-29"),
+]
+quarter_instants = ["2020-06-27", "2019-09-28"]
+
+# Company name, SIC code and SIC description
+companies = [
+    (320193, "APPLE INC", "3571", "ELECTRONIC COMPUTERS"),
+    (789019, "MICROSOFT CORP", "7372", "SERVICES-PREPACKAGED SOFTWARE"),
+    (21344, "COCA COLA CO", "2080", "BEVERAGES"),
+    (200406, "JOHNSON & JOHNSON", "2834", "PHARMACEUTICAL PREPARATIONS"),
+    (1018724, "AMAZON COM INC", "5961", "RETAIL-CATALOG & MAIL-ORDER HOUSES"),
+    (66740, "3M CO", "3841", "SURGICAL & MEDICAL INSTRUMENTS & APPARATUS"),
+    (1467858, "GENERAL MOTORS CO", "3711", "MOTOR VEHICLES & PASSENGER CAR BODIES"),
+    (
+        1090872,
+        "AGILENT TECHNOLOGIES, INC.",
+        "3826",
+        "LABORATORY ANALYTICAL INSTRUMENTS",
+    ),
+]
+
+# Names the statements are filed under, some fit the default filing names and some only fit on their row labels
+statement_names = {
+    "income": [
+        "CONSOLIDATED STATEMENTS OF OPERATIONS",
+        "Consolidated Statements of Income",
+        "CONSOLIDATED STATEMENTS OF EARNINGS",
+        "Statement of Results",
+    ],
+    "balance": [
+        "CONSOLIDATED BALANCE SHEETS",
+        "Consolidated Statements of Financial Position",
+        "Balance Sheet",
+    ],
+    "cash": [
+        "CONSOLIDATED STATEMENTS OF CASH FLOWS",
+        "Consolidated Cash Flow Statement",
+        "Statement of Cash Movements",
+    ],
+    "equity": [
+        "CONSOLIDATED STATEMENTS OF SHAREHOLDERS' EQUITY",
+        "Consolidated Statements of Stockholders' Equity",
+        "Statement of Changes in Equity",
+    ],
+}
+
+statement_rows = {
+    "income": [
+        "Net sales",
+        "Cost of sales",
+        "Gross margin",
+        "Research and development",
+        "Selling, general and administrative",
+        "Total operating expenses",
+        "Operating income",
+        "Other income/(expense), net",
+        "Income before provision for income taxes",
+        "Provision for income taxes",
+        "Net income",
+        "Earnings per share basic (in dollars per share)",
+        "Earnings per share diluted (in dollars per share)",
+    ],
+    "balance": [
+        "Current assets:",
+        "Cash and cash equivalents",
+        "Marketable securities",
+        "Accounts receivable, net",
+        "Inventories",
+        "Total current assets",
+        "Property, plant and equipment, net",
+        "Total assets",
+        "Current liabilities:",
+        "Accounts payable",
+        "Deferred revenue",
+        "Total current liabilities",
+        "Term debt",
+        "Total liabilities",
+        "Retained earnings",
+        "Total shareholders' equity",
+        "Total liabilities and shareholders' equity",
+    ],
+    "cash": [
+        "Net income",
+        "Depreciation and amortization",
+        "Share-based compensation expense",
+        "Deferred income tax expense",
+        "Accounts receivable, net",
+        "Cash generated by operating activities",
+        "Purchases of marketable securities",
+        "Payments for acquisition of property, plant and equipment",
+        "Cash used in investing activities",
+        "Payments for dividends and dividend equivalents",
+        "Repurchases of common stock",
+        "Cash used in financing activities",
+        "Cash, cash equivalents and restricted cash, end of period",
+    ],
+    "equity": [
+        "Common stock issued",
+        "Common stock repurchased",
+        "Net income",
+        "Dividends and dividend equivalents declared",
+        "Share-based compensation",
+        "Treasury stock",
+        "Ending balances",
+        "Stockholders equity ending balance",
+    ],
+}
+
+note_words = [
+    "Lease",
+    "Revenue",
+    "Segment",
+    "Goodwill",
+    "Tax",
+    "Debt",
+    "Derivative",
+    "Pension",
+    "Warranty",
+    "Inventory",
+    "Receivable",
+    "Intangible",
+    "Contingency",
+    "Fair value",
+    "Share",
+    "Option",
+]
+
+
+def master_header(title, last_received):
+    return (
+        f"Description:           {title}\n"
+        f"Last Data Received:    {last_received}\n"
+        "Comments:              webmaster@sec.gov\n"
+        "Anonymous FTP:         ftp://ftp.sec.gov/edgar/\n"
+        " \n \n \n"
+        "CIK|Company Name|Form Type|Date Filed|File Name\n" + "-" * 80 + "\n"
+    )
+
+
+def accession(cik, number):
+    return f"{cik:010d}-{year % 100}-{number:06d}"
+
+
+def number_cell(rng, amount, footnote=False):
+    value = f"{abs(amount):,}"
+    if amount < 0:
+        value = f"({value})"
+    if footnote:
+        value = f"[1] {value}"
+    if rng.random() < 0.3:
+        value = "$ " + value
+    return value
+
+
+def r_page(rng, title, periods, rows, amounts=None, contexts=None, groups=None):
+    # An R page as the SEC renders it: one table, two header rows, section rows in <strong>, then data rows
+    # groups are the durations heading the periods in the first header row as (label, columns), a page of instants
+    # has no groups and a single header row
+    # With amounts, a row shown on an earlier report in the same context repeats its amounts there, as it does in a
+    # real filing, and every amount shown is added under the context of its column so the XBRL instance can report
+    # the same facts
+    if groups is None:
+        groups = [("12 Months Ended", len(periods))]
+
+    title_cell = (
+        f'<div style="width: 200px;"><strong>{title} - USD ($)<br> $ in Millions'
+        "</strong></div>"
+    )
+    period_cells = "".join(
+        f'<th class="th"><div>{period}</div></th>' for period in periods
+    )
+    html = [
+        "<html><head><title></title></head><body>",
+        '<table class="report" border="0" cellspacing="2" id="idm1">',
+    ]
+    if groups:
+        html.append(
+            f'<tr><th class="tl" colspan="1" rowspan="2">{title_cell}</th>'
+            + "".join(
+                f'<th class="th" colspan="{columns}">{label}</th>'
+                for label, columns in groups
+            )
+            + "</tr>"
+        )
+        html.append(f"<tr>{period_cells}</tr>")
+    else:
+        html.append(
+            f'<tr><th class="tl" colspan="1" rowspan="1">{title_cell}</th>'
+            f"{period_cells}</tr>"
+        )
+    for row in rows:
+        if row.endswith(":"):
+            html.append(
+                '<tr class="re">'
+                '<td class="pl" style="border-bottom: 0px;" valign="top">'
+                f'<a class="a"><strong>{row}</strong></a></td>'
+                + '<td class="text">&#160;<span></span></td>' * len(periods)
+                + "</tr>"
+            )
+        else:
+            cells = []
+            for number in range(len(periods)):
+                negative, footnote = rng.random() < 0.15, rng.random() < 0.05
+                amount = rng.randint(1, 400000) * (-1 if negative else 1)
+                if amounts is not None:
+                    amount = amounts.setdefault(
+                        (concept(row), contexts[number]), amount
+                    )
+                cell = number_cell(rng, amount, footnote)
+                cells.append(f'<td class="nump">{cell}<span></span></td>')
+            cells = "".join(cells)
+            defref = "defref_us-gaap_" + row.replace(" ", "")
+            html.append(
+                '<tr class="ro">'
+                '<td class="pl" style="border-bottom: 0px;" valign="top">'
+                '<a class="a" onclick="top.Show.showAR( this, '
+                f"'{defref}', window );\">"
+                f"{row}</a></td>{cells}</tr>"
+            )
+    html.append("</table></body></html>")
+    return "\n".join(html).encode()
+
+
+def note_rows(rng, count):
+    return [
+        f"{rng.choice(note_words)} {rng.choice(note_words).lower()} {index}"
+        for index in range(count)
+    ]
+
+
+def filing_reports(rng, form, old_style):
+    # Cover page, the four statements in a random order, a parenthetical page and notes of varying sizes
+    reports = [
+        (
+            "Document and Entity Information",
+            "Cover",
+            ["Entity Registrant Name", "Entity Central Index Key"],
+        )
+    ]
+
+    kinds = list(statement_names)
+    rng.shuffle(kinds)
+    for kind in kinds:
+        reports.append(
+            (rng.choice(statement_names[kind]), "Statements", statement_rows[kind])
+        )
+        if kind == "balance":
+            reports.append(
+                (
+                    "CONSOLIDATED BALANCE SHEETS (Parenthetical)",
+                    "Statements",
+                    ["Common stock, shares issued"],
+                )
+            )
+
+    # Notes range from a few rows to over a hundred, so the R pages vary from about 1 KB to about 60 KB
+    for note in range(rng.randint(3, 8) if form == "10-K" else rng.randint(2, 4)):
+        size = rng.choice([3, 5, 10, 20, 40, 120])
+        category = rng.choice(["Notes", "Policies", "Tables", "Details"])
+        reports.append(
+            (f"{rng.choice(note_words)} ({category})", category, note_rows(rng, size))
+        )
+
+    # Early XBRL filings don't have menu categories
+    if old_style:
+        reports = [(name, "", rows) for name, category, rows in reports]
+
+    return reports
+
+
+def filing_summary(reports, roles=False):
+    # With roles, every report names its role in the XBRL presentation linkbase
+    xml = ['<?xml version="1.0" encoding="utf-8"?>', "<FilingSummary>", "  <MyReports>"]
+    for number, (name, category, rows) in enumerate(reports, 1):
+        kind = (
+            "Statement"
+            if category == "Statements"
+            else "Document"
+            if category == "Cover"
+            else "Disclosure"
+        )
+        xml.append(
+            f'    <Report instance="filing.htm">\n'
+            f"      <IsDefault>false</IsDefault>\n"
+            f"      <HtmlFileName>R{number}.htm</HtmlFileName>\n"
+            f"      <LongName>{number:04d} - {kind} - {name}</LongName>\n"
+            f"      <ShortName>{name}</ShortName>\n"
+            + (f"      <MenuCategory>{category}</MenuCategory>\n" if category else "")
+            + (f"      <Role>{report_role(number)}</Role>\n" if roles else "")
+            + f"      <Position>{number}</Position>\n"
+            f"    </Report>"
+        )
+    xml += [
+        '    <Report instance="filing.htm">',
+        "      <HtmlFileName>all</HtmlFileName>",
+        "      <LongName>All Reports</LongName>",
+        "      <ShortName>All Reports</ShortName>",
+        f"      <Position>{len(reports) + 1}</Position>",
+        "    </Report>",
+        "  </MyReports>",
+        "</FilingSummary>",
+    ]
+    return "\n".join(xml).replace("&", "&amp;").encode()
+
+
+def report_role(number):
+    return f"http://www.example.com/role/Report{number}"
+
+
+def concept(row):
+    # "Accounts receivable, net" -> AccountsReceivableNet, section rows such as "Current assets:" are abstract
+    name = "".join(word.capitalize() for word in re.findall(r"[A-Za-z0-9]+", row))
+    return name + "Abstract" if row.endswith(":") else name
+
+
+def fact_context(name):
+    # Balance sheet facts are at the period end, the others over the period. The equity statement is broken down by a
+    # dimension, as in real filings, so it can't be rebuilt from contexts without dimensions
+    if name in statement_names["equity"]:
+        return "c{}d"
+    if name in statement_names["balance"] or "Parenthetical" in name:
+        return "i{}"
+    return "c{}"
+
+
+def report_columns(name, dates, quarterly=False):
+    # The durations heading a report's columns, their dates and the XBRL context of each column
+    # A 10-K shows two fiscal years. A 10-Q shows the quarter and the year to date, the cash flow statement only the
+    # year to date, and its balance sheet is at the end of the quarter and of the last fiscal year
+    context = fact_context(name)
+    if context == "i{}":
+        return [], [dates[0], quarter_year_end] if quarterly else dates, ["i0", "i1"]
+    if not quarterly:
+        return None, dates, [context.format(number) for number in range(2)]
+    if name in statement_names["cash"]:
+        return (
+            [("9 Months Ended", 2)],
+            dates,
+            [context.format(number) for number in (2, 3)],
+        )
+    return (
+        [("3 Months Ended", 2), ("9 Months Ended", 2)],
+        dates * 2,
+        [context.format(number) for number in range(4)],
+    )
+
+
+def xbrl_instance(rng, reports, periods, amounts=None, instants=None):
+    # The instance of a filing: contexts for each period, and a fact for every row of every report in each of them
+    # Cover page rows are text facts. Amounts are drawn, or with amounts taken from the R pages by context, in
+    # millions. Instants are at the end of each period unless their dates are given
+    if instants is None:
+        instants = [end for start, end in periods]
+
+    xml = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        '<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance" '
+        'xmlns:iso4217="http://www.xbrl.org/2003/iso4217"'
+        ' xmlns:us-gaap="http://fasb.org/us-gaap/2020-01-31" '
+        'xmlns:xbrldi="http://xbrl.org/2006/xbrldi"'
+        ' xmlns:dei="http://xbrl.sec.gov/dei/2020-01-31">',
+        '<xbrli:unit id="usd"><xbrli:measure>iso4217:USD</xbrli:measure></xbrli:unit>',
+    ]
+    segment = (
+        "<xbrli:segment><xbrldi:explicitMember "
+        'dimension="us-gaap:StatementEquityComponentsAxis">'
+        "us-gaap:RetainedEarningsMember</xbrldi:explicitMember></xbrli:segment>"
+    )
+    for number, (start, end) in enumerate(periods):
+        duration = (
+            f"<xbrli:startDate>{start}</xbrli:startDate>"
+            f"<xbrli:endDate>{end}</xbrli:endDate>"
+        )
+        contexts = [(f"c{number}", "", duration), (f"c{number}d", segment, duration)]
+        if number < len(instants):
+            contexts.append(
+                (f"i{number}", "", f"<xbrli:instant>{instants[number]}</xbrli:instant>")
+            )
+        for context_id, dimensions, period in contexts:
+            xml.append(
+                f'<xbrli:context id="{context_id}"><xbrli:entity>'
+                '<xbrli:identifier scheme="http://www.sec.gov/CIK">0000000000'
+                f"</xbrli:identifier>{dimensions}</xbrli:entity>"
+                f"<xbrli:period>{period}</xbrli:period></xbrli:context>"
+            )
+
+    # A concept shown on several reports, such as net income, is reported once in each context
+    seen = set()
+    for name, category, rows in reports:
+        context = fact_context(name)
+
+        for row in rows:
+            if row.endswith(":") or (concept(row), context) in seen:
+                continue
+            seen.add((concept(row), context))
+
+            for number in range(len(periods)):
+                if category == "Cover":
+                    xml.append(
+                        f'<dei:{concept(row)} contextRef="c{number}">{row} '
+                        f"value</dei:{concept(row)}>"
+                    )
+                elif amounts is None:
+                    xml.append(
+                        amount_fact(
+                            concept(row),
+                            context.format(number),
+                            rng.randint(-400000, 400000),
+                        )
+                    )
+
+    if amounts is not None:
+        xml += [
+            amount_fact(name, context, amount)
+            for (name, context), amount in amounts.items()
+        ]
+
+    xml.append("</xbrli:xbrl>")
+    return "\n".join(xml).encode()
+
+
+def amount_fact(name, context, amount):
+    return (
+        f'<us-gaap:{name} contextRef="{context}" unitRef="usd" decimals="-6">'
+        f"{amount * 1000000}</us-gaap:{name}>"
+    )
+
+
+def linkbase(links):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<link:linkbase xmlns:link="http://www.xbrl.org/2003/linkbase" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink">\n'
+        + "\n".join(links)
+        + "\n</link:linkbase>"
+    ).encode()
+
+
+def locator(row, label):
+    return (
+        '<link:loc xlink:type="locator" '
+        f'xlink:href="us-gaap-2020.xsd#us-gaap_{concept(row)}"'
+        f' xlink:label="{label}"/>'
+    )
+
+
+def presentation_linkbase(reports):
+    # One presentation link per report: an abstract root with every row of the report under it in order
+    links = []
+    for number, (name, category, rows) in enumerate(reports, 1):
+        link = [
+            '<link:presentationLink xlink:type="extended" '
+            f'xlink:role="{report_role(number)}">',
+            locator(f"Report {number}:", "root"),
+        ]
+        for row_num, row in enumerate(rows):
+            link.append(locator(row, f"loc{row_num}"))
+            link.append(
+                '<link:presentationArc xlink:type="arc" '
+                'xlink:arcrole="http://www.xbrl.org/2003/arcrole/parent-child"'
+                f' xlink:from="root" xlink:to="loc{row_num}" order="{row_num + 1}"/>'
+            )
+        link.append("</link:presentationLink>")
+        links.append("\n".join(link))
+    return linkbase(links)
+
+
+def label_linkbase(reports):
+    link = [
+        '<link:labelLink xlink:type="extended" '
+        'xlink:role="http://www.xbrl.org/2003/role/link">'
+    ]
+    for number, row in enumerate(
+        sorted({row for name, category, rows in reports for row in rows})
+    ):
+        link += [
+            locator(row, f"loc{number}"),
+            f'<link:label xlink:type="resource" xlink:label="lab{number}"'
+            f' xlink:role="http://www.xbrl.org/2003/role/label" xml:lang="en-US">'
+            f'{row.replace("&", "&amp;")}</link:label>',
+            '<link:labelArc xlink:type="arc" '
+            'xlink:arcrole="http://www.xbrl.org/2003/arcrole/concept-label"'
+            f' xlink:from="loc{number}" xlink:to="lab{number}"/>',
+        ]
+    link.append("</link:labelLink>")
+    return linkbase(["\n".join(link)])
+
+
+def index_headers(cik, name, sic, sic_name, accession_number, form, date):
+    return (
+        "<html><head><title>"
+        + accession_number
+        + ".hdr.sgml</title></head><body><pre>\n"
+        f"&lt;SEC-HEADER&gt;{accession_number}.hdr.sgml : {date}\n"
+        f"ACCESSION NUMBER:		{accession_number}\n"
+        f"CONFORMED SUBMISSION TYPE:	{form}\n"
+        "PUBLIC DOCUMENT COUNT:		98\n"
+        f"FILED AS OF DATE:		{date}\n"
+        "FILER:\n\n"
+        "	COMPANY DATA:	\n"
+        f"		COMPANY CONFORMED NAME:			{name}\n"
+        f"		CENTRAL INDEX KEY:			{cik:010d}\n"
+        f"		STANDARD INDUSTRIAL CLASSIFICATION:	{sic_name} [{sic}]\n"
+        "		FISCAL YEAR END:			0926\n"
+        "</pre></body></html>\n"
+    ).encode()
+
+
+def write(path, content):
+    path = os.path.join(fixture_directory, *path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def directory_listing(name, items):
+    return json.dumps(
+        {
+            "directory": {
+                "name": name,
+                "item": [{"name": item, "type": "file"} for item in items],
+            }
+        },
+        indent=1,
+    ).encode()
+
+
+def build(seed, filler_rows):
+    rng = random.Random(seed)
+
+    if os.path.exists(fixture_directory):
+        shutil.rmtree(fixture_directory)
+
+    # Two filings per company, a 10-K and a 10-Q, spread over the three days
+    master_lines = {day: [] for day in days}
+    number = 1
+    for company_num, (cik, name, sic, sic_name) in enumerate(companies):
+        for form in ["10-K", "10-Q"]:
+            day = days[(company_num + len(master_lines[days[0]])) % len(days)]
+            accession_number = accession(cik, number)
+            number += 1
+            folder = f"Archives/edgar/data/{cik}/{accession_number.replace('-', '')}"
+
+            master_lines[day].append(
+                f"{cik}|{name}|{form}|{day}|edgar/data/{cik}/{accession_number}.txt"
+            )
+
+            # One filing predates the FilingSummary.xml and one predates menu categories
+            no_summary = company_num == 6 and form == "10-Q"
+            old_style = company_num == 7 and form == "10-K"
+
+            # A few 10-Ks and the last 10-Q also have their XBRL instance and linkbases, reporting the amounts their R
+            # pages show. The 10-Q's instance is named the way some filers name theirs
+            quarterly = company_num == len(companies) - 1 and form == "10-Q"
+            xbrl = (company_num < 3 and form == "10-K") or quarterly
+            xbrl_prefix = (
+                f"fix{cik}-10q_{year}0627" if quarterly else f"fix{cik}-{year}0926"
+            )
+
+            reports = filing_reports(rng, form, old_style)
+            items = [f"R{number}.htm" for number in range(1, len(reports) + 1)]
+            items += [
+                f"{accession_number}-index-headers.html",
+                f"{accession_number}.txt",
+            ]
+            if xbrl:
+                items += [
+                    f"{xbrl_prefix}_htm.xml",
+                    f"{xbrl_prefix}_pre.xml",
+                    f"{xbrl_prefix}_lab.xml",
+                ]
+            if not no_summary:
+                items.insert(0, "FilingSummary.xml")
+                write(
+                    folder + "/FilingSummary.xml", filing_summary(reports, roles=xbrl)
+                )
+
+            write(folder + "/index.json", directory_listing("/" + folder, items))
+            write(
+                f"{folder}/{accession_number}-index-headers.html",
+                index_headers(cik, name, sic, sic_name, accession_number, form, day),
+            )
+
+            if quarterly:
+                dates = quarter_dates
+            else:
+                dates = (
+                    ["Sep. 26, 2020", "Sep. 28, 2019"]
+                    if form == "10-K"
+                    else ["Mar. 28, 2020", "Dec. 28, 2019"]
+                )
+
+            # Cover page rows are text facts, so their amounts aren't reported
+            amounts = {} if xbrl else None
+            for report_num, (title, category, rows) in enumerate(reports, 1):
+                groups, periods, contexts = report_columns(title, dates, quarterly)
+                write(
+                    f"{folder}/R{report_num}.htm",
+                    r_page(
+                        rng,
+                        title,
+                        periods,
+                        rows,
+                        amounts if category != "Cover" else None,
+                        contexts,
+                        groups,
+                    ),
+                )
+
+            if xbrl:
+                if quarterly:
+                    instance = xbrl_instance(
+                        rng, reports, quarter_periods, amounts, quarter_instants
+                    )
+                else:
+                    # The fiscal years the 10-K's columns end, as the instance's contexts
+                    xbrl_periods = [
+                        ("2019-09-29", "2020-09-26"),
+                        ("2018-09-30", "2019-09-28"),
+                    ]
+                    instance = xbrl_instance(rng, reports, xbrl_periods, amounts)
+                write(f"{folder}/{xbrl_prefix}_htm.xml", instance)
+                write(f"{folder}/{xbrl_prefix}_pre.xml", presentation_linkbase(reports))
+                write(f"{folder}/{xbrl_prefix}_lab.xml", label_linkbase(reports))
+
+    # Filings of other form types make up most of every master file, as they do on EDGAR
+    for day in days:
+        for row in range(filler_rows):
+            cik = rng.randint(1000, 1900000)
+            form = rng.choice(
+                ["8-K", "4", "SC 13G/A", "424B2", "S-8", "6-K", "DEF 14A", "3", "497K"]
+            )
+            master_lines[day].append(
+                f"{cik}|FILER {cik} "
+                f"LLC|{form}|{day}|edgar/data/{cik}/{accession(cik, 500000 + row)}.txt"
+            )
+        rng.shuffle(master_lines[day])
+
+    # Daily index: the year, its quarter and the master files of each day
+    write(
+        f"Archives/edgar/daily-index/{year}/index.json",
+        directory_listing(f"{year}/", ["QTR1"]),
+    )
+    quarter_items = []
+    for day in days:
+        quarter_items += [f"company.{day}.idx", f"form.{day}.idx", f"master.{day}.idx"]
+        write(
+            f"Archives/edgar/daily-index/{year}/QTR1/master.{day}.idx",
+            (
+                master_header("Master Index of EDGAR Dissemination Feed", day)
+                + "\n".join(master_lines[day])
+                + "\n"
+            ).encode(),
+        )
+    write(
+        f"Archives/edgar/daily-index/{year}/QTR1/index.json",
+        directory_listing("QTR1/", quarter_items),
+    )
+
+    # Quarterly full index, the same filings with dates written as 2020-01-02, the later quarters are left empty
+    quarter_lines = []
+    for day in days:
+        iso_day = f"{day[0:4]}-{day[4:6]}-{day[6:8]}"
+        quarter_lines += [
+            line.replace(f"|{day}|", f"|{iso_day}|") for line in master_lines[day]
+        ]
+    for quarter in range(1, 5):
+        lines = quarter_lines if quarter == 1 else []
+        write(
+            f"Archives/edgar/full-index/{year}/QTR{quarter}/master.gz",
+            gzip.compress(
+                (
+                    master_header(
+                        "Master Index of EDGAR Dissemination Feed",
+                        f"QTR{quarter} {year}",
+                    )
+                    + "".join(line + "\n" for line in lines)
+                ).encode(),
+                mtime=0,
+            ),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filler-rows", type=int, default=400)
+    args = parser.parse_args()
+
+    build(args.seed, args.filler_rows)
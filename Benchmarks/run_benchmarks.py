@@ -0,0 +1,333 @@
+#########
+
+# Benchmark harness: times every stage of the scraper on the fixture corpus, in isolation and end to end
+# Nothing is requested from the SEC, the corpus in Benchmarks/fixtures is served from the response cache.
+# Results are saved as JSON and compared with the stored baseline, a stage that has slowed down by more than the
+# tolerance fails the run
+#
+#   python run_benchmarks.py                   times every stage and compares it with baseline.json
+#   python run_benchmarks.py --save-baseline   times every stage and stores the results as the new baseline
+
+#########
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from scraper import load_scraper, repo_directory, install_fixtures
+
+scraper = load_scraper()
+
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+baseline_path = os.path.join(benchmark_directory, "baseline.json")
+results_path = os.path.join(benchmark_directory, "benchmark_results.json")
+
+daily_index_url = r"https://www.sec.gov/Archives/edgar/daily-index"
+year = "2020"
+
+
+class Corpus:
+    # Everything the stages share, prepared once before any stage is timed
+    def __init__(self, work_directory):
+        self.work_directory = work_directory
+        os.chdir(work_directory)
+
+        install_fixtures(scraper, os.path.join(work_directory, "cache"))
+        scraper.metrics_path = os.path.join(work_directory, "secscrape_metrics.txt")
+
+        self.filing_names = scraper.load_filing_names(
+            os.path.join(repo_directory, "Filing Names")
+        )
+        (
+            self.terms_list,
+            self.scraped_list,
+            self.headers,
+            self.default_terms,
+        ) = self.filing_names
+
+        self.year_links = scraper.get_year_links(year, daily_index_url)
+        self.records = list(scraper.get_master_files(self.year_links, year))
+        scraper.sic_database = os.path.join(
+            self.fresh_directory("sic"), "sic_codes.sqlite"
+        )
+        self.com_files = scraper.build_com_files(
+            scraper.retrieve_filings(iter(self.records), year)
+        )
+
+        # The reports of every filing that has a FilingSummary.xml, with its company and filing
+        self.filings = []
+        for company, filings in enumerate(
+            self.com_files["10Ks"] + self.com_files["10Qs"]
+        ):
+            for filing in filings:
+                content = scraper.get_fetcher().get_json(filing)
+                xml_summary = scraper.filing_summary_url(content, "https://www.sec.gov")
+                if xml_summary == "":
+                    continue
+                master_reports = scraper.parse_filing_summary(
+                    scraper.get_fetcher().get(xml_summary),
+                    xml_summary.replace("FilingSummary.xml", ""),
+                )
+                self.filings.append((company, filing, master_reports))
+
+        # Row labels of every statement in the corpus
+        self.labels = []
+        for company, filing, master_reports in self.filings:
+            for report in master_reports:
+                if report["category"] in ("Statements", ""):
+                    table = scraper.parse_report_table(
+                        scraper.get_fetcher().get(report["url"])
+                    )
+                    self.labels.append(scraper.report_labels(table))
+
+    def fresh_directory(self, name):
+        path = os.path.join(self.work_directory, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+
+def bench_get_master_files(corpus):
+    def run(state):
+        return list(scraper.get_master_files(corpus.year_links, year))
+
+    return None, run
+
+
+def bench_retrieve_filings(corpus):
+    # SIC codes are looked up from the fixture header pages, starting from an empty SIC store every time
+    def setup():
+        scraper.sic_database = os.path.join(
+            corpus.fresh_directory("sic"), "sic_codes.sqlite"
+        )
+
+    def run(state):
+        return scraper.retrieve_filings(iter(corpus.records), year)
+
+    return setup, run
+
+
+def bench_ingest_full_index(corpus):
+    def setup():
+        scraper.sic_database = os.path.join(
+            corpus.fresh_directory("sic"), "sic_codes.sqlite"
+        )
+        return corpus.fresh_directory("full_index")
+
+    def run(directory):
+        scraper.ingest_full_index(int(year), int(year), directory)
+
+    return setup, run
+
+
+def bench_load_filing_names(corpus):
+    def run(state):
+        return scraper.load_filing_names(os.path.join(repo_directory, "Filing Names"))
+
+    return None, run
+
+
+def bench_best_fit_url(corpus):
+    # Every header of every filing, as parse_filings used to match them one header at a time
+    def run(state):
+        for company, filing, master_reports in corpus.filings:
+            for default_list in corpus.default_terms:
+                scraper.best_fit_url(master_reports, default_list)
+
+    return None, run
+
+
+def bench_list_average(corpus):
+    def run(state):
+        for labels in corpus.labels:
+            for default_list in corpus.default_terms:
+                scraper.list_average(labels, default_list)
+
+    return None, run
+
+
+def bench_save_data(corpus):
+    # The matched statements of every filing are written to an empty data directory
+    statements = []
+    for company, filing, master_reports in corpus.filings:
+        matches = [
+            scraper.best_fit_url(master_reports, terms)
+            for terms in corpus.default_terms
+        ]
+        statements.append(
+            (company, filing, [statement for report, statement in matches])
+        )
+
+    def setup():
+        scraper.data_directory = corpus.fresh_directory("Data Directory")
+
+    def run(state):
+        for company, filing, statements_data in statements:
+            form = "10Ks" if filing in corpus.com_files.at[company, "10Ks"] else "10Qs"
+            dates = "KDates" if form == "10Ks" else "QDates"
+            scraper.save_data(
+                form,
+                statements_data,
+                corpus.com_files,
+                dates,
+                company,
+                filing,
+                corpus.headers,
+            )
+
+    return setup, run
+
+
+def bench_end_to_end(corpus):
+    # Index build from the master files, then every 10-K and 10-Q scraped into the statement store
+    def setup():
+        scraper.sic_database = os.path.join(
+            corpus.fresh_directory("sic"), "sic_codes.sqlite"
+        )
+        scraper.journal_path = os.path.join(
+            corpus.fresh_directory("journal"), "scrape_journal.jsonl"
+        )
+        scraper.output_directory = corpus.fresh_directory("Statement Data")
+
+    def run(state):
+        filings = scraper.retrieve_filings(
+            scraper.get_master_files(
+                scraper.get_year_links(year, daily_index_url), year
+            ),
+            year,
+        )
+        scraped_list = [list(names) for names in corpus.scraped_list]
+        for form in ["10-K", "10-Q"]:
+            scraper.parse_filings(
+                form,
+                corpus.terms_list,
+                filings,
+                "https://www.sec.gov",
+                scraped_list,
+                corpus.default_terms,
+                corpus.headers,
+            )
+
+    return setup, run
+
+
+stages = {
+    "get_master_files": bench_get_master_files,
+    "retrieve_filings": bench_retrieve_filings,
+    "ingest_full_index": bench_ingest_full_index,
+    "load_filing_names": bench_load_filing_names,
+    "best_fit_url": bench_best_fit_url,
+    "list_average": bench_list_average,
+    "save_data": bench_save_data,
+    "end_to_end": bench_end_to_end,
+}
+
+
+def time_stage(corpus, stage, repeat):
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup, run = stages[stage](corpus)
+        for _ in range(repeat):
+            state = setup() if setup else None
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+
+    return {"median": statistics.median(times), "min": min(times), "runs": repeat}
+
+
+def compare(results, baseline, tolerance, floor):
+    # A stage regresses when its median is slower than the baseline by more than the tolerance and by more than the
+    # floor, so stages that take a few milliseconds don't fail on noise
+    regressions = []
+    print(f"{'stage':<20} {'median':>10} {'baseline':>10} {'change':>8}")
+    for stage, result in results["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            print(f"{stage:<20} {result['median']:>10.4f} {'-':>10} {'new':>8}")
+            continue
+
+        change = result["median"] / base["median"] - 1 if base["median"] else 0
+        status = ""
+        if change > tolerance and result["median"] - base["median"] > floor:
+            regressions.append(stage)
+            status = "  REGRESSION"
+        print(
+            f"{stage:<20} {result['median']:>10.4f} {base['median']:>10.4f} "
+            f"{change:>+8.1%}{status}"
+        )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stages", nargs="+", choices=list(stages), default=list(stages)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=results_path)
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--floor", type=float, default=0.02)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline_file = os.path.abspath(args.baseline)
+
+    work_directory = tempfile.mkdtemp(prefix="secscrape_bench_")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            corpus = Corpus(work_directory)
+
+        results = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "stages": {},
+        }
+        for stage in args.stages:
+            results["stages"][stage] = time_stage(corpus, stage, args.repeat)
+            print(
+                f"{stage:<20} {results['stages'][stage]['median']:.4f}s",
+                file=sys.stderr,
+            )
+    finally:
+        os.chdir(benchmark_directory)
+        scraper.get_fetcher().close()
+        scraper.fetcher = None
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+    with open(baseline_file if args.save_baseline else output, "w") as f:
+        json.dump(results, f, indent=1)
+
+    if args.save_baseline:
+        print(f"Baseline saved to {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print(f"No baseline at {baseline_file}, run with --save-baseline to store one")
+        return 0
+
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance, args.floor)
+    if regressions:
+        print(f"Slower than the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#########
+
+# The scraper lives in a script whose file name can't be imported the normal way ("000 - SECScrape 6.1.py"),
+# so the benchmarks load it from its path instead
+
+#########
+
+import importlib.util
+import os
+import sys
+
+repo_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+script_path = os.path.join(repo_directory, "000 - SECScrape 6.1.py")
+
+
+def load_scraper():
+    if "secscrape" in sys.modules:
+        return sys.modules["secscrape"]
+
+    spec = importlib.util.spec_from_file_location("secscrape", script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["secscrape"] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+# The fixture corpus built by make_fixtures.py, laid out like the www.sec.gov paths it stands in for
+fixture_directory = os.path.join(repo_directory, "Benchmarks", "fixtures")
+
+
+def fixture_urls():
+    # Yields (url, path) for every file in the fixture corpus
+    for root, directories, files in os.walk(fixture_directory):
+        directories.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, fixture_directory).replace(os.sep, "/")
+            yield "https://www.sec.gov/" + relative, path
+
+
+def install_fixtures(scraper, cache_directory):
+    # Loads the fixture corpus into a response cache and serves it through an offline fetcher, nothing is requested
+    # from the SEC
+    cache = scraper.ResponseCache(cache_directory, 10 ** 10)
+    for url, path in fixture_urls():
+        with open(path, "rb") as f:
+            cache.put(url, f.read())
+
+    if scraper.fetcher is not None:
+        scraper.fetcher.close()
+    scraper.fetcher = scraper.EdgarFetcher(cache=cache, offline=True)
+    return cache